@@ -0,0 +1,235 @@
+"""Scale benchmarks for the dashboard data path.
+
+    python benchmark.py                          # 1k/10k/100k/1M lights, printed
+    python benchmark.py --sizes 1000 10000 --output results.json
+    python benchmark.py --output new.json --compare results.json
+    python benchmark.py --generate 50000 --output seed.json
+    python benchmark.py --sizes 100000 --online-ratio 0.6 --timestamp-skew 3600
+
+The last form writes a synthetic fleet that the memory backend can load
+(STREETLIGHT_BACKEND=memory STREETLIGHT_SEED_FILE=seed.json). Streamlit
+calls made when the dashboard module is imported run in bare mode and can
+be ignored.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import streamlit_dashboard as dashboard
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+REPEAT = 3
+# The row-wise builder is only kept as a reference point; skip it on huge fleets
+LEGACY_MAX_SIZE = 100_000
+
+
+def generate_fleet(size, online_ratio=0.9, motion_rate=0.2, dark_ratio=0.5,
+                   manual_ratio=0.1, timestamp_skew=300, offline_age=6 * 3600,
+                   seed=0, now=None):
+    """Build a realistic streetlights tree shaped like the Firebase payload
+
+    Automatic lights are on when it is dark, manual ones follow their
+    manualState. Online devices last reported an exponentially distributed
+    `timestamp_skew` seconds ago on average; offline ones went quiet
+    somewhere between that and `offline_age` seconds ago.
+    """
+    rng = np.random.default_rng(seed)
+    now_ms = int((now or time.time()) * 1000)
+    online = rng.random(size) < online_ratio
+    dark = rng.random(size) < dark_ratio
+    motion = rng.random(size) < motion_rate
+    manual = rng.random(size) < manual_ratio
+    manual_state = rng.random(size) < 0.5
+    on = np.where(manual, manual_state, dark)
+    age = np.where(online, rng.exponential(timestamp_skew, size),
+                   rng.uniform(timestamp_skew, offline_age, size))
+    timestamp = now_ms - (age * 1000).astype(np.int64)
+    last_update = pd.to_datetime(timestamp, unit='ms').strftime('%Y-%m-%dT%H:%M:%S')
+    width = len(str(max(size - 1, 0)))
+    return {
+        f"light_{i:0{width}d}": {
+            'status': 'on' if is_on else 'off',
+            'mode': 'manual' if is_manual else 'automatic',
+            'manualState': state,
+            'isDark': is_dark,
+            'motionDetected': has_motion,
+            'online': is_online,
+            'lastUpdate': update,
+            'timestamp': ts,
+        }
+        for i, (is_on, is_manual, state, is_dark, has_motion, is_online, update, ts) in enumerate(zip(
+            on.tolist(), manual.tolist(), manual_state.tolist(), dark.tolist(), motion.tolist(),
+            online.tolist(), list(last_update), timestamp.tolist()))
+    }
+
+
+def legacy_build(data):
+    """Row-wise list-of-dicts construction used before the columnar builder"""
+    lights = []
+    for light_id, light_data in data.items():
+        lights.append({
+            'ID': light_id,
+            'Status': light_data.get('status', 'off'),
+            'Mode': light_data.get('mode', 'automatic'),
+            'Is Dark': light_data.get('isDark', False),
+            'Motion Detected': light_data.get('motionDetected', False),
+            'Online': light_data.get('online', False),
+            'Last Update': light_data.get('lastUpdate', ''),
+            'Timestamp': light_data.get('timestamp', 0)
+        })
+    df = pd.DataFrame(lights)
+    # The old frame left parsing to the pages; do it here for a fair comparison
+    df['Last Update'] = pd.to_datetime(df['Last Update'], errors='coerce')
+    return df
+
+
+def best_of(func, repeat):
+    """Best wall-clock time of `repeat` calls, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_cases(tree):
+    """(name, callable) pairs covering build, metrics and figures for one fleet"""
+    df = dashboard.build_streetlight_frame(tree)
+    store = dashboard.FleetStore()
+    store.load(tree)
+    probe_id = df['ID'].iloc[len(df) // 2]
+    store_frame = store.frame()
+    counters = dashboard.FleetCounters()
+    counters.reset(store)
+    store.subscribe(counters.observe)
+    meter = dashboard.EnergyMeter()
+    rows = np.arange(store.size)
+    meter.observe(store, dashboard.FleetChange(rows, store.ids[rows], None, None, [], 'load'))
+    store.subscribe(meter.observe)
+
+    def store_update_and_frame():
+        # One in-place change followed by the view every session renders from
+        store.patch(probe_id, {'status': 'on'})
+        store.frame()
+
+    cases = [
+        ('frame_build', lambda: dashboard.build_streetlight_frame(tree)),
+        ('store_load', lambda: dashboard.FleetStore().load(tree)),
+        ('store_update_frame', store_update_and_frame),
+        ('overview_metrics', lambda: dashboard.compute_overview_metrics(df)),
+        ('analytics_metrics', lambda: dashboard.compute_analytics_metrics(df)),
+        ('fleet_counts_cold', lambda: dashboard.count_fleet(df)),
+        ('fleet_counters_read', lambda: dashboard.compute_analytics_metrics(df, counters.snapshot())),
+        ('cube_cross_filter', lambda: dashboard.cross_filter_counts(
+            counters.cube_snapshot(), {dashboard.FLAG_ONLINE: True, dashboard.FLAG_MANUAL: True,
+                                       dashboard.FLAG_ON: True, dashboard.FLAG_DARK: False})),
+        ('energy_month_report', lambda: meter.report('month')),
+        ('control_lookup', lambda: dashboard.lookup_light(store_frame, probe_id, store)),
+        ('light_search', lambda: store.light_index().search(probe_id[:-2])),
+        ('status_pie', lambda: dashboard.build_distribution_pie(df['Status'].value_counts(),
+                                                                dashboard.STATUS_COLORS)),
+        ('mode_pie', lambda: dashboard.build_distribution_pie(df['Mode'].value_counts(),
+                                                              dashboard.MODE_COLORS)),
+        ('status_timeline', lambda: dashboard.build_status_timeline(df)),
+        ('condition_bars', lambda: dashboard.build_pair_bars('Light Level', ('Dark', 1, 'indigo'),
+                                                             ('Bright', 1, 'orange'))),
+    ]
+    if len(tree) <= LEGACY_MAX_SIZE:
+        cases.insert(1, ('frame_build_legacy', lambda: legacy_build(tree)))
+    return cases
+
+
+def run_suite(sizes=SIZES, repeat=REPEAT, fleet_options=None):
+    """Time every case at every fleet size; returns a list of result dicts
+
+    `fleet_options` are passed to generate_fleet.
+    """
+    results = []
+    for size in sizes:
+        tree = generate_fleet(size, **(fleet_options or {}))
+        for name, func in benchmark_cases(tree):
+            seconds = best_of(func, repeat if size < 1_000_000 else 1)
+            results.append({'size': size, 'benchmark': name, 'seconds': seconds})
+            print(f"{size:>9} {name:<20} {seconds * 1000:>10.2f}ms", flush=True)
+        del tree
+    return results
+
+
+def environment():
+    """Versions recorded alongside results so runs can be compared"""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plotly': plotly.__version__,
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results, baseline_path):
+    """Print each result's ratio against a previously saved run"""
+    with open(baseline_path) as f:
+        baseline = {(r['size'], r['benchmark']): r['seconds'] for r in json.load(f)['results']}
+    print(f"\n{'lights':>9} {'benchmark':<20} {'before':>10} {'after':>10} {'ratio':>7}")
+    for result in results:
+        before = baseline.get((result['size'], result['benchmark']))
+        if before is None:
+            continue
+        print(f"{result['size']:>9} {result['benchmark']:<20} {before * 1000:>8.2f}ms "
+              f"{result['seconds'] * 1000:>8.2f}ms {result['seconds'] / before:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--output', help="write results (or the generated fleet) as JSON")
+    parser.add_argument('--compare', help="JSON results from an earlier run to compare against")
+    parser.add_argument('--generate', type=int, metavar='SIZE',
+                        help="write a synthetic fleet of SIZE lights instead of benchmarking")
+    fleet = parser.add_argument_group("synthetic fleet")
+    fleet.add_argument('--online-ratio', type=float, default=0.9, help="share of lights online")
+    fleet.add_argument('--motion-rate', type=float, default=0.2, help="share of lights detecting motion")
+    fleet.add_argument('--dark-ratio', type=float, default=0.5, help="share of lights where it is dark")
+    fleet.add_argument('--manual-ratio', type=float, default=0.1, help="share of lights in manual mode")
+    fleet.add_argument('--timestamp-skew', type=float, default=300,
+                       help="mean seconds since an online light last reported")
+    fleet.add_argument('--offline-age', type=float, default=6 * 3600,
+                       help="longest seconds since an offline light last reported")
+    fleet.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    fleet_options = {'online_ratio': args.online_ratio, 'motion_rate': args.motion_rate,
+                     'dark_ratio': args.dark_ratio, 'manual_ratio': args.manual_ratio,
+                     'timestamp_skew': args.timestamp_skew, 'offline_age': args.offline_age,
+                     'seed': args.seed}
+
+    if args.generate is not None:
+        tree = {'streetlights': generate_fleet(args.generate, **fleet_options)}
+        with open(args.output or 'seed.json', 'w') as f:
+            json.dump(tree, f)
+        return
+
+    results = run_suite(args.sizes, args.repeat, fleet_options)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'fleet': fleet_options, 'results': results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,37 @@
 import streamlit as st
 import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import credentials, db, exceptions as firebase_exceptions
 import pandas as pd
-from datetime import datetime
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as clock_time, timedelta, timezone
+import fnmatch
+import heapq
+import json
+import logging
+import math
+import os
+import queue
+import random
+import sqlite3
+import threading
 import time
+import uuid
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
 
+# Optional: fleet history is stored as Parquet and is disabled without pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
 # Page configuration
 st.set_page_config(
     page_title="Smart Streetlight Dashboard",
@@ -43,6 +67,96 @@ st.markdown("""
 # 🔹 BASE DIRECTORY (ESSENTIAL)
 BASE_DIR = Path(__file__).resolve().parent
 
+# Data backend: "firebase", "memory" (in-process, optionally seeded from a
+# JSON export) or "sqlite" (local emulator file)
+DATA_BACKEND = os.environ.get("STREETLIGHT_BACKEND", "firebase")
+DATABASE_URL = os.environ.get("STREETLIGHT_DATABASE_URL", "https://streetmonitoring-default-rtdb.firebaseio.com/")
+MEMORY_SEED_FILE = os.environ.get("STREETLIGHT_SEED_FILE")
+SQLITE_PATH = os.environ.get("STREETLIGHT_SQLITE_PATH", str(BASE_DIR / "streetlights.db"))
+
+# Seconds to wait for the listener's initial snapshot before rendering
+LISTENER_STARTUP_TIMEOUT = 10
+
+# How the fleet is synced: "listen" (realtime stream), "poll" (one get per
+# refresh) or "chunked" (paged get, sharded across FETCH_WORKERS threads)
+FLEET_SYNC_MODE = os.environ.get("STREETLIGHT_SYNC_MODE", "listen")
+FETCH_PAGE_SIZE = 5000
+FETCH_WORKERS = 4
+
+# Upper bound on the JSON size of one multi-path write in bulk operations
+MAX_BULK_PAYLOAD_BYTES = 256 * 1024
+
+# Write executor: concurrent writes in flight, and retries with exponential
+# backoff (seconds, full jitter) on transient errors
+WRITE_CONCURRENCY = int(os.environ.get("STREETLIGHT_WRITE_CONCURRENCY", "8"))
+WRITE_RETRIES = 4
+WRITE_BACKOFF_BASE = 0.2
+WRITE_BACKOFF_MAX = 5.0
+THROUGHPUT_WINDOW = 60
+
+# Commands that fail on a transient error are kept in this SQLite journal
+# and replayed, compacted, every JOURNAL_REPLAY_INTERVAL seconds
+JOURNAL_PATH = os.environ.get("STREETLIGHT_JOURNAL_PATH", str(BASE_DIR / "command_journal.db"))
+JOURNAL_REPLAY_INTERVAL = 5
+JOURNAL_REPLAY_BATCH = 5000
+
+# Commands for the same light within this many seconds collapse into one write
+COMMAND_COALESCE_WINDOW = 0.25
+RECENT_COMMANDS_SHOWN = 5
+# Page refresh interval (seconds) while one of the session's commands is queued
+COMMAND_POLL_INTERVAL = 0.5
+# Seconds a command may wait for the device to report the new state
+COMMAND_ACK_TIMEOUT = 60
+# Lights kept in the "never acknowledged" list (most recent commands)
+UNACKNOWLEDGED_KEPT = 1000
+# Latency histogram: log-spaced bucket edges in seconds
+LATENCY_BUCKETS = np.geomspace(0.05, 600, 61)
+
+# Site location for sunrise/sunset schedules (decimal degrees, east positive)
+SITE_LATITUDE = os.environ.get("STREETLIGHT_LATITUDE")
+SITE_LONGITUDE = os.environ.get("STREETLIGHT_LONGITUDE")
+RECENT_FIRINGS_SHOWN = 20
+
+# Seconds between collector fetches in the polling modes, and how old a
+# snapshot may get before a reader triggers a refresh itself
+COLLECT_INTERVAL = 5
+SNAPSHOT_TTL = 15
+
+# Local history (rollups, events, energy) lives under HISTORY_DIR; the
+# event log is flushed every HISTORY_FLUSH_INTERVAL seconds
+HISTORY_DIR = os.environ.get("STREETLIGHT_HISTORY_DIR", str(BASE_DIR / "history"))
+HISTORY_FLUSH_INTERVAL = 30
+HISTORY_RANGES = {"Last hour": 3600, "Last 6 hours": 6 * 3600, "Last 24 hours": 86400,
+                  "Last 7 days": 7 * 86400, "Last 30 days": 30 * 86400,
+                  "Last 90 days": 90 * 86400, "Last year": 365 * 86400}
+
+# Rollup resolutions (name, seconds), finest first, and the longest range
+# each one is charted for; per-light rollups are kept from ROLLUP_LIGHT_MIN up
+ROLLUP_RESOLUTIONS = (('1min', 60), ('15min', 900), ('1h', 3600), ('1d', 86400))
+ROLLUP_MAX_RANGE = {'1min': 6 * 3600, '15min': 4 * 86400, '1h': 45 * 86400, '1d': None}
+ROLLUP_LIGHT_MIN = 3600
+
+# In-memory per-light transition history: RECENT_HISTORY_DEPTH entries per
+# light, as many lights as fit in STREETLIGHT_RECENT_MEMORY_MB
+RECENT_HISTORY_DEPTH = 64
+RECENT_HISTORY_MEMORY_MB = int(os.environ.get("STREETLIGHT_RECENT_MEMORY_MB", "64"))
+RECENT_HISTORY_WINDOW = 4 * 3600
+
+# Transition events kept in memory (oldest dropped past EVENT_LOG_MAX), saved
+# under HISTORY_DIR/events and reloaded for the last EVENT_LOG_LOAD_DAYS
+EVENT_LOG_MAX = 20_000_000
+EVENT_LOG_LOAD_DAYS = 7
+EVENTS_SHOWN = 1000
+
+# Energy accounting: wattage for lights without their own entry under
+# `wattage` in the database, fleet-wide daily rows kept, lights ranked
+LIGHT_WATTAGE = float(os.environ.get("STREETLIGHT_WATTAGE", 100))
+ENERGY_DAYS_KEPT = 400
+ENERGY_TOP_LIGHTS = 20
+
+# Matches rendered by the streetlight search selector
+LIGHT_SEARCH_LIMIT = 50
+
 # Initialize Firebase
 @st.cache_resource
 def init_firebase():
@@ -53,7 +167,7 @@ def init_firebase():
                 str(BASE_DIR / "firebase-credentials.json")  # ✅ FIX # type: ignore
             )
             firebase_admin.initialize_app(cred, {
-                'databaseURL': 'https://streetmonitoring-default-rtdb.firebaseio.com/'
+                'databaseURL': DATABASE_URL
             })
         return True
     except Exception as e:
@@ -61,6 +175,430 @@ def init_firebase():
         return False
 
 
+# Data backends
+BackendEvent = namedtuple('BackendEvent', 'event_type path data')
+
+def split_path(path):
+    """Split a database path into its non-empty segments"""
+    return [part for part in str(path).split('/') if part]
+
+def parent_keys(parts):
+    """(parent path, child key) for every node on the way down to `parts`"""
+    return [('/'.join(parts[:i]), parts[i]) for i in range(len(parts))]
+
+def firebase_key_order(key):
+    """Sort key matching Firebase orderByKey (32-bit integer keys first)"""
+    try:
+        number = int(key)
+        if -2**31 <= number < 2**31 and str(number) == key:
+            return (0, number, '')
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+def copy_tree(value):
+    """Copy nested dicts so callers can't mutate backend state"""
+    if isinstance(value, dict):
+        return {key: copy_tree(child) for key, child in value.items()}
+    return value
+
+def tree_get(tree, parts):
+    """Value at `parts` inside a nested dict, or None"""
+    node = tree
+    for part in parts:
+        if not isinstance(node, dict):
+            return None
+        node = node.get(part)
+    return node
+
+def tree_set(tree, parts, value):
+    """Set the value at `parts`, deleting (and pruning empty parents) on None"""
+    if not parts:
+        raise ValueError("Cannot replace the database root")
+    node = tree
+    trail = []
+    for part in parts[:-1]:
+        child = node.get(part)
+        if not isinstance(child, dict):
+            if value is None:
+                return
+            child = node[part] = {}
+        trail.append((node, part))
+        node = child
+    if value is None or value == {}:
+        node.pop(parts[-1], None)
+        for parent, part in reversed(trail):
+            if parent[part]:
+                break
+            del parent[part]
+    else:
+        node[parts[-1]] = copy_tree(value)
+
+def select_children(children, start_at=None, end_at=None, limit=None):
+    """Order children by key and apply start/end/limit like an orderByKey query"""
+    if not isinstance(children, dict):
+        return OrderedDict()
+    keys = sorted(children, key=firebase_key_order)
+    if start_at is not None:
+        keys = [k for k in keys if firebase_key_order(k) >= firebase_key_order(start_at)]
+    if end_at is not None:
+        keys = [k for k in keys if firebase_key_order(k) <= firebase_key_order(end_at)]
+    if limit is not None:
+        keys = keys[:limit]
+    return OrderedDict((key, children[key]) for key in keys)
+
+def events_for_listener(listen_parts, update_parts, values):
+    """Events a listener at `listen_parts` sees for update(update_parts, values)"""
+    depth = len(listen_parts)
+    if update_parts[:depth] == listen_parts:
+        # Update at or below the listener: one patch, exactly like Firebase
+        return [BackendEvent('patch', '/' + '/'.join(update_parts[depth:]), values)]
+    events = []
+    for key, value in values.items():
+        target = update_parts + split_path(key)
+        if target[:depth] == listen_parts:
+            events.append(BackendEvent('put', '/' + '/'.join(target[depth:]), value))
+        elif listen_parts[:len(target)] == target:
+            # A whole subtree containing the listener was replaced
+            events.append(BackendEvent('put', '/', tree_get(value, listen_parts[len(target):])))
+    return events
+
+
+class StreetlightBackend(ABC):
+    """Realtime database the dashboard reads from and writes to
+
+    Paths are slash-separated and relative to the database root. `update`
+    is a multi-path update: keys may themselves contain slashes and a None
+    value deletes. `listen` calls `callback` with objects carrying
+    `event_type` ('put'/'patch'), `path` and `data`, starting with a put of
+    the current value, and returns a handle with `close()`.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def get(self, path, shallow=False):
+        """Value at `path` (child keys only if `shallow`), or None"""
+
+    @abstractmethod
+    def update(self, path, values):
+        """Multi-path update relative to `path`"""
+
+    @abstractmethod
+    def listen(self, path, callback):
+        """Start delivering events for `path` to `callback`"""
+
+    @abstractmethod
+    def query(self, path, start_at=None, end_at=None, limit=None):
+        """Children of `path` ordered by key, optionally bounded and limited"""
+
+
+class FirebaseBackend(StreetlightBackend):
+    """The Firebase Realtime Database via firebase_admin"""
+
+    name = "firebase"
+
+    def get(self, path, shallow=False):
+        return db.reference(path).get(shallow=shallow)
+
+    def update(self, path, values):
+        db.reference(path).update(values)
+
+    def listen(self, path, callback):
+        return db.reference(path).listen(callback)
+
+    def query(self, path, start_at=None, end_at=None, limit=None):
+        query = db.reference(path).order_by_key()
+        if start_at is not None:
+            query = query.start_at(start_at)
+        if end_at is not None:
+            query = query.end_at(end_at)
+        if limit is not None:
+            query = query.limit_to_first(limit)
+        return query.get() or OrderedDict()
+
+
+class ListenerRegistration:
+    """Delivers backend events to one callback on its own thread"""
+
+    def __init__(self, backend, parts, callback):
+        self.backend = backend
+        self.parts = parts
+        self._callback = callback
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="backend-listener")
+        self._thread.start()
+
+    def push(self, event):
+        self._queue.put(event)
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            try:
+                self._callback(event)
+            except Exception:
+                logger.exception("Error in backend listener")
+
+    def close(self):
+        self.backend._listeners.discard(self)
+        self._queue.put(None)
+
+
+class MemoryBackend(StreetlightBackend):
+    """In-process database tree, for load tests and running without Firebase"""
+
+    name = "memory"
+
+    def __init__(self, tree=None):
+        self._lock = threading.RLock()
+        self._tree = copy_tree(tree) if isinstance(tree, dict) else {}
+        self._listeners = set()
+
+    def get(self, path, shallow=False):
+        with self._lock:
+            value = tree_get(self._tree, split_path(path))
+            if shallow and isinstance(value, dict):
+                return {key: True for key in value}
+            return copy_tree(value)
+
+    def update(self, path, values):
+        parts = split_path(path)
+        with self._lock:
+            for key, value in values.items():
+                tree_set(self._tree, parts + split_path(key), value)
+            for registration in list(self._listeners):
+                for event in events_for_listener(registration.parts, parts, values):
+                    registration.push(event)
+
+    def listen(self, path, callback):
+        parts = split_path(path)
+        with self._lock:
+            registration = ListenerRegistration(self, parts, callback)
+            registration.push(BackendEvent('put', '/', copy_tree(tree_get(self._tree, parts))))
+            self._listeners.add(registration)
+        return registration
+
+    def query(self, path, start_at=None, end_at=None, limit=None):
+        with self._lock:
+            children = tree_get(self._tree, split_path(path))
+            return copy_tree(select_children(children, start_at, end_at, limit))
+
+
+class SQLiteBackend(StreetlightBackend):
+    """Local Firebase emulator persisted in a SQLite file
+
+    Leaves are stored one row per path, so partial reads and writes touch
+    only the rows involved. Every node's child keys are also kept in their
+    own table, so key-range queries pick their children from an index
+    before reading any leaves. Every update is also appended to a change
+    log that listeners poll, so other processes writing to the same file
+    (for example a device simulator) are seen as well.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS changes "
+                           "(seq INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, data TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS children "
+                           "(parent TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (parent, key)) WITHOUT ROWID")
+        self._listeners = set()
+        with self._lock:
+            if self._conn.execute("SELECT NOT EXISTS (SELECT 1 FROM children) "
+                                  "AND EXISTS (SELECT 1 FROM nodes)").fetchone()[0]:
+                # File written before the key table existed
+                paths = (split_path(row[0]) for row in self._conn.execute("SELECT path FROM nodes"))
+                self._conn.executemany("INSERT OR IGNORE INTO children (parent, key) VALUES (?, ?)",
+                                       {pair for parts in paths for pair in parent_keys(parts)})
+
+    def _rows(self, parts):
+        prefix = '/'.join(parts)
+        if not prefix:
+            return self._conn.execute("SELECT path, value FROM nodes").fetchall()
+        # '0' sorts right after '/', so this is an index range over the subtree
+        return self._conn.execute(
+            "SELECT path, value FROM nodes WHERE path = ? OR (path >= ? AND path < ?)",
+            (prefix, prefix + '/', prefix + '0')).fetchall()
+
+    def _read(self, parts):
+        tree = {}
+        with self._lock:
+            rows = self._rows(parts)
+        for row_path, value in rows:
+            leaf = split_path(row_path)[len(parts):]
+            if not leaf:
+                return json.loads(value)
+            node = tree
+            for part in leaf[:-1]:
+                node = node.setdefault(part, {})
+            node[leaf[-1]] = json.loads(value)
+        return tree or None
+
+    def _child_keys(self, parts, start_at=None, end_at=None, limit=None):
+        """Child keys of a node in orderByKey order, range and limit applied in SQL
+
+        String keys compare in SQL exactly as in Python (UTF-8 byte order
+        is code point order). Integer keys sort first and numerically, so
+        the rare keys starting with a digit or '-' are ordered here.
+        """
+        parent = '/'.join(parts)
+        start_order = None if start_at is None else firebase_key_order(start_at)
+        end_order = None if end_at is None else firebase_key_order(end_at)
+        with self._lock:
+            numeric = [row[0] for row in self._conn.execute(
+                "SELECT key FROM children WHERE parent = ? AND "
+                "((key >= '0' AND key < ':') OR (key >= '-' AND key < '.'))", (parent,))]
+            integers = sorted((key for key in numeric if firebase_key_order(key)[0] == 0),
+                              key=firebase_key_order)
+            strings = []
+            # An integer end_at excludes every string key
+            if end_order is None or end_order[0] == 1:
+                sql, args = "SELECT key FROM children WHERE parent = ?", [parent]
+                if start_order is not None and start_order[0] == 1:
+                    sql += " AND key >= ?"
+                    args.append(start_at)
+                if end_order is not None:
+                    sql += " AND key <= ?"
+                    args.append(end_at)
+                sql += " ORDER BY key"
+                if limit is not None:
+                    # Integer keys are strings to SQL too; fetch past them
+                    sql += " LIMIT ?"
+                    args.append(limit + len(integers))
+                strings = [row[0] for row in self._conn.execute(sql, args)]
+        keys = [key for key in integers
+                if (start_order is None or firebase_key_order(key) >= start_order)
+                and (end_order is None or firebase_key_order(key) <= end_order)]
+        integer_keys = set(integers)
+        keys.extend(key for key in strings if key not in integer_keys)
+        return keys if limit is None else keys[:limit]
+
+    def _read_children(self, parts, keys):
+        """{key: subtree} for some child keys, read with one range over their rows"""
+        if not keys:
+            return OrderedDict()
+        prefix = '/'.join(parts) + '/' if parts else ''
+        wanted = set(keys)
+        # Every row of key k lies in [prefix + k, prefix + k + '0')
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, value FROM nodes WHERE path >= ? AND path < ?",
+                (prefix + min(keys), max(prefix + key + '0' for key in keys))).fetchall()
+        children = {}
+        for row_path, value in rows:
+            leaf = split_path(row_path)[len(parts):]
+            if leaf[0] not in wanted:
+                continue
+            if len(leaf) == 1:
+                children[leaf[0]] = json.loads(value)
+                continue
+            node = children.setdefault(leaf[0], {})
+            for part in leaf[1:-1]:
+                node = node.setdefault(part, {})
+            node[leaf[-1]] = json.loads(value)
+        return OrderedDict((key, children[key]) for key in keys if key in children)
+
+    def get(self, path, shallow=False):
+        parts = split_path(path)
+        if shallow:
+            keys = self._child_keys(parts)
+            return {key: True for key in keys} if keys else self._read(parts)
+        return self._read(parts)
+
+    def _write(self, parts, value):
+        prefix = '/'.join(parts)
+        self._conn.execute("DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)",
+                           (prefix, prefix + '/', prefix + '0'))
+        self._conn.execute("DELETE FROM children WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                           (prefix, prefix + '/', prefix + '0'))
+        # A new leaf replaces any leaf stored at one of its ancestors
+        for i in range(1, len(parts)):
+            self._conn.execute("DELETE FROM nodes WHERE path = ?", ('/'.join(parts[:i]),))
+        leaves = []
+        stack = [(parts, value)]
+        while stack:
+            node_parts, node = stack.pop()
+            if isinstance(node, dict):
+                stack.extend((node_parts + [key], child) for key, child in node.items())
+            elif node is not None:
+                leaves.append(('/'.join(node_parts), json.dumps(node)))
+        self._conn.executemany("INSERT INTO nodes (path, value) VALUES (?, ?)", leaves)
+        if leaves:
+            self._conn.executemany("INSERT OR IGNORE INTO children (parent, key) VALUES (?, ?)",
+                                   {pair for path, _ in leaves for pair in parent_keys(split_path(path))})
+            return
+        # Nothing left here: unlist the node, and any ancestor it leaves empty
+        for i in range(len(parts), 0, -1):
+            parent = '/'.join(parts[:i - 1])
+            self._conn.execute("DELETE FROM children WHERE parent = ? AND key = ?", (parent, parts[i - 1]))
+            if i == 1 or self._conn.execute("SELECT EXISTS (SELECT 1 FROM children WHERE parent = ?)",
+                                            (parent,)).fetchone()[0]:
+                break
+
+    def update(self, path, values):
+        parts = split_path(path)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, value in values.items():
+                    self._write(parts + split_path(key), value)
+                self._conn.execute("INSERT INTO changes (path, data) VALUES (?, ?)",
+                                   ('/'.join(parts), json.dumps(values)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def listen(self, path, callback):
+        parts = split_path(path)
+        with self._lock:
+            seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            registration = ListenerRegistration(self, parts, callback)
+            registration.push(BackendEvent('put', '/', self._read(parts)))
+            self._listeners.add(registration)
+        threading.Thread(target=self._poll_changes, args=(registration, seq),
+                         daemon=True, name="sqlite-listener").start()
+        return registration
+
+    def _poll_changes(self, registration, seq):
+        while registration in self._listeners:
+            with self._lock:
+                rows = self._conn.execute("SELECT seq, path, data FROM changes WHERE seq > ? ORDER BY seq",
+                                          (seq,)).fetchall()
+            for seq, change_path, data in rows:
+                for event in events_for_listener(registration.parts, split_path(change_path), json.loads(data)):
+                    registration.push(event)
+            time.sleep(self.poll_interval)
+
+    def query(self, path, start_at=None, end_at=None, limit=None):
+        parts = split_path(path)
+        return self._read_children(parts, self._child_keys(parts, start_at, end_at, limit))
+
+
+@st.cache_resource
+def get_backend():
+    """The process-wide data backend selected by DATA_BACKEND"""
+    if DATA_BACKEND == "memory":
+        tree = None
+        if MEMORY_SEED_FILE:
+            with open(MEMORY_SEED_FILE) as f:
+                tree = json.load(f)
+        return MemoryBackend(tree)
+    if DATA_BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+    if not init_firebase():
+        return None
+    return FirebaseBackend()
+
+
 # Authentication
 def check_password():
     """Returns `True` if the user had the correct password."""
@@ -101,58 +639,2677 @@ def check_password():
         # Password correct
         return True
 
-# Fetch streetlight data
-@st.cache_data(ttl=5)
-def get_streetlight_data():
-    """Fetch streetlight data from Firebase"""
+# Build a DataFrame from the raw streetlights tree
+STATUS_VALUES = ['off', 'on']
+MODE_VALUES = ['automatic', 'manual']
+STATUS_COLORS = {'on': '#00CC96', 'off': '#EF553B'}
+MODE_COLORS = {'automatic': '#636EFA', 'manual': '#AB63FA'}
+
+def to_categorical(values, known):
+    """Categorical with the known values first, plus anything unexpected"""
+    extra = sorted(set(values).difference(known), key=str)
+    return pd.Categorical(values, categories=known + extra)
+
+def to_nullable_bool(values):
+    """Nullable boolean array, falling back to truthiness for odd payloads"""
+    if None not in values:
+        # Fast path: no nulls, so build the values buffer directly
+        try:
+            data = np.array(values, dtype=bool)
+            return pd.arrays.BooleanArray(data, np.zeros(len(data), dtype=bool))
+        except (TypeError, ValueError):
+            pass
+    return pd.array([None if v is None else bool(v) for v in values], dtype="boolean")
+
+def to_int64(values):
+    """int64 array, coercing missing or malformed entries to 0"""
+    try:
+        return np.array(values, dtype=np.int64)
+    except (TypeError, ValueError, OverflowError):
+        return pd.to_numeric(pd.Series(values), errors='coerce').fillna(0).astype(np.int64).to_numpy()
+
+def to_datetime(values):
+    """Parse ISO timestamps, leaving unparseable values as NaT"""
+    try:
+        return pd.to_datetime(values, errors='coerce', format='ISO8601')
+    except (TypeError, ValueError):
+        # Mixed UTC offsets can't share one naive dtype
+        return pd.to_datetime(values, errors='coerce', format='ISO8601', utc=True)
+
+def extract_streetlight_columns(data):
+    """Collect each light's fields into per-column lists in one pass"""
+    ids, status, mode, dark, motion, online, last_update, timestamp = ([] for _ in range(8))
+    for light_id, light_data in (data or {}).items():
+        if not isinstance(light_data, dict):
+            continue
+        get = light_data.get
+        ids.append(light_id)
+        status.append(get('status', 'off'))
+        mode.append(get('mode', 'automatic'))
+        dark.append(get('isDark', False))
+        motion.append(get('motionDetected', False))
+        online.append(get('online', False))
+        last_update.append(get('lastUpdate', ''))
+        timestamp.append(get('timestamp', 0))
+    return ids, status, mode, dark, motion, online, last_update, timestamp
+
+def build_streetlight_frame(data):
+    """Convert the raw Firebase streetlights dict into typed columns in one pass"""
+    ids, status, mode, dark, motion, online, last_update, timestamp = extract_streetlight_columns(data)
+    if not ids:
+        return pd.DataFrame()
+    return pd.DataFrame({
+        'ID': ids,
+        'Status': to_categorical(status, STATUS_VALUES),
+        'Mode': to_categorical(mode, MODE_VALUES),
+        'Is Dark': to_nullable_bool(dark),
+        'Motion Detected': to_nullable_bool(motion),
+        'Online': to_nullable_bool(online),
+        'Last Update': to_datetime(last_update),
+        'Timestamp': to_int64(timestamp)
+    })
+
+def concat_streetlight_frames(frames):
+    """Concatenate per-page frames, keeping Status/Mode categorical"""
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    for column in ('Status', 'Mode'):
+        if df[column].dtype != 'category':
+            df[column] = df[column].astype('category')
+    return df
+
+
+# Compact array-backed fleet store
+FLAG_DARK = 1
+FLAG_MOTION = 2
+FLAG_ONLINE = 4
+# Mirrors of status == 'on' and mode == 'manual', so one byte holds all five booleans
+FLAG_ON = 8
+FLAG_MANUAL = 16
+STATE_CELLS = 32
+FIELD_FLAGS = {'isDark': FLAG_DARK, 'motionDetected': FLAG_MOTION, 'online': FLAG_ONLINE}
+NO_UPDATE_TIME = np.datetime64('NaT', 'ns')
+
+# Per-light state handed to change subscribers
+STATE_DTYPE = np.dtype([('status', np.uint8), ('mode', np.uint8), ('flags', np.uint8),
+                        ('timestamp', np.int64)])
+# rows/ids: changed lights (current row indices); before: their previous
+# STATE_DTYPE values, valid where `known`; removed: (id, state) of deleted
+# lights; origin: 'load', 'event' or 'optimistic'
+def read_only(array):
+    """Non-writable view of an array, so a shared frame can't write through to the store"""
+    view = array.view()
+    view.setflags(write=False)
+    return view
+
+FleetChange = namedtuple('FleetChange', 'rows ids before known removed origin')
+
+def parse_update_time(value):
+    """Parse one lastUpdate string to a naive datetime64, or NaT"""
+    if not value:
+        return NO_UPDATE_TIME
+    try:
+        parsed = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return NO_UPDATE_TIME
+    if parsed is pd.NaT:
+        return NO_UPDATE_TIME
+    if parsed.tzinfo is not None:
+        parsed = parsed.tz_convert(None)
+    return parsed.to_datetime64().astype('datetime64[ns]')
+
+class FleetStore:
+    """Fleet state held in dense NumPy arrays, one row per light
+
+    Light IDs map to row indices through `index`. Status and mode are uint8
+    codes into `status_values`/`mode_values`; the three sensor booleans plus
+    "is on" and "is manual" are packed into one `flags` byte (FLAG_* bits,
+    32 possible states) and timestamps are int64.
+    Updates are applied in place; `frame()` hands out a read-only DataFrame
+    over the arrays that stays valid until the next change.
+
+    Subscribers registered with `subscribe()` get a FleetChange after every
+    mutation, while the store lock is held, so they must be quick. Status
+    and mode codes are stable for the life of the store.
+
+    Writes made by this dashboard can be applied optimistically before the
+    database echoes them back; they are kept as an overlay until a listener
+    event for the light, or a full load fetched after the write, confirms
+    or replaces them.
+    """
+
+    COLUMNS = ('ids', 'status', 'mode', 'flags', 'timestamp', 'last_update')
+    polled = False
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.RLock()
+        self.index = {}
+        self.status_values = list(STATUS_VALUES)
+        self.mode_values = list(MODE_VALUES)
+        self.size = 0
+        self.version = 0
+        self.updated_at = None
+        self.ready = threading.Event()
+        self._frame = pd.DataFrame()
+        self._frame_version = 0
+        # Bumped whenever lights are added or removed; keys the LightIndex
+        self.ids_version = 0
+        self._light_index = None
+        self._light_index_version = -1
+        self._shared = False
+        self._optimistic = {}
+        self._subscribers = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.ids = np.empty(capacity, dtype=object)
+        self.status = np.zeros(capacity, dtype=np.uint8)
+        self.mode = np.zeros(capacity, dtype=np.uint8)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+        self.timestamp = np.zeros(capacity, dtype=np.int64)
+        self.last_update = np.full(capacity, NO_UPDATE_TIME)
+
+    def _writable(self, extra=0):
+        """Make room for `extra` rows, copying arrays a frame still points at"""
+        needed = self.size + extra
+        capacity = len(self.status)
+        if self._shared or needed > capacity:
+            while needed > capacity:
+                capacity *= 2
+            for name in self.COLUMNS:
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+            self._shared = False
+
+    def _code(self, values, value):
+        """Code for a status/mode string, registering unseen values"""
+        try:
+            return values.index(value)
+        except ValueError:
+            if len(values) >= 255:
+                raise ValueError(f"Too many distinct values: {value!r}")
+            values.append(value)
+            return len(values) - 1
+
+    def subscribe(self, callback):
+        """Call `callback(store, change)` after every mutation"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def state(self, rows):
+        """STATE_DTYPE values of the given rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        state = np.empty(len(rows), dtype=STATE_DTYPE)
+        for name in STATE_DTYPE.names:
+            state[name] = getattr(self, name)[rows]
+        return state
+
+    def _changed(self, change=None):
+        self.version += 1
+        self.updated_at = time.time()
+        if change is None or not self._subscribers:
+            return
+        for callback in self._subscribers:
+            try:
+                callback(self, change)
+            except Exception:
+                logger.exception("Error in fleet subscriber %r", callback)
+
+    def _row_change(self, rows, before, known, origin, removed=()):
+        rows = np.asarray(rows, dtype=np.int64)
+        return FleetChange(rows, self.ids[rows], before, np.asarray(known, dtype=bool),
+                           list(removed), origin)
+
+    def load(self, data, as_of=None):
+        """Replace the whole fleet from a raw streetlights dict
+
+        `as_of` is when the data was requested; optimistic writes made after
+        that are re-applied on top. Without it the data is taken as current.
+        """
+        ids, status, mode, dark, motion, online, last_update, timestamp = extract_streetlight_columns(data)
+        self._replace(ids, to_categorical(status, STATUS_VALUES), to_categorical(mode, MODE_VALUES),
+                      to_nullable_bool(dark), to_nullable_bool(motion), to_nullable_bool(online),
+                      to_datetime(last_update), to_int64(timestamp), as_of)
+
+    def load_frame(self, df, as_of=None):
+        """Replace the whole fleet from a frame built by build_streetlight_frame"""
+        if df.empty:
+            self._replace([], to_categorical([], STATUS_VALUES), to_categorical([], MODE_VALUES),
+                          *([to_nullable_bool([])] * 3), to_datetime([]), to_int64([]), as_of)
+            return
+        self._replace(df['ID'].tolist(), df['Status'].astype('category').array,
+                      df['Mode'].astype('category').array, df['Is Dark'].array,
+                      df['Motion Detected'].array, df['Online'].array,
+                      pd.DatetimeIndex(df['Last Update']), df['Timestamp'].to_numpy(dtype=np.int64),
+                      as_of)
+
+    def _replace(self, ids, status, mode, dark, motion, online, last_update, timestamp, as_of=None):
+        def bits(values, bit):
+            return np.asarray(pd.array(values, dtype="boolean").fillna(False), dtype=np.uint8) * bit
+
+        flags = bits(dark, FLAG_DARK) | bits(motion, FLAG_MOTION) | bits(online, FLAG_ONLINE)
+        if last_update.tz is not None:
+            last_update = last_update.tz_convert(None)
+        size = len(ids)
+        with self._lock:
+            # Keep codes stable: map this load's categories onto known values
+            status_codes = np.array([self._code(self.status_values, v) for v in status.categories] + [0],
+                                    dtype=np.uint8)[np.asarray(status.codes)]
+            mode_codes = np.array([self._code(self.mode_values, v) for v in mode.categories] + [0],
+                                  dtype=np.uint8)[np.asarray(mode.codes)]
+            flags |= ((status_codes == value_code(self.status_values, 'on')) * np.uint8(FLAG_ON)
+                      | (mode_codes == value_code(self.mode_values, 'manual')) * np.uint8(FLAG_MANUAL))
+            old_index, old_state = self.index, self.state(np.arange(self.size))
+            self._allocate(max(1024, size))
+            self.ids[:size] = ids
+            self.status[:size] = status_codes
+            self.mode[:size] = mode_codes
+            self.flags[:size] = flags
+            self.timestamp[:size] = timestamp
+            self.last_update[:size] = last_update.to_numpy(dtype='datetime64[ns]')
+            self.index = {light_id: i for i, light_id in enumerate(ids)}
+            self.size = size
+            self.ids_version += 1
+            self._shared = False
+            # Writes newer than the fetch aren't in it yet; keep showing them
+            self._optimistic = {light_id: (fields, applied_at)
+                                for light_id, (fields, applied_at) in self._optimistic.items()
+                                if as_of is not None and applied_at > as_of and light_id in self.index}
+            for light_id, (fields, _) in self._optimistic.items():
+                self._set_fields(self.index[light_id], fields)
+            self._changed(self._load_change(old_index, old_state) if self._subscribers else None)
+
+    def _load_change(self, old_index, old_state):
+        """FleetChange for a full reload: lights that are new, changed or gone"""
+        old_rows = np.fromiter((old_index.get(light_id, -1) for light_id in self.ids[:self.size]),
+                               dtype=np.int64, count=self.size)
+        known = old_rows >= 0
+        before = np.zeros(self.size, dtype=STATE_DTYPE)
+        before[known] = old_state[old_rows[known]]
+        after = self.state(np.arange(self.size))
+        changed = ~known | (before != after)
+        removed = [(light_id, old_state[row]) for light_id, row in old_index.items()
+                   if light_id not in self.index]
+        rows = np.flatnonzero(changed)
+        return self._row_change(rows, before[rows], known[rows], 'load', removed)
+
+    def upsert(self, light_id, light_data):
+        """Replace one light's node, adding the light if it is new"""
+        if not isinstance(light_data, dict):
+            self.remove(light_id)
+            return
+        node = {'status': 'off', 'mode': 'automatic', 'isDark': False,
+                'motionDetected': False, 'online': False, 'lastUpdate': '', 'timestamp': 0}
+        node.update(light_data)
+        self.patch(light_id, node)
+
+    def patch(self, light_id, fields, create=True):
+        """Update individual fields of one light in place"""
+        with self._lock:
+            known = light_id in self.index
+            row = self._row(light_id, create)
+            if row is None:
+                return
+            before = self.state([row]) if known else np.zeros(1, dtype=STATE_DTYPE)
+            self._set_fields(row, fields)
+            self._changed(self._row_change([row], before, [known], 'event'))
+
+    def apply_optimistic(self, fields_by_light):
+        """Show successful writes right away, ahead of the database echo"""
+        applied_at = time.time()
+        with self._lock:
+            rows = [self.index[light_id] for light_id in fields_by_light if light_id in self.index]
+            before = self.state(rows)
+            for light_id, fields in fields_by_light.items():
+                row = self._row(light_id, create=False)
+                if row is None:
+                    continue
+                self._set_fields(row, fields)
+                pending, _ = self._optimistic.get(light_id, ({}, None))
+                self._optimistic[light_id] = ({**pending, **fields}, applied_at)
+            self._changed(self._row_change(rows, before, np.ones(len(rows), dtype=bool), 'optimistic'))
+
+    def is_optimistic(self, light_id):
+        """Whether a light is showing a write the database hasn't confirmed"""
+        return light_id in self._optimistic
+
+    def _row(self, light_id, create):
+        """Writable row for a light, appending a blank one if allowed"""
+        row = self.index.get(light_id)
+        if row is None:
+            if not create:
+                return None
+            self._writable(1)
+            row = self.size
+            self.ids[row] = light_id
+            self.status[row] = 0
+            self.mode[row] = 0
+            self.flags[row] = 0
+            self.timestamp[row] = 0
+            self.last_update[row] = NO_UPDATE_TIME
+            self.index[light_id] = row
+            self.size += 1
+            self.ids_version += 1
+        else:
+            self._writable()
+        return row
+
+    def _set_fields(self, row, fields):
+        for field, value in fields.items():
+            if field == 'status':
+                self.status[row] = self._code(self.status_values, value if value is not None else 'off')
+                self._set_flag(row, FLAG_ON, value == 'on')
+            elif field == 'mode':
+                self.mode[row] = self._code(self.mode_values, value if value is not None else 'automatic')
+                self._set_flag(row, FLAG_MANUAL, value == 'manual')
+            elif field in FIELD_FLAGS:
+                self._set_flag(row, FIELD_FLAGS[field], value)
+            elif field == 'timestamp':
+                try:
+                    self.timestamp[row] = int(value or 0)
+                except (TypeError, ValueError, OverflowError):
+                    self.timestamp[row] = 0
+            elif field == 'lastUpdate':
+                self.last_update[row] = parse_update_time(value)
+
+    def _set_flag(self, row, bit, value):
+        self.flags[row] = (self.flags[row] | bit) if value else (self.flags[row] & (0xFF ^ bit))
+
+    def matches(self, light_id, fields):
+        """Whether a light already has these field values, so writing them changes nothing
+
+        `manualState` isn't kept in the snapshot; it counts as matching when
+        the light is in manual mode and its status is the implied on/off.
+        Unknown lights and untracked fields never match.
+        """
+        with self._lock:
+            row = self.index.get(light_id)
+            if row is None:
+                return False
+            status = self.status_values[self.status[row]]
+            mode = self.mode_values[self.mode[row]]
+            for field, value in fields.items():
+                if field == 'status':
+                    same = status == value
+                elif field == 'mode':
+                    same = mode == value
+                elif field == 'manualState':
+                    same = mode == 'manual' and status == ('on' if value else 'off')
+                elif field in FIELD_FLAGS:
+                    same = bool(self.flags[row] & FIELD_FLAGS[field]) == bool(value)
+                else:
+                    same = False
+                if not same:
+                    return False
+            return True
+
+    def remove(self, light_id):
+        """Drop a light, moving the last row into its slot to stay dense"""
+        with self._lock:
+            row = self.index.pop(light_id, None)
+            if row is None:
+                return
+            removed = [(light_id, self.state([row])[0])]
+            self._writable()
+            last = self.size - 1
+            if row != last:
+                for name in self.COLUMNS:
+                    column = getattr(self, name)
+                    column[row] = column[last]
+                self.index[self.ids[row]] = row
+            self.ids[last] = None
+            self.size = last
+            self.ids_version += 1
+            self._changed(self._row_change([], np.zeros(0, dtype=STATE_DTYPE), [], 'event', removed))
+
+    def apply_event(self, event_type, path, data):
+        """Apply a listener put/patch event at `path` (relative to /streetlights)"""
+        parts = [p for p in path.split('/') if p]
+        with self._lock:
+            if event_type == 'put':
+                self._put(parts, data)
+            elif event_type == 'patch' and isinstance(data, dict):
+                for key, value in data.items():
+                    self._put(parts + [p for p in key.split('/') if p], value)
+            else:
+                return
+        self.ready.set()
+
+    def _put(self, parts, value):
+        if not parts:
+            self.load(value if isinstance(value, dict) else {})
+            return
+        # The database has spoken for this light; drop any optimistic overlay
+        self._optimistic.pop(parts[0], None)
+        if len(parts) == 1:
+            self.upsert(parts[0], value)
+        elif len(parts) == 2:
+            self.patch(parts[0], {parts[1]: value})
+        # Deeper paths are fields the dashboard doesn't track
+
+    def frame(self):
+        """Read-only DataFrame over the current arrays, cached per version"""
+        with self._lock:
+            if self._frame_version == self.version:
+                return self._frame
+            n = self.size
+            if n == 0:
+                frame = pd.DataFrame()
+            else:
+                flags = self.flags[:n]
+                no_nulls = np.zeros(n, dtype=bool)
+                ids, last_update, timestamp = (read_only(array[:n]) for array in
+                                               (self.ids, self.last_update, self.timestamp))
+                frame = pd.DataFrame({
+                    'ID': pd.Series(ids, dtype=object, copy=False),
+                    'Status': pd.Categorical.from_codes(self.status[:n], self.status_values),
+                    'Mode': pd.Categorical.from_codes(self.mode[:n], self.mode_values),
+                    'Is Dark': pd.arrays.BooleanArray((flags & FLAG_DARK) != 0, no_nulls),
+                    'Motion Detected': pd.arrays.BooleanArray((flags & FLAG_MOTION) != 0, no_nulls),
+                    'Online': pd.arrays.BooleanArray((flags & FLAG_ONLINE) != 0, no_nulls),
+                    'Last Update': pd.Series(last_update, copy=False),
+                    'Timestamp': pd.Series(timestamp, copy=False)
+                }, copy=False)
+                # The frame shares our arrays; the next write copies them first
+                self._shared = True
+            self._frame = frame
+            self._frame_version = self.version
+            return frame
+
+    def light_index(self):
+        """LightIndex over the current IDs, rebuilt only when lights come or go"""
+        with self._lock:
+            if self._light_index_version != self.ids_version:
+                self._light_index = LightIndex(self.ids[:self.size])
+                self._light_index_version = self.ids_version
+            return self._light_index
+
+    def row_of(self, light_id):
+        """Row of a light in the current arrays (and frame), or None"""
+        with self._lock:
+            return self.index.get(light_id)
+
+    def nbytes(self):
+        """Approximate bytes held by the store's arrays"""
+        return sum(getattr(self, name)[:self.size].nbytes for name in self.COLUMNS)
+
+
+class LightIndex:
+    """Sorted array of light IDs for prefix search"""
+
+    def __init__(self, ids):
+        self.sorted_ids = np.sort(np.asarray(ids, dtype=str))
+
+    def __len__(self):
+        return len(self.sorted_ids)
+
+    def search(self, prefix, limit=LIGHT_SEARCH_LIMIT):
+        """(first `limit` IDs starting with `prefix` in sorted order, total matches)"""
+        lo = np.searchsorted(self.sorted_ids, prefix, side='left')
+        hi = np.searchsorted(self.sorted_ids, prefix + '\U0010ffff', side='left') if prefix else len(self)
+        return self.sorted_ids[lo:min(hi, lo + limit)].tolist(), int(hi - lo)
+
+
+@st.cache_resource
+def start_fleet_listener(_backend):
+    """Start one process-wide listener on the streetlights node"""
+    store = FleetStore()
+
+    def on_event(event):
+        try:
+            store.apply_event(event.event_type, event.path, event.data)
+        except Exception:
+            logger.exception("Error applying streetlight event")
+
+    _backend.listen('streetlights', on_event)
+    return store
+
+
+# Incremental fleet counters
+COUNTER_KEYS = ('total', 'on', 'online', 'dark', 'motion', 'automatic', 'energy_efficient')
+
+def value_code(values, value):
+    """Code of a status/mode value, or -1 if it has never been seen"""
+    return values.index(value) if value in values else -1
+
+def count_states(status, mode, flags, status_values, mode_values):
+    """All COUNTER_KEYS counts in one vectorised pass over state code arrays"""
+    dark = (flags & FLAG_DARK) != 0
+    return np.array([
+        len(status),
+        np.count_nonzero(status == value_code(status_values, 'on')),
+        np.count_nonzero(flags & FLAG_ONLINE),
+        np.count_nonzero(dark),
+        np.count_nonzero(flags & FLAG_MOTION),
+        np.count_nonzero(mode == value_code(mode_values, 'automatic')),
+        np.count_nonzero((status == value_code(status_values, 'off')) & ~dark),
+    ], dtype=np.int64)
+
+
+class FleetCounters:
+    """Fleet-wide counts kept current from per-light deltas
+
+    A FleetStore subscriber: each change adds the counts of the changed
+    lights' new state and subtracts those of their old state (and of
+    removed lights), so reading any counter is O(1). `cube` counts lights
+    per packed state byte (all 32 combinations of the FLAG_* bits), so any
+    AND of those conditions is a sum over at most 32 cells.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(len(COUNTER_KEYS), dtype=np.int64)
+        self.cube = np.zeros(STATE_CELLS, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def reset(self, store):
+        """Recount from scratch (one pass over the store's arrays)"""
+        with store._lock:
+            n = store.size
+            counts = count_states(store.status[:n], store.mode[:n], store.flags[:n],
+                                  store.status_values, store.mode_values)
+            cube = np.bincount(store.flags[:n], minlength=STATE_CELLS)
+        with self._lock:
+            self.counts = counts
+            self.cube = cube
+
+    def observe(self, store, change):
+        after = store.state(change.rows)
+        delta = count_states(after['status'], after['mode'], after['flags'],
+                             store.status_values, store.mode_values)
+        cube_delta = np.bincount(after['flags'], minlength=STATE_CELLS)
+        before = change.before[change.known] if change.before is not None else None
+        if before is not None and len(before):
+            delta -= count_states(before['status'], before['mode'], before['flags'],
+                                  store.status_values, store.mode_values)
+            cube_delta -= np.bincount(before['flags'], minlength=STATE_CELLS)
+        if change.removed:
+            removed = np.array([state for _, state in change.removed], dtype=STATE_DTYPE)
+            delta -= count_states(removed['status'], removed['mode'], removed['flags'],
+                                  store.status_values, store.mode_values)
+            cube_delta -= np.bincount(removed['flags'], minlength=STATE_CELLS)
+        with self._lock:
+            self.counts += delta
+            self.cube += cube_delta
+
+    def snapshot(self):
+        """Current counts as a {COUNTER_KEYS: int} dict"""
+        with self._lock:
+            return dict(zip(COUNTER_KEYS, self.counts.tolist()))
+
+    def cube_snapshot(self):
+        with self._lock:
+            return self.cube.copy()
+
+
+@st.cache_resource
+def get_fleet_counters():
+    """Process-wide counters, seeded from the store and then kept incrementally"""
+    store = get_fleet_store()
+    counters = FleetCounters()
+    with store._lock:
+        counters.reset(store)
+        store.subscribe(counters.observe)
+    return counters
+
+
+# Paged fetch of the streetlights tree
+def fetch_streetlights_paged(backend, page_size=FETCH_PAGE_SIZE):
+    """Page through streetlights by key, yielding one DataFrame per page"""
+    cursor = None
+    while True:
+        if cursor is None:
+            page = backend.query('streetlights', limit=page_size)
+        else:
+            # start_at is inclusive, so ask for one extra and drop the cursor
+            page = backend.query('streetlights', start_at=cursor, limit=page_size + 1)
+            if page:
+                page.pop(cursor, None)
+        if not page:
+            return
+        cursor = next(reversed(page))
+        count = len(page)
+        yield build_streetlight_frame(page)
+        del page
+        if count < page_size:
+            return
+
+def fetch_streetlights_sharded(backend, page_size=FETCH_PAGE_SIZE, workers=FETCH_WORKERS):
+    """Fetch streetlights as key-range shards on a bounded thread pool"""
+    keys = backend.get('streetlights', shallow=True)
+    if not keys:
+        return []
+    keys = sorted(keys, key=firebase_key_order)
+    ranges = [(keys[i], keys[min(i + page_size, len(keys)) - 1])
+              for i in range(0, len(keys), page_size)]
+    del keys
+
+    def fetch_shard(key_range):
+        first, last = key_range
+        page = backend.query('streetlights', start_at=first, end_at=last)
+        return build_streetlight_frame(page)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() keeps shard order, and each raw page is dropped once converted
+        return list(pool.map(fetch_shard, ranges))
+
+
+# Fetch streetlight data
+def load_streetlights(backend, store, chunked=False):
+    """Fetch the whole streetlights tree from the backend into `store`"""
+    requested_at = time.time()
+    if chunked:
+        if FETCH_WORKERS > 1:
+            frames = fetch_streetlights_sharded(backend)
+        else:
+            frames = list(fetch_streetlights_paged(backend))
+        store.load_frame(concat_streetlight_frames(frames), as_of=requested_at)
+    else:
+        store.load(backend.get('streetlights'), as_of=requested_at)
+
+
+# Shared stale-while-revalidate cache for polled fleet data
+class FleetCache:
+    """Fleet snapshot shared by all sessions and refreshed by one fetch at a time
+
+    Readers always get the last snapshot immediately. Once it is older than
+    `ttl` the first reader starts a background refresh; everyone else keeps
+    reading the stale snapshot until it lands. Only a cold cache blocks.
+    """
+
+    polled = True
+
+    def __init__(self, backend, chunked=False, ttl=SNAPSHOT_TTL):
+        self.backend = backend
+        self.store = FleetStore()
+        self.chunked = chunked
+        self.ttl = ttl
+        self.refresh_duration = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._inflight = None
+
+    @property
+    def age(self):
+        """Seconds since the snapshot was last replaced, or None before the first fetch"""
+        if self.store.updated_at is None:
+            return None
+        return time.time() - self.store.updated_at
+
+    def refresh(self):
+        """Start a refresh unless one is already running; returns its done event"""
+        with self._lock:
+            if self._inflight is not None:
+                return self._inflight
+            done = self._inflight = threading.Event()
+        threading.Thread(target=self._run_refresh, args=(done,), daemon=True,
+                         name="fleet-refresh").start()
+        return done
+
+    def _run_refresh(self, done):
+        started = time.perf_counter()
+        try:
+            load_streetlights(self.backend, self.store, chunked=self.chunked)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            logger.exception("Error refreshing the fleet snapshot")
+        finally:
+            self.refresh_duration = time.perf_counter() - started
+            with self._lock:
+                self._inflight = None
+            done.set()
+
+    def get(self):
+        """Return the current fleet frame, revalidating in the background if stale"""
+        age = self.age
+        if age is None:
+            self.refresh().wait(timeout=LISTENER_STARTUP_TIMEOUT)
+        elif age > self.ttl:
+            self.refresh()
+        return self.store.frame()
+
+
+class FleetCollector:
+    """Background thread that refreshes a FleetCache on its own cadence"""
+
+    def __init__(self, cache, interval=COLLECT_INTERVAL):
+        self.cache = cache
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="fleet-collector")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.cache.refresh().wait()
+            self._stop.wait(self.interval)
+
+
+@st.cache_resource
+def start_collector():
+    """Start the process-wide fleet source once, alongside the backend"""
+    backend = get_backend()
+    if FLEET_SYNC_MODE == "listen":
+        try:
+            return start_fleet_listener(backend)
+        except Exception:
+            logger.exception("Realtime listener unavailable, polling instead")
+    cache = FleetCache(backend, chunked=FLEET_SYNC_MODE != "poll")
+    FleetCollector(cache).start()
+    return cache
+
+def get_fleet_source():
+    """The listener store or collector-fed cache that sessions render from"""
+    return start_collector()
+
+def get_fleet_store():
+    """The FleetStore behind the current fleet source"""
+    source = get_fleet_source()
+    return source.store if source.polled else source
+
+def get_streetlight_data(source=None):
+    """Return the current fleet as a read-only DataFrame"""
+    source = source or get_fleet_source()
+    if source.polled:
+        df = source.get()
+        if source.last_error is not None:
+            st.error(f"Error fetching data: {source.last_error}")
+        return df
+    # The first put event carries the whole tree; wait for it on cold start
+    source.ready.wait(timeout=LISTENER_STARTUP_TIMEOUT)
+    return source.frame()
+
+def show_data_freshness(source):
+    """Caption with the age of the fleet snapshot and how long it took to fetch"""
+    if source.polled:
+        if source.age is None:
+            return
+        text = f"Snapshot age: {source.age:.1f}s"
+        if source.refresh_duration is not None:
+            text += f" · last refresh took {source.refresh_duration:.2f}s"
+        st.caption(text)
+    elif source.updated_at is not None:
+        st.caption(f"🟢 Live · last change {time.time() - source.updated_at:.1f}s ago")
+
+class SlotMap:
+    """Light ID -> slot in a set of per-light arrays, reusing freed slots
+
+    The owner keeps its arrays `capacity` long; when a new light needs a
+    slot past the end, `grow(capacity)` is called with the doubled size
+    (capped at `limit`). Once `limit` slots are live, `add` returns None.
+    """
+
+    def __init__(self, capacity, grow, limit=None):
+        self.capacity = capacity
+        self.limit = limit
+        self._grow = grow
+        self._slots = {}
+        self._ids = []
+        self._free = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, light_id):
+        return light_id in self._slots
+
+    def get(self, light_id):
+        return self._slots.get(light_id)
+
+    def add(self, light_id):
+        """The light's slot, allocating one if it has none (None when full)"""
+        slot = self._slots.get(light_id)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        elif self.limit is None or len(self._ids) < self.limit:
+            slot = len(self._ids)
+            self._ids.append(None)
+            if slot >= self.capacity:
+                self.capacity = 2 * self.capacity if self.limit is None else min(self.limit, 2 * self.capacity)
+                self._grow(self.capacity)
+        else:
+            return None
+        self._slots[light_id] = slot
+        self._ids[slot] = light_id
+        return slot
+
+    def remove(self, light_id):
+        """Free a light's slot; returns it, or None if the light had none"""
+        slot = self._slots.pop(light_id, None)
+        if slot is not None:
+            self._ids[slot] = None
+            self._free.append(slot)
+        return slot
+
+    def release(self, slots):
+        """Free slots by number, skipping ones already free; returns those freed"""
+        freed = [slot for slot in slots if slot < len(self._ids) and self._ids[slot] is not None]
+        for slot in freed:
+            self.remove(self._ids[slot])
+        return freed
+
+    def items(self):
+        """Live light IDs and their slots, as a list and an int64 array"""
+        ids = list(self._slots)
+        return ids, np.fromiter(self._slots.values(), dtype=np.int64, count=len(ids))
+
+
+RECENT_DTYPE = np.dtype([('time', np.int64), ('status', np.uint8), ('flags', np.uint8)])
+
+
+class RecentHistory:
+    """Shared ring buffer of each light's latest status/flag transitions
+
+    One (lights x depth) structured array; every light gets a slot with
+    its own head and count, so an append is O(1) and memory is fixed at
+    `max_lights * depth` entries. Lights beyond the cap aren't tracked.
+    Fed by FleetStore changes; repeated reports of the same state are
+    dropped so the buffer holds transitions only.
+    """
+
+    def __init__(self, depth=RECENT_HISTORY_DEPTH, memory_mb=RECENT_HISTORY_MEMORY_MB):
+        self.depth = depth
+        self.max_lights = max(1, memory_mb * 1024 * 1024 // (depth * RECENT_DTYPE.itemsize))
+        self.status_values = list(STATUS_VALUES)
+        self._lock = threading.Lock()
+        capacity = min(1024, self.max_lights)
+        self._allocate(capacity)
+        self.slots = SlotMap(capacity, self._allocate, limit=self.max_lights)
+
+    def _allocate(self, lights):
+        entries = np.zeros((lights, self.depth), dtype=RECENT_DTYPE)
+        head = np.zeros(lights, dtype=np.int32)
+        count = np.zeros(lights, dtype=np.int32)
+        if hasattr(self, 'entries'):
+            used = len(self.head)
+            entries[:used], head[:used], count[:used] = self.entries, self.head, self.count
+        self.entries, self.head, self.count = entries, head, count
+
+    def observe(self, store, change):
+        """FleetStore subscriber: append the changed lights' new state"""
+        if change.origin == 'optimistic':
+            return
+        now = int(time.time() * 1000)
+        with self._lock:
+            self.status_values = list(store.status_values)
+            for light_id, _ in change.removed:
+                slot = self.slots.remove(light_id)
+                if slot is not None:
+                    self.count[slot] = 0
+            if not len(change.rows):
+                return
+            slots = np.array([self.slots.add(light_id) for light_id in change.ids], dtype=object)
+            tracked = np.array([slot is not None for slot in slots], dtype=bool)
+            slots = slots[tracked].astype(np.int64)
+            rows = change.rows[tracked]
+            status = store.status[rows]
+            flags = store.flags[rows]
+            # Only transitions: skip lights whose newest entry already matches
+            last = self.entries[slots, (self.head[slots] - 1) % self.depth]
+            new = (self.count[slots] == 0) | (last['status'] != status) | (last['flags'] != flags)
+            slots, status, flags = slots[new], status[new], flags[new]
+            head = self.head[slots]
+            self.entries['time'][slots, head] = now
+            self.entries['status'][slots, head] = status
+            self.entries['flags'][slots, head] = flags
+            self.head[slots] = (head + 1) % self.depth
+            self.count[slots] = np.minimum(self.count[slots] + 1, self.depth)
+
+    def recent(self, light_id, since=None):
+        """A light's transitions, oldest first, as a DataFrame (empty if untracked)"""
+        with self._lock:
+            slot = self.slots.get(light_id)
+            if slot is None or not self.count[slot]:
+                return pd.DataFrame(columns=['Time', 'Status', 'Is Dark', 'Motion Detected', 'Online'])
+            count = self.count[slot]
+            order = (self.head[slot] - count + np.arange(count)) % self.depth
+            entries = self.entries[slot, order].copy()
+            status_values = self.status_values
+        if since is not None:
+            # Keep the last entry before `since` so the state at the window start is known
+            first = max(0, np.searchsorted(entries['time'], int(since * 1000), side='right') - 1)
+            entries = entries[first:]
+        flags = entries['flags']
+        return pd.DataFrame({
+            'Time': local_times(pd.Series(entries['time'])),
+            'Status': [status_values[code] for code in entries['status']],
+            'Is Dark': (flags & FLAG_DARK) != 0,
+            'Motion Detected': (flags & FLAG_MOTION) != 0,
+            'Online': (flags & FLAG_ONLINE) != 0,
+        })
+
+    def nbytes(self):
+        return self.entries.nbytes + self.head.nbytes + self.count.nbytes
+
+
+@st.cache_resource
+def get_recent_history():
+    """Process-wide per-light ring buffers fed by the fleet store"""
+    recent = RecentHistory()
+    store = get_fleet_store()
+    with store._lock:
+        # Seed with the current state, then follow changes
+        rows = np.arange(store.size)
+        recent.observe(store, FleetChange(rows, store.ids[rows], None, None, [], 'load'))
+        store.subscribe(recent.observe)
+    return recent
+
+
+FLEET_ROLLUP_COLUMNS = ('time', 'coverage', 'lights', 'on', 'online', 'dark', 'motion_events', 'on_hours')
+LIGHT_ROLLUP_COLUMNS = ('time', 'light_id', 'on_seconds', 'online_seconds', 'dark_seconds', 'motion_events')
+
+def pick_rollup_resolution(seconds):
+    """Coarsest-enough rollup for a time range, by ROLLUP_MAX_RANGE"""
+    for name, _ in ROLLUP_RESOLUTIONS:
+        limit = ROLLUP_MAX_RANGE[name]
+        if limit is None or seconds <= limit:
+            return name
+    return ROLLUP_RESOLUTIONS[-1][0]
+
+
+class FleetRollups:
+    """Incremental per-light and fleet aggregates at 1m/15m/1h/1d
+
+    Each light's current on/dark/online state and the time it was last
+    accounted for are kept in arrays indexed by slot. Every FleetStore
+    change first adds the time spent in the old state to the open minute,
+    so nothing is ever recomputed from raw history. Closing a minute adds
+    it into the open 15-minute, hour and day buckets; each closed bucket
+    emits a fleet row (time-weighted average lights on/online/dark, motion
+    events, on-hours) and, from hourly up, one row per light.
+
+    Closed rows go to Parquet under `<dir>/<resolution>/<fleet|lights>/`
+    (fleet rows once per hour) when pyarrow is available; otherwise only
+    the in-memory tail is kept. Time is UTC, buckets are aligned to epoch.
+    """
+
+    MEASURES = ('on_seconds', 'online_seconds', 'dark_seconds', 'motion_events')
+
+    def __init__(self, directory=None, now=None):
+        self.directory = Path(directory) if directory and pa is not None else None
+        self._lock = threading.RLock()
+        capacity = 1024
+        self.slots = SlotMap(capacity, self._grow)
+        self.present = np.zeros(capacity, dtype=bool)
+        self.on = np.zeros(capacity, dtype=bool)
+        self.dark = np.zeros(capacity, dtype=bool)
+        self.online = np.zeros(capacity, dtype=bool)
+        self.motion = np.zeros(capacity, dtype=bool)
+        self.since = np.zeros(capacity, dtype=np.float64)
+        # Open buckets: per-slot measures for the minute and each per-light
+        # resolution, fleet totals for the rest
+        self._light_open = {name: np.zeros((len(self.MEASURES), capacity), dtype=np.float64)
+                            for name, seconds in ROLLUP_RESOLUTIONS if seconds >= ROLLUP_LIGHT_MIN}
+        self._minute = np.zeros((len(self.MEASURES), capacity), dtype=np.float64)
+        self._fleet_open = {name: np.zeros(len(self.MEASURES) + 1) for name, _ in ROLLUP_RESOLUTIONS}
+        now = time.time() if now is None else now
+        self.started_at = now
+        self.minute_start = now - now % 60
+        self.recent = {name: deque(maxlen=2000) for name, _ in ROLLUP_RESOLUTIONS}
+        self._unflushed = {name: [] for name, _ in ROLLUP_RESOLUTIONS}
+        self.last_error = None
+
+    def _grow(self, capacity):
+        for name in ('present', 'on', 'dark', 'online', 'motion', 'since'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        def widen(old):
+            new = np.zeros((old.shape[0], capacity), dtype=old.dtype)
+            new[:, :old.shape[1]] = old
+            return new
+
+        self._minute = widen(self._minute)
+        self._light_open = {name: widen(old) for name, old in self._light_open.items()}
+
+    def _account(self, slots, now):
+        """Credit the time since each slot was last accounted to the open minute"""
+        elapsed = np.where(self.present[slots], now - self.since[slots], 0.0)
+        np.add.at(self._minute[0], slots, elapsed * self.on[slots])
+        np.add.at(self._minute[1], slots, elapsed * self.online[slots])
+        np.add.at(self._minute[2], slots, elapsed * self.dark[slots])
+        self.since[slots] = now
+
+    def observe(self, store, change, now=None):
+        """FleetStore subscriber: account the old state, then take the new one"""
+        if change.origin == 'optimistic':
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self.advance(now)
+            for light_id, _ in change.removed:
+                slot = self.slots.remove(light_id)
+                if slot is not None:
+                    self._account(np.array([slot]), now)
+                    self.present[slot] = False
+            if not len(change.rows):
+                return
+            slots = np.array([self.slots.add(light_id) for light_id in change.ids], dtype=np.int64)
+            self._account(slots, now)
+            flags = store.flags[change.rows]
+            motion = (flags & FLAG_MOTION) != 0
+            self._minute[3, slots] += motion & ~self.motion[slots] & self.present[slots]
+            self.present[slots] = True
+            on_code = store.status_values.index('on') if 'on' in store.status_values else -1
+            self.on[slots] = store.status[change.rows] == on_code
+            self.dark[slots] = (flags & FLAG_DARK) != 0
+            self.online[slots] = (flags & FLAG_ONLINE) != 0
+            self.motion[slots] = motion
+
+    def advance(self, now=None):
+        """Close every bucket that ended before `now`"""
+        now = time.time() if now is None else now
+        with self._lock:
+            while self.minute_start + 60 <= now:
+                self._close_minute(self.minute_start + 60)
+
+    def _close_minute(self, end):
+        used = np.arange(len(self.present))
+        self._account(used, end)
+        # The first minute is only covered from startup
+        coverage = end - max(self.minute_start, self.started_at)
+        minute_totals = self._minute.sum(axis=1)
+        for name, seconds in ROLLUP_RESOLUTIONS:
+            self._fleet_open[name][:-1] += minute_totals
+            self._fleet_open[name][-1] += coverage
+            if name in self._light_open:
+                self._light_open[name] += self._minute
+            if end % seconds == 0:
+                self._emit(name, end - seconds)
+        self._minute[:] = 0
+        self.minute_start = end
+
+    def _emit(self, name, start):
+        on_s, online_s, dark_s, motion, coverage = self._fleet_open[name]
+        row = {'time': pd.Timestamp(start, unit='s'), 'coverage': coverage,
+               'lights': int(self.present.sum()),
+               'on': on_s / coverage, 'online': online_s / coverage, 'dark': dark_s / coverage,
+               'motion_events': int(motion), 'on_hours': on_s / 3600}
+        self.recent[name].append(row)
+        self._unflushed[name].append(row)
+        self._fleet_open[name][:] = 0
+        if name in self._light_open:
+            self._write_lights(name, start, self._light_open[name])
+            self._light_open[name][:] = 0
+        # Fleet rows are written with the hourly/daily close
+        if name in ('1h', '1d'):
+            self._flush_fleet()
+
+    def _partition(self, name, kind, start):
+        day = datetime.fromtimestamp(start, timezone.utc).date()
+        partition = self.directory / name / kind / f"date={day.isoformat()}"
+        partition.mkdir(parents=True, exist_ok=True)
+        return partition
+
+    def _write_lights(self, name, start, measures):
+        if self.directory is None or not self.slots:
+            return
+        ids, slots = self.slots.items()
+        table = pa.table({
+            'time': pa.array(np.full(len(ids), np.datetime64(int(start), 's')).astype('datetime64[ms]')),
+            'light_id': pa.array(ids).dictionary_encode(),
+            'on_seconds': measures[0, slots].astype(np.float32),
+            'online_seconds': measures[1, slots].astype(np.float32),
+            'dark_seconds': measures[2, slots].astype(np.float32),
+            'motion_events': measures[3, slots].astype(np.int32),
+        })
+        try:
+            pq.write_table(table, self._partition(name, 'lights', start) / f"part-{int(start)}.parquet",
+                           compression='zstd')
+        except Exception as e:
+            self.last_error = e
+            logger.exception("Error writing light rollups")
+
+    def _flush_fleet(self):
+        if self.directory is None:
+            return
+        for name, rows in self._unflushed.items():
+            if not rows:
+                continue
+            try:
+                start = rows[0]['time'].timestamp()
+                table = pa.Table.from_pandas(pd.DataFrame(rows, columns=FLEET_ROLLUP_COLUMNS), preserve_index=False)
+                pq.write_table(table, self._partition(name, 'fleet', start) / f"part-{int(start)}.parquet")
+                self._unflushed[name] = []
+            except Exception as e:
+                self.last_error = e
+                logger.exception("Error writing fleet rollups")
+
+    def _read(self, name, kind, start, end, columns):
+        frames = []
+        if self.directory is not None and (self.directory / name / kind).exists():
+            first = datetime.fromtimestamp(start, timezone.utc).date()
+            last = datetime.fromtimestamp(end, timezone.utc).date()
+            filters = [('time', '>=', pd.Timestamp(start, unit='s')), ('time', '<', pd.Timestamp(end, unit='s'))]
+            for partition in sorted((self.directory / name / kind).glob('date=*')):
+                day = datetime.strptime(partition.name[5:], '%Y-%m-%d').date()
+                if first <= day <= last:
+                    frames.extend(pq.read_table(path, filters=filters).to_pandas()
+                                  for path in sorted(partition.glob('*.parquet')))
+        frames = [frame for frame in frames if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+    def fleet(self, name, start, end):
+        """Fleet rows of one resolution with bucket start in [start, end), oldest first"""
+        stored = self._read(name, 'fleet', start, end, FLEET_ROLLUP_COLUMNS)
+        with self._lock:
+            memory = pd.DataFrame(list(self.recent[name]), columns=FLEET_ROLLUP_COLUMNS)
+        lo, hi = pd.Timestamp(start, unit='s'), pd.Timestamp(end, unit='s')
+        memory = memory[(memory['time'] >= lo) & (memory['time'] < hi)]
+        rows = pd.concat([frame for frame in (stored, memory) if not frame.empty] or [memory], ignore_index=True)
+        rows['time'] = pd.to_datetime(rows['time'])
+        return rows.drop_duplicates('time', keep='last').sort_values('time').reset_index(drop=True)
+
+    def light_totals(self, start, end):
+        """Per-light sums over [start, end) from the hourly (or, past 45 days, daily) rollups"""
+        name = '1h' if end - start <= ROLLUP_MAX_RANGE['1h'] else '1d'
+        rows = self._read(name, 'lights', start, end, LIGHT_ROLLUP_COLUMNS)
+        if rows.empty:
+            return pd.DataFrame(columns=LIGHT_ROLLUP_COLUMNS[1:])
+        rows['light_id'] = rows['light_id'].astype(object)
+        return rows.groupby('light_id', as_index=False)[list(self.MEASURES)].sum()
+
+
+@st.cache_resource
+def get_fleet_rollups():
+    """Process-wide rollup engine on the fleet store, with its minute ticker"""
+    rollups = FleetRollups(Path(HISTORY_DIR) / "rollups")
+    store = get_fleet_store()
+    with store._lock:
+        rows = np.arange(store.size)
+        rollups.observe(store, FleetChange(rows, store.ids[rows], None, None, [], 'load'))
+        store.subscribe(rollups.observe)
+
+    def tick():
+        while True:
+            now = time.time()
+            time.sleep(60 - now % 60 + 0.05)
+            rollups.advance()
+
+    threading.Thread(target=tick, daemon=True, name="fleet-rollups").start()
+    return rollups
+
+
+def dictionary_indices(column):
+    """A Parquet column as (dictionary values, int64 indices) without a per-row Python pass"""
+    column = column.combine_chunks()
+    if not pa.types.is_dictionary(column.type):
+        column = column.dictionary_encode()
+    return column.dictionary.to_pylist(), column.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+# Event kinds: code 2*i when bit i of the state byte was set, 2*i + 1 when cleared
+EVENT_BITS = (
+    (FLAG_ON, "Turned on", "Turned off"),
+    (FLAG_ONLINE, "Went online", "Went offline"),
+    (FLAG_MOTION, "Motion started", "Motion stopped"),
+    (FLAG_MANUAL, "Mode → manual", "Mode → automatic"),
+    (FLAG_DARK, "Became dark", "Became bright"),
+)
+EVENT_KINDS = tuple(name for _, set_name, clear_name in EVENT_BITS for name in (set_name, clear_name))
+
+
+class EventLog:
+    """Append-only log of state transitions derived from the change stream
+
+    Each reported change is diffed against the light's previous state byte;
+    every FLAG bit that flipped becomes one event. Events are three
+    columns: int64 epoch-ms `time`, int32 `light` (a code into the
+    `light_ids` dictionary) and uint8 `kind` (into EVENT_KINDS), 13 bytes
+    each. Time only grows, so time ranges are binary searches and light
+    filters a vectorised scan of the codes in range.
+
+    New events are flushed to `<dir>/date=YYYY-MM-DD/*.parquet` when
+    pyarrow is available and the last `load_days` are read back at start.
+    """
+
+    def __init__(self, directory=None, max_events=EVENT_LOG_MAX, load_days=EVENT_LOG_LOAD_DAYS):
+        self.directory = Path(directory) if directory and pa is not None else None
+        self.max_events = max_events
+        self.light_ids = []
+        self.light_codes = {}
+        self.size = 0
+        self.dropped = 0
+        self._flushed = 0
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._allocate(1 << 16)
+        if self.directory is not None:
+            self._load(load_days)
+
+    def _allocate(self, capacity):
+        time_, light, kind = (np.zeros(capacity, dtype=np.int64), np.zeros(capacity, dtype=np.int32),
+                              np.zeros(capacity, dtype=np.uint8))
+        if self.size:
+            time_[:self.size], light[:self.size], kind[:self.size] = self.time[:self.size], \
+                self.light[:self.size], self.kind[:self.size]
+        self.time, self.light, self.kind = time_, light, kind
+
+    def _code(self, light_id):
+        code = self.light_codes.get(light_id)
+        if code is None:
+            code = self.light_codes[light_id] = len(self.light_ids)
+            self.light_ids.append(light_id)
+        return code
+
+    def append(self, times, light_ids, kinds):
+        """Add events (already in time order) to the end of the log"""
+        with self._lock:
+            self._append(times, np.array([self._code(light_id) for light_id in light_ids], dtype=np.int32), kinds)
+
+    def _append(self, times, codes, kinds):
+        count = len(kinds)
+        if not count:
+            return
+        with self._lock:
+            if self.size + count > self.max_events:
+                # Drop the oldest half rather than shifting on every append
+                drop = max(self.size + count - self.max_events, self.size // 2)
+                keep = slice(drop, self.size)
+                n = self.size - drop
+                self.time[:n], self.light[:n], self.kind[:n] = self.time[keep], self.light[keep], self.kind[keep]
+                self.size, self.dropped = n, self.dropped + drop
+                self._flushed = max(0, self._flushed - drop)
+            if self.size + count > len(self.time):
+                self._allocate(max(2 * len(self.time), self.size + count))
+            end = self.size + count
+            # Keep time non-decreasing even if the clock steps back
+            floor = self.time[self.size - 1] if self.size else np.iinfo(np.int64).min
+            self.time[self.size:end] = np.maximum(times, floor)
+            self.light[self.size:end] = codes
+            self.kind[self.size:end] = kinds
+            self.size = end
+
+    def observe(self, store, change):
+        """FleetStore subscriber: one event per flipped state bit of a known light
+
+        Optimistic writes aren't events. The confirmed state from before
+        them is held until the database echo (or a reload) settles the
+        light, and the diff is taken against that.
+        """
+        if change is None or not (len(change.rows) or self._pending):
+            return
+        if change.origin == 'optimistic':
+            for light_id, flags in zip(change.ids, change.before['flags']):
+                self._pending.setdefault(light_id, flags)
+            return
+        known = change.known.copy()
+        before = change.before['flags'].copy()
+        for i, light_id in enumerate(change.ids):
+            if light_id in self._pending:
+                if store.is_optimistic(light_id):
+                    known[i] = False
+                else:
+                    before[i] = self._pending.pop(light_id)
+        ids, before, after = change.ids[known], before[known], store.flags[change.rows[known]]
+        # Lights settled without showing up in this change (echo equal to the overlay)
+        settled = [light_id for light_id in self._pending if not store.is_optimistic(light_id)]
+        if settled:
+            rows = [store.index.get(light_id) for light_id in settled]
+            present = [i for i, row in enumerate(rows) if row is not None]
+            ids = np.concatenate([ids, np.asarray(settled, dtype=object)[present]])
+            before = np.concatenate([before, np.array([self._pending[settled[i]] for i in present], dtype=np.uint8)])
+            after = np.concatenate([after, store.flags[[rows[i] for i in present]]])
+            for light_id in settled:
+                del self._pending[light_id]
+        flipped = before ^ after
+        if not flipped.any():
+            return
+        light_ids, kinds = [], []
+        for i, (bit, _, _) in enumerate(EVENT_BITS):
+            rows = np.flatnonzero(flipped & bit)
+            light_ids.extend(ids[rows])
+            kinds.append(np.where(after[rows] & bit, 2 * i, 2 * i + 1).astype(np.uint8))
+        kinds = np.concatenate(kinds)
+        self.append(np.full(len(kinds), int(time.time() * 1000), dtype=np.int64), light_ids, kinds)
+
+    def query(self, start_ms=None, end_ms=None, kinds=None, light_ids=None):
+        """Positions of matching events, oldest first; `light_ids` is a collection of IDs"""
+        with self._lock:
+            n = self.size
+            lo = 0 if start_ms is None else int(np.searchsorted(self.time[:n], start_ms, side='left'))
+            hi = n if end_ms is None else int(np.searchsorted(self.time[:n], end_ms, side='right'))
+            if light_ids is None:
+                positions = np.arange(lo, hi)
+            else:
+                codes = [self.light_codes[light_id] for light_id in light_ids if light_id in self.light_codes]
+                if len(codes) == 1:
+                    matches = self.light[lo:hi] == codes[0]
+                else:
+                    matches = np.isin(self.light[lo:hi], codes)
+                positions = np.flatnonzero(matches) + lo
+            if kinds is not None:
+                positions = positions[np.isin(self.kind[positions], list(kinds))]
+            return positions
+
+    def frame(self, positions):
+        """Events at `positions` as a display DataFrame"""
+        with self._lock:
+            times = self.time[positions]
+            lights = np.asarray(self.light_ids, dtype=object)[self.light[positions]] if len(positions) else []
+            kinds = np.asarray(EVENT_KINDS, dtype=object)[self.kind[positions]]
+        return pd.DataFrame({'Time': local_times(pd.Series(times)), 'ID': lights, 'Event': kinds})
+
+    def flush(self):
+        """Write events not yet on disk to the partitions of the (UTC) days they happened on"""
+        if self.directory is None:
+            return 0
+        with self._lock:
+            start, end = self._flushed, self.size
+            if start == end:
+                return 0
+            times = self.time[start:end].copy()
+            codes = self.light[start:end].copy()
+            kinds = self.kind[start:end].copy()
+            light_ids = np.asarray(self.light_ids, dtype=object)
+            self._flushed = end
+        written_at = int(time.time() * 1000)
+        days = times // 86_400_000
+        # Times only grow, so each day is one contiguous slice
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for lo, hi in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(days)]])):
+            # Each file carries only the IDs it uses
+            used, indices = np.unique(codes[lo:hi], return_inverse=True)
+            table = pa.table({
+                'time': pa.array(times[lo:hi].astype('datetime64[ms]')),
+                'light_id': pa.DictionaryArray.from_arrays(
+                    pa.array(indices.astype(np.int32)), pa.array(light_ids[used].tolist(), type=pa.string())),
+                'kind': pa.DictionaryArray.from_arrays(
+                    pa.array(kinds[lo:hi].astype(np.int8)), pa.array(EVENT_KINDS)),
+            })
+            day = datetime.fromtimestamp(int(days[lo]) * 86400, timezone.utc).date()
+            partition = self.directory / f"date={day.isoformat()}"
+            partition.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, partition / f"part-{written_at}.parquet", compression='zstd')
+        return end - start
+
+    def _load(self, days):
+        if not self.directory.exists():
+            return
+        first = datetime.now(timezone.utc).date() - timedelta(days=days)
+        for partition in sorted(self.directory.glob('date=*')):
+            if datetime.strptime(partition.name[5:], '%Y-%m-%d').date() < first:
+                continue
+            for path in sorted(partition.glob('*.parquet')):
+                table = pq.read_table(path)
+                light_ids, light_indices = dictionary_indices(table['light_id'])
+                kinds, kind_indices = dictionary_indices(table['kind'])
+                # Remap through small per-file arrays: file dictionary -> our codes
+                light_codes = np.array([self._code(light_id) for light_id in light_ids], dtype=np.int32)
+                kind_codes = np.array([EVENT_KINDS.index(kind) for kind in kinds], dtype=np.uint8)
+                times = table['time'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+                self._append(times, light_codes[light_indices], kind_codes[kind_indices])
+        self._flushed = self.size
+
+    def nbytes(self):
+        return self.size * (8 + 4 + 1)
+
+
+@st.cache_resource
+def get_event_log():
+    """Process-wide event log on the fleet store, flushed in the background"""
+    events = EventLog(Path(HISTORY_DIR) / "events")
+    get_fleet_store().subscribe(events.observe)
+
+    def flush():
+        while True:
+            time.sleep(HISTORY_FLUSH_INTERVAL)
+            try:
+                events.flush()
+            except Exception:
+                logger.exception("Error writing events")
+
+    threading.Thread(target=flush, daemon=True, name="event-log").start()
+    return events
+
+
+class EnergyMeter:
+    """Incremental burn-hours and energy per light, for today and by month
+
+    Each light's on/off state, wattage and the time it was last accounted
+    for are arrays indexed by slot. Every FleetStore change first credits
+    the time since then (if the light was on) to the open day as
+    burn-seconds and watt-hours, so a report is a vectorised read of
+    running totals rather than a pass over transitions. Days and months
+    follow local time; closing a day adds it into the month and keeps one
+    fleet-wide row for it. A removed light keeps its slot, so its energy
+    still counts, until it has nothing left in this or last month.
+
+    Closed days are written per light to `<dir>/date=YYYY-MM-DD/` when
+    pyarrow is available; this and last month are read back at start.
+    """
+
+    PERIODS = ('today', 'month', 'last_month')
+
+    def __init__(self, directory=None, default_watts=LIGHT_WATTAGE, watts_by_light=None, now=None):
+        self.directory = Path(directory) if directory and pa is not None else None
+        self.default_watts = default_watts
+        self.watts_by_light = dict(watts_by_light or {})
+        self._lock = threading.RLock()
+        capacity = 1024
+        self.slots = SlotMap(capacity, self._grow)
+        self.present = np.zeros(capacity, dtype=bool)
+        self.on = np.zeros(capacity, dtype=bool)
+        self.since = np.zeros(capacity, dtype=np.float64)
+        self.watts = np.zeros(capacity, dtype=np.float64)
+        # Burn-seconds and watt-hours per slot; 'month' excludes the open day
+        self.totals = {period: np.zeros((2, capacity), dtype=np.float64) for period in self.PERIODS}
+        self.daily = {}
+        now = time.time() if now is None else now
+        self.started_at = now
+        self.day = datetime.fromtimestamp(now).date()
+        self.day_end = self._day_start(self.day + timedelta(days=1))
+        self.last_error = None
+        if self.directory is not None:
+            self._load()
+
+    @staticmethod
+    def _day_start(day):
+        return datetime.combine(day, clock_time()).timestamp()
+
+    def _grow(self, capacity):
+        for name in ('present', 'on', 'since', 'watts'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        for period, old in self.totals.items():
+            new = np.zeros((2, capacity), dtype=old.dtype)
+            new[:, :old.shape[1]] = old
+            self.totals[period] = new
+
+    def _slot(self, light_id):
+        slot = self.slots.get(light_id)
+        if slot is None:
+            slot = self.slots.add(light_id)
+            self.watts[slot] = self.watts_by_light.get(light_id, self.default_watts)
+        return slot
+
+    def _account(self, slots, now):
+        """Credit the on-time since each slot was last accounted to the open day"""
+        elapsed = np.where(self.present[slots] & self.on[slots], now - self.since[slots], 0.0)
+        today = self.totals['today']
+        today[0, slots] += elapsed
+        today[1, slots] += elapsed * self.watts[slots] / 3600
+        self.since[slots] = now
+
+    def observe(self, store, change, now=None):
+        """FleetStore subscriber: account the old state, then take the new one"""
+        if change.origin == 'optimistic':
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self.advance(now)
+            for light_id, _ in change.removed:
+                slot = self.slots.get(light_id)
+                if slot is not None:
+                    self._account(np.array([slot]), now)
+                    self.present[slot] = False
+            if not len(change.rows):
+                return
+            slots = np.array([self._slot(light_id) for light_id in change.ids], dtype=np.int64)
+            self._account(slots, now)
+            self.present[slots] = True
+            self.on[slots] = (store.flags[change.rows] & FLAG_ON) != 0
+
+    def advance(self, now=None):
+        """Close every day that ended before `now`"""
+        now = time.time() if now is None else now
+        with self._lock:
+            while self.day_end <= now:
+                self._close_day()
+
+    def _close_day(self):
+        self._account(np.arange(len(self.present)), self.day_end)
+        today, month = self.totals['today'], self.totals['month']
+        self.daily[self.day] = (int(self.present.sum()), today[0].sum(), today[1].sum())
+        self._write_day(self.day, today)
+        month += today
+        next_day = self.day + timedelta(days=1)
+        if next_day.month != self.day.month:
+            self.totals['last_month'], self.totals['month'] = month, np.zeros_like(month)
+        today[:] = 0
+        self._expire()
+        self.day, self.day_end = next_day, self._day_start(next_day + timedelta(days=1))
+        for day in [day for day in self.daily if (next_day - day).days > ENERGY_DAYS_KEPT]:
+            del self.daily[day]
+
+    def _expire(self):
+        """Free the slots of removed lights with no energy left in any period"""
+        idle = ~self.present
+        for totals in self.totals.values():
+            idle &= ~totals.any(axis=0)
+        for slot in self.slots.release(np.flatnonzero(idle)):
+            self.on[slot] = False
+            self.since[slot] = 0
+
+    def set_wattage(self, watts_by_light, default_watts=None):
+        """Change wattages from now on; time already accounted keeps the old ones"""
+        with self._lock:
+            self._account(np.arange(len(self.present)), time.time())
+            if default_watts is not None:
+                self.default_watts = default_watts
+                self.watts[:] = default_watts
+                for light_id, watts in self.watts_by_light.items():
+                    slot = self.slots.get(light_id)
+                    if slot is not None:
+                        self.watts[slot] = watts
+            self.watts_by_light.update(watts_by_light)
+            for light_id, watts in watts_by_light.items():
+                slot = self.slots.get(light_id)
+                if slot is not None:
+                    self.watts[slot] = watts
+
+    def report(self, period, now=None):
+        """Per-light burn-hours and kWh for 'today', 'month' (to date) or 'last_month'"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.advance(now)
+            self._account(np.arange(len(self.present)), now)
+            ids, slots = self.slots.items()
+            totals = self.totals[period][:, slots]
+            if period == 'month':
+                totals = totals + self.totals['today'][:, slots]
+            watts = self.watts[slots]
+            return pd.DataFrame({'ID': ids, 'Burn hours': totals[0] / 3600, 'kWh': totals[1] / 1000,
+                                 'Watts': watts})
+
+    def daily_rows(self, first_day, now=None):
+        """One fleet-wide row per local day from `first_day`, the open day last"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.advance(now)
+            self._account(np.arange(len(self.present)), now)
+            today = self.totals['today']
+            rows = [(day, *values) for day, values in sorted(self.daily.items()) if day >= first_day]
+            if self.day >= first_day:
+                rows.append((self.day, int(self.present.sum()), today[0].sum(), today[1].sum()))
+        frame = pd.DataFrame(rows, columns=['Day', 'Lights', 'Burn hours', 'kWh'])
+        frame['Day'] = pd.to_datetime(frame['Day'])
+        frame['Burn hours'] /= 3600
+        frame['kWh'] /= 1000
+        return frame
+
+    def _write_day(self, day, totals):
+        if self.directory is None or not self.slots:
+            return
+        ids, slots = self.slots.items()
+        table = pa.table({
+            'light_id': pa.array(ids).dictionary_encode(),
+            'burn_seconds': totals[0, slots].astype(np.float32),
+            'wh': totals[1, slots].astype(np.float32),
+        })
+        try:
+            partition = self.directory / f"date={day.isoformat()}"
+            partition.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, partition / "lights.parquet", compression='zstd')
+        except Exception as e:
+            self.last_error = e
+            logger.exception("Error writing energy for %s", day)
+
+    def _load(self):
+        if not self.directory.exists():
+            return
+        this_month = self.day.replace(day=1)
+        last_month = (this_month - timedelta(days=1)).replace(day=1)
+        # Consecutive days usually list the same lights; map them to slots once
+        light_ids, light_slots = None, None
+        for partition in sorted(self.directory.glob('date=*')):
+            day = datetime.strptime(partition.name[5:], '%Y-%m-%d').date()
+            if day >= self.day or (self.day - day).days > ENERGY_DAYS_KEPT:
+                continue
+            for path in partition.glob('*.parquet'):
+                table = pq.read_table(path)
+                burn, wh = table['burn_seconds'].to_numpy(), table['wh'].to_numpy()
+                self.daily[day] = (table.num_rows, float(burn.sum()), float(wh.sum()))
+                if day < last_month:
+                    continue
+                ids, indices = dictionary_indices(table['light_id'])
+                if ids != light_ids:
+                    light_ids = ids
+                    light_slots = np.array([self._slot(light_id) for light_id in ids], dtype=np.int64)
+                slots = light_slots[indices]
+                totals = self.totals['month' if day >= this_month else 'last_month']
+                totals[0, slots] += burn
+                totals[1, slots] += wh
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.present, self.on, self.since, self.watts,
+                                              *self.totals.values()))
+
+
+def energy_by_group(report, groups):
+    """Burn-hours and kWh summed over each saved group's members"""
+    rows = []
+    index = pd.Index(report['ID'])
+    burn_hours, kwh = report['Burn hours'].to_numpy(), report['kWh'].to_numpy()
+    for name, members in sorted(groups.items()):
+        positions = index.get_indexer(members)
+        positions = positions[positions >= 0]
+        rows.append({'Group': name, 'Lights': len(positions),
+                     'Burn hours': burn_hours[positions].sum(), 'kWh': kwh[positions].sum()})
+    return pd.DataFrame(rows, columns=['Group', 'Lights', 'Burn hours', 'kWh'])
+
+
+@st.cache_resource
+def get_energy_meter():
+    """Process-wide energy meter on the fleet store, with its day-close ticker"""
+    wattage = get_backend().get('wattage') or {}
+    meter = EnergyMeter(Path(HISTORY_DIR) / "energy",
+                        watts_by_light={light_id: float(watts) for light_id, watts in wattage.items()})
+    store = get_fleet_store()
+    with store._lock:
+        rows = np.arange(store.size)
+        meter.observe(store, FleetChange(rows, store.ids[rows], None, None, [], 'load'))
+        store.subscribe(meter.observe)
+
+    def tick():
+        while True:
+            time.sleep(max(1.0, meter.day_end - time.time() + 0.05))
+            meter.advance()
+
+    threading.Thread(target=tick, daemon=True, name="energy-meter").start()
+    return meter
+
+
+# Write executor
+TRANSIENT_WRITE_ERRORS = (
+    ConnectionError, TimeoutError,
+    firebase_exceptions.UnavailableError, firebase_exceptions.DeadlineExceededError,
+    firebase_exceptions.InternalError, firebase_exceptions.ResourceExhaustedError,
+    firebase_exceptions.AbortedError, firebase_exceptions.UnknownError,
+)
+
+def is_transient_write_error(error):
+    """Whether a failed write is worth retrying"""
+    if isinstance(error, sqlite3.OperationalError):
+        return 'locked' in str(error) or 'busy' in str(error)
+    return isinstance(error, TRANSIENT_WRITE_ERRORS)
+
+
+class WriteExecutor:
+    """Runs backend writes on a bounded thread pool with retry and backoff
+
+    At most `concurrency` writes are in flight. Transient failures are
+    retried up to `retries` times, sleeping a random time up to
+    base * 2**attempt (capped at `max_delay`) so a flaky link isn't
+    hammered. All writes go through the one backend instance, which for
+    Firebase means the SDK's single authenticated HTTP session.
+    """
+
+    def __init__(self, backend, concurrency=WRITE_CONCURRENCY, retries=WRITE_RETRIES,
+                 base_delay=WRITE_BACKOFF_BASE, max_delay=WRITE_BACKOFF_MAX):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        # Light updates skipped because the snapshot already matched
+        self.elided = 0
+        self.in_flight = 0
+        self._completed = deque()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="write")
+
+    def submit(self, path, values):
+        """Queue a multi-path update; returns a Future"""
+        with self._lock:
+            self.in_flight += 1
+        return self._pool.submit(self._write, path, values)
+
+    def update(self, path, values):
+        """Write and wait, raising the last error if every attempt failed"""
+        return self.submit(path, values).result()
+
+    def _write(self, path, values):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self.backend.update(path, values)
+                    break
+                except Exception as e:
+                    if attempt == self.retries or not is_transient_write_error(e):
+                        with self._lock:
+                            self.failed += 1
+                        raise
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            with self._lock:
+                self.succeeded += 1
+                self._completed.append(time.time())
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record_elided(self, count=1):
+        """Count writes skipped because the lights already had those values"""
+        with self._lock:
+            self.elided += count
+
+    @property
+    def throughput(self):
+        """Successful writes per second over the last THROUGHPUT_WINDOW seconds"""
+        cutoff = time.time() - THROUGHPUT_WINDOW
+        with self._lock:
+            while self._completed and self._completed[0] < cutoff:
+                self._completed.popleft()
+            return len(self._completed) / THROUGHPUT_WINDOW
+
+
+@st.cache_resource
+def get_write_executor():
+    """Process-wide write executor over the data backend"""
+    return WriteExecutor(get_backend())
+
+
+# Offline command journal
+COMMAND_TAG_FIELDS = ('commandId', 'commandTs')
+
+class CommandJournal:
+    """Append-only SQLite (WAL) log of commands that couldn't be written
+
+    One row per light and field. Replay compacts the log so only the
+    latest value per light and field is sent; a successful live write for
+    the same light and field, or one skipped because the light already had
+    that value, drops the older journaled value so a later replay can't
+    undo it.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "light_id TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, "
+                           "queued_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS journal_key ON journal (light_id, field, seq)")
+        self.entries = self._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+        self.replayed = 0
+        self._replayed_at = deque()
+
+    def append(self, fields_by_light):
+        """Record commands for later replay"""
+        now = time.time()
+        rows = [(light_id, field, json.dumps(value), now)
+                for light_id, fields in fields_by_light.items()
+                for field, value in fields.items() if field not in COMMAND_TAG_FIELDS]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO journal (light_id, field, value, queued_at) VALUES (?, ?, ?, ?)",
+                                   rows)
+            self._conn.execute("COMMIT")
+            self.entries += len(rows)
+
+    def discard(self, fields_by_light):
+        """Drop journaled values superseded by a write that just succeeded"""
+        if not self.entries:
+            return
+        keys = [(light_id, field) for light_id, fields in fields_by_light.items()
+                for field in fields if field not in COMMAND_TAG_FIELDS]
+        self._delete("DELETE FROM journal WHERE light_id = ? AND field = ?", keys)
+
+    def _delete(self, sql, params):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(sql, params)
+            self._conn.execute("COMMIT")
+            self.entries = self._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def compacted(self, limit=JOURNAL_REPLAY_BATCH):
+        """({light_id: fields}, last seq) with the latest value per light and field, oldest lights first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT j.light_id, j.field, j.value, j.seq FROM journal j JOIN "
+                "(SELECT light_id FROM journal GROUP BY light_id ORDER BY MIN(seq) LIMIT ?) l "
+                "ON j.light_id = l.light_id ORDER BY j.seq", (limit,)).fetchall()
+        fields_by_light = {}
+        for light_id, field, value, _ in rows:
+            fields_by_light.setdefault(light_id, {})[field] = json.loads(value)
+        return fields_by_light, max((row[3] for row in rows), default=0)
+
+    def replay(self, writer, on_applied=None, limit=JOURNAL_REPLAY_BATCH):
+        """Send one compacted batch; returns the number of lights written"""
+        batch, last_seq = self.compacted(limit)
+        if not batch:
+            return 0
+        results = bulk_update_lights(batch, writer=writer, on_applied=on_applied)
+        written = [light_id for result in results if result.ok for light_id in result.light_ids]
+        # Entries appended while the batch was in flight stay for the next round
+        self._delete("DELETE FROM journal WHERE light_id = ? AND seq <= ?",
+                     [(light_id, last_seq) for light_id in written])
+        now = time.time()
+        with self._lock:
+            self.replayed += len(written)
+            self._replayed_at.extend([now] * len(written))
+        return len(written)
+
+    @property
+    def backlog_lights(self):
+        if not self.entries:
+            return 0
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT light_id) FROM journal").fetchone()[0]
+
+    @property
+    def drain_rate(self):
+        """Lights replayed per second over the last THROUGHPUT_WINDOW seconds"""
+        cutoff = time.time() - THROUGHPUT_WINDOW
+        with self._lock:
+            while self._replayed_at and self._replayed_at[0] < cutoff:
+                self._replayed_at.popleft()
+            return len(self._replayed_at) / THROUGHPUT_WINDOW
+
+
+class JournalReplayer:
+    """Background thread that drains the command journal once writes succeed again"""
+
+    def __init__(self, journal, writer, on_applied=None, interval=JOURNAL_REPLAY_INTERVAL):
+        self.journal = journal
+        self.writer = writer
+        self.on_applied = on_applied
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="journal-replayer")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Keep draining while batches go through; back off after a failure
+                while self.journal.entries and self.journal.replay(self.writer, self.on_applied):
+                    pass
+            except Exception:
+                logger.exception("Error replaying command journal")
+            self._stop.wait(self.interval)
+
+
+@st.cache_resource
+def get_command_journal():
+    """Process-wide command journal, with its replayer started"""
+    journal = CommandJournal(JOURNAL_PATH)
+    JournalReplayer(journal, get_write_executor(), get_fleet_store().apply_optimistic).start()
+    return journal
+
+
+# Command latency tracking
+def latency_percentiles(counts, percentiles=(50, 95, 99)):
+    """Percentiles (seconds, bucket upper edge) of a latency histogram"""
+    total = counts.sum()
+    if not total:
+        return [None] * len(percentiles)
+    cumulative = np.cumsum(counts)
+    buckets = np.searchsorted(cumulative, np.asarray(percentiles) / 100 * total)
+    # Bucket 0 holds latencies under the first edge, the last one everything above
+    edges = np.append(LATENCY_BUCKETS, np.inf)
+    return [float(edges[bucket]) for bucket in buckets]
+
+
+class CommandLatencyTracker:
+    """Measures how long commands take until the device reports the new state
+
+    Every control write carries a `commandId` and `commandTs`. The tracker
+    remembers the latest command per light and, as a FleetStore subscriber,
+    counts it acknowledged once the device has sent a fresh `timestamp` with
+    the commanded status/mode. Our own optimistic patches and the echo of
+    the write itself don't count. Latencies go into log-spaced histograms
+    for the fleet and for each light that has had a command.
+
+    Commands still waiting after `timeout` stop being watched and move to a
+    bounded record of the latest `kept` that were never acknowledged.
+    """
+
+    STATE_FIELDS = ('status', 'mode')
+
+    def __init__(self, store, timeout=COMMAND_ACK_TIMEOUT, kept=UNACKNOWLEDGED_KEPT):
+        self.store = store
+        self.timeout = timeout
+        self.fleet_counts = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.light_counts = {}
+        self.acknowledged = 0
+        self.superseded = 0
+        self.timed_out = 0
+        # Both in send order, oldest first
+        self._pending = OrderedDict()
+        self._never = OrderedDict()
+        self.kept = kept
+        self._lock = threading.Lock()
+
+    def tag(self, fields_by_light):
+        """Copies of the per-light fields carrying a new command ID and timestamp"""
+        tag = {'commandId': uuid.uuid4().hex, 'commandTs': int(time.time() * 1000)}
+        return {light_id: {**fields, **tag} for light_id, fields in fields_by_light.items()}
+
+    def sent(self, fields_by_light):
+        """Start waiting for the devices to apply tagged commands"""
+        store = self.store
+        # Read the baselines before taking our lock; subscribers are called
+        # with the store lock held, so the opposite order could deadlock
+        with store._lock:
+            baselines = {light_id: int(store.timestamp[store.index[light_id]])
+                         for light_id in fields_by_light if light_id in store.index}
+        with self._lock:
+            for light_id, baseline in baselines.items():
+                fields = fields_by_light[light_id]
+                expected = {field: fields[field] for field in self.STATE_FIELDS if field in fields}
+                if not expected:
+                    continue
+                if self._pending.pop(light_id, None) is not None:
+                    self.superseded += 1
+                self._never.pop(light_id, None)
+                self._pending[light_id] = (fields['commandId'], fields['commandTs'] / 1000,
+                                           expected, baseline)
+            self._expire(time.time())
+
+    def cancel(self, fields_by_light):
+        """Forget commands whose write failed"""
+        with self._lock:
+            for light_id, fields in fields_by_light.items():
+                pending = self._pending.get(light_id)
+                if pending is not None and pending[0] == fields.get('commandId'):
+                    del self._pending[light_id]
+
+    def observe(self, store, change):
+        """FleetStore subscriber: acknowledge commands the devices have applied"""
+        if change.origin == 'optimistic' or not self._pending:
+            return
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            for light_id, _ in change.removed:
+                self._pending.pop(light_id, None)
+            if len(change.ids) <= len(self._pending):
+                candidates = [light_id for light_id in change.ids if light_id in self._pending]
+            else:
+                candidates = [light_id for light_id in self._pending if light_id in store.index]
+            for light_id in candidates:
+                _, sent_at, expected, baseline = self._pending[light_id]
+                row = store.index[light_id]
+                if int(store.timestamp[row]) == baseline:
+                    continue
+                current = {'status': store.status_values[store.status[row]],
+                           'mode': store.mode_values[store.mode[row]]}
+                if all(current[field] == value for field, value in expected.items()):
+                    del self._pending[light_id]
+                    self._record(light_id, now - sent_at)
+
+    def _expire(self, now):
+        """Move commands older than the timeout to the never-acknowledged record"""
+        while self._pending:
+            light_id, (_, sent_at, _, _) = next(iter(self._pending.items()))
+            if now - sent_at <= self.timeout:
+                return
+            del self._pending[light_id]
+            self._never[light_id] = sent_at
+            self.timed_out += 1
+            if len(self._never) > self.kept:
+                self._never.popitem(last=False)
+
+    def _record(self, light_id, seconds):
+        bucket = np.searchsorted(LATENCY_BUCKETS, seconds)
+        self.fleet_counts[bucket] += 1
+        counts = self.light_counts.get(light_id)
+        if counts is None:
+            counts = self.light_counts[light_id] = np.zeros_like(self.fleet_counts)
+        counts[bucket] += 1
+        self.acknowledged += 1
+
+    def percentiles(self, light_id=None):
+        """[p50, p95, p99] in seconds for the fleet or one light (None if no data)"""
+        with self._lock:
+            counts = self.fleet_counts if light_id is None else self.light_counts.get(light_id)
+            if counts is None:
+                return [None, None, None]
+            return latency_percentiles(counts)
+
+    def unacknowledged(self):
+        """{light_id: seconds since the command} for the latest commands never acknowledged"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            return {light_id: now - sent_at for light_id, sent_at in reversed(self._never.items())}
+
+    def waiting(self, light_id):
+        """Seconds since a light's never-acknowledged command, or None"""
+        with self._lock:
+            self._expire(time.time())
+            sent_at = self._never.get(light_id)
+        return None if sent_at is None else time.time() - sent_at
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+
+@st.cache_resource
+def get_latency_tracker():
+    """Process-wide latency tracker subscribed to the fleet store"""
+    store = get_fleet_store()
+    tracker = CommandLatencyTracker(store)
+    store.subscribe(tracker.observe)
+    return tracker
+
+def write_light_command(light_id, fields, force=False):
+    """Tagged single-light write, patched into the snapshot and tracked
+
+    Returns False without writing when the light already matches, unless
+    `force` is set.
+    """
+    if not force and get_fleet_store().matches(light_id, fields):
+        get_write_executor().record_elided()
+        # A journaled older command would undo this one on replay
+        get_command_journal().discard({light_id: fields})
+        return False
+    tracker = get_latency_tracker()
+    tagged = tracker.tag({light_id: fields})
+    tracker.sent(tagged)
     try:
-        ref = db.reference('streetlights')
-        data = ref.get()
-        
-        if data:
-            lights = []
-            for light_id, light_data in data.items():
-                light_info = {
-                    'ID': light_id,
-                    'Status': light_data.get('status', 'off'),
-                    'Mode': light_data.get('mode', 'automatic'),
-                    'Is Dark': light_data.get('isDark', False),
-                    'Motion Detected': light_data.get('motionDetected', False),
-                    'Online': light_data.get('online', False),
-                    'Last Update': light_data.get('lastUpdate', ''),
-                    'Timestamp': light_data.get('timestamp', 0)
-                }
-                lights.append(light_info)
-            return pd.DataFrame(lights)
-        return pd.DataFrame()
+        get_write_executor().update(f'streetlights/{light_id}', tagged[light_id])
     except Exception as e:
-        st.error(f"Error fetching data: {e}")
-        return pd.DataFrame()
+        tracker.cancel(tagged)
+        if is_transient_write_error(e):
+            get_command_journal().append({light_id: fields})
+        raise
+    get_command_journal().discard(tagged)
+    get_fleet_store().apply_optimistic(tagged)
+    return True
+
 
 # Control functions
-def set_light_mode(light_id, mode):
+def set_light_mode(light_id, mode, force=False):
     """Set streetlight mode"""
     try:
-        ref = db.reference(f'streetlights/{light_id}')
-        ref.update({'mode': mode})
+        write_light_command(light_id, {'mode': mode}, force)
         return True
     except Exception as e:
-        st.error(f"Error setting mode: {e}")
+        if is_transient_write_error(e):
+            st.warning(f"Database unreachable - mode change saved and will be sent when it's back ({e})")
+        else:
+            st.error(f"Error setting mode: {e}")
         return False
 
-def set_manual_state(light_id, state):
+def set_manual_state(light_id, state, force=False):
     """Set manual state for streetlight"""
     try:
-        ref = db.reference(f'streetlights/{light_id}')
-        ref.update({
+        fields = {
             'manualState': state,
             'status': 'on' if state else 'off'
-        })
+        }
+        write_light_command(light_id, fields, force)
         return True
     except Exception as e:
-        st.error(f"Error setting state: {e}")
+        if is_transient_write_error(e):
+            st.warning(f"Database unreachable - state change saved and will be sent when it's back ({e})")
+        else:
+            st.error(f"Error setting state: {e}")
         return False
 
+
+# Bulk control functions
+ChunkResult = namedtuple('ChunkResult', 'index light_ids paths ok error seconds')
+
+
+class BulkWriteResults(list):
+    """ChunkResults of one bulk write, plus the lights skipped as no-ops and
+    the failed ones saved to the command journal"""
+
+    def __init__(self, results=(), elided=(), journaled=()):
+        super().__init__(results)
+        self.elided = list(elided)
+        self.journaled = list(journaled)
+
+def chunk_light_updates(fields_by_light, max_payload_bytes=MAX_BULK_PAYLOAD_BYTES):
+    """Split per-light field updates into root-level multi-path chunks
+
+    Yields (light_ids, updates) where `updates` maps
+    'streetlights/<id>/<field>' to the new value and its JSON encoding stays
+    under `max_payload_bytes`. A light's fields always travel together.
+    """
+    light_ids, updates, size = [], {}, 2
+    for light_id, fields in fields_by_light.items():
+        entries = {f'streetlights/{light_id}/{field}': value for field, value in fields.items()}
+        # The entries' own braces are dropped in the merged payload; their two
+        # bytes pay for the ', ' that separates them from the previous light
+        entry_size = len(json.dumps(entries))
+        if updates and size + entry_size > max_payload_bytes:
+            yield light_ids, updates
+            light_ids, updates, size = [], {}, 2
+        light_ids.append(light_id)
+        updates.update(entries)
+        size += entry_size
+    if updates:
+        yield light_ids, updates
+
+def bulk_update_lights(fields_by_light, max_payload_bytes=MAX_BULK_PAYLOAD_BYTES, writer=None,
+                       on_applied=None, tracker=None, snapshot=None, journal=None):
+    """Write per-light field updates as chunked multi-path updates from the root
+
+    Chunks are sent concurrently through `writer` (a WriteExecutor, by
+    default the process-wide one), which retries transient failures.
+    Returns one ChunkResult per chunk; a failed chunk doesn't stop the rest.
+    `on_applied` is called with the {light_id: fields} of each chunk that
+    was written, e.g. to patch the local fleet snapshot. With a `tracker`
+    the writes are tagged as commands and their acknowledgement is timed.
+    Lights that already match in `snapshot` (a FleetStore) are skipped and
+    listed in the result's `elided`; pass no snapshot to force the write.
+    With a `journal` (CommandJournal), chunks that fail on a transient error
+    are saved for replay and listed in `journaled`, and journaled values
+    for lights that are written or skipped are dropped.
+    """
+    writer = writer or get_write_executor()
+    elided = []
+    if snapshot is not None:
+        elided = [light_id for light_id, fields in fields_by_light.items()
+                  if snapshot.matches(light_id, fields)]
+        if elided:
+            if journal is not None:
+                journal.discard({light_id: fields_by_light[light_id] for light_id in elided})
+            skip = set(elided)
+            fields_by_light = {light_id: fields for light_id, fields in fields_by_light.items()
+                               if light_id not in skip}
+            writer.record_elided(len(elided))
+    if tracker is not None:
+        fields_by_light = tracker.tag(fields_by_light)
+    started = time.perf_counter()
+    submitted = []
+    for light_ids, updates in chunk_light_updates(fields_by_light, max_payload_bytes):
+        chunk = {light_id: fields_by_light[light_id] for light_id in light_ids}
+        if tracker is not None:
+            tracker.sent(chunk)
+        submitted.append((chunk, len(updates), writer.submit('/', updates)))
+    results, journaled = [], []
+    for index, (chunk, paths, future) in enumerate(submitted):
+        error = future.exception()
+        if error is None:
+            if journal is not None:
+                journal.discard(chunk)
+            if on_applied is not None:
+                on_applied(chunk)
+        else:
+            if tracker is not None:
+                tracker.cancel(chunk)
+            if journal is not None and is_transient_write_error(error):
+                journal.append(chunk)
+                journaled.extend(chunk)
+        results.append(ChunkResult(index, list(chunk), paths, error is None, error,
+                                   time.perf_counter() - started))
+    return BulkWriteResults(results, elided, journaled)
+
+def set_light_mode_bulk(light_ids, mode, max_payload_bytes=MAX_BULK_PAYLOAD_BYTES, force=False):
+    """Set the mode of many streetlights in chunked multi-path writes"""
+    store = get_fleet_store()
+    return bulk_update_lights({light_id: {'mode': mode} for light_id in light_ids},
+                              max_payload_bytes, on_applied=store.apply_optimistic,
+                              tracker=get_latency_tracker(), snapshot=None if force else store,
+                              journal=get_command_journal())
+
+def set_manual_state_bulk(light_ids, state, max_payload_bytes=MAX_BULK_PAYLOAD_BYTES, force=False):
+    """Set the manual state of many streetlights in chunked multi-path writes"""
+    fields = {'manualState': state, 'status': 'on' if state else 'off'}
+    store = get_fleet_store()
+    return bulk_update_lights({light_id: fields for light_id in light_ids}, max_payload_bytes,
+                              on_applied=store.apply_optimistic, tracker=get_latency_tracker(),
+                              snapshot=None if force else store, journal=get_command_journal())
+
+
+# Asynchronous command queue
+class CommandHandle:
+    """Tracks one queued command until the batch carrying it is written"""
+
+    def __init__(self, light_id, fields):
+        self.light_id = light_id
+        self.fields = dict(fields)
+        self.submitted_at = time.time()
+        self.completed_at = None
+        self.ok = None
+        self.error = None
+        self.coalesced = False
+        self.elided = False
+        self.journaled = False
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def status(self):
+        if not self.done:
+            return "pending"
+        if self.journaled:
+            return "journaled"
+        return "applied" if self.ok else "failed"
+
+    def wait(self, timeout=None):
+        """Block until written (only for scripts; the UI should poll `done`)"""
+        return self._done.wait(timeout)
+
+    def _finish(self, ok, error=None):
+        self.ok = ok
+        self.error = error
+        self.completed_at = time.time()
+        self._done.set()
+
+
+class CommandQueue:
+    """Coalesces control commands per light and field, then writes them in batches
+
+    The first command after an idle period opens a `window`-second batch.
+    Commands for the same light and field inside the window replace each
+    other, so only the last value is written; every submitter still gets a
+    handle that completes when the batch lands.
+    """
+
+    def __init__(self, writer, window=COMMAND_COALESCE_WINDOW, on_applied=None, tracker=None,
+                 snapshot=None, journal=None):
+        self.writer = writer
+        self.journal = journal
+        self.window = window
+        self.on_applied = on_applied
+        self.tracker = tracker
+        self.snapshot = snapshot
+        self.submitted = 0
+        self.written = 0
+        self._pending = {}
+        self._handles = {}
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True, name="command-queue").start()
+
+    def submit(self, light_id, fields, force=False):
+        """Queue a field update for one light; returns a CommandHandle
+
+        A command that wouldn't change the light (per `snapshot`, and with
+        nothing else queued for it) completes at once without a write.
+        """
+        handle = CommandHandle(light_id, fields)
+        with self._cond:
+            if (not force and self.snapshot is not None and light_id not in self._pending
+                    and self.snapshot.matches(light_id, fields)):
+                self.submitted += 1
+                self.writer.record_elided()
+                if self.journal is not None:
+                    self.journal.discard({light_id: fields})
+                handle.elided = True
+                handle._finish(True)
+                return handle
+            pending = self._pending.setdefault(light_id, {})
+            for handle_waiting in self._handles.get(light_id, []):
+                if set(handle_waiting.fields) <= set(fields):
+                    handle_waiting.coalesced = True
+            pending.update(fields)
+            self._handles.setdefault(light_id, []).append(handle)
+            self.submitted += 1
+            self._cond.notify()
+        return handle
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Let the window fill up before taking the batch
+            time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                handles, self._handles = self._handles, {}
+            self._flush(batch, handles)
+
+    def _flush(self, batch, handles):
+        try:
+            results = bulk_update_lights(batch, writer=self.writer, on_applied=self.on_applied,
+                                         tracker=self.tracker, journal=self.journal)
+        except Exception as e:
+            results = BulkWriteResults([ChunkResult(0, list(batch), 0, False, e, 0.0)])
+        journaled = set(results.journaled)
+        for result in results:
+            if result.ok:
+                self.written += len(result.light_ids)
+            for light_id in result.light_ids:
+                for handle in handles.get(light_id, []):
+                    handle.journaled = light_id in journaled
+                    handle._finish(result.ok, result.error)
+
+
+@st.cache_resource
+def get_command_queue():
+    """Process-wide command queue shared by every session"""
+    store = get_fleet_store()
+    return CommandQueue(get_write_executor(), on_applied=store.apply_optimistic,
+                        tracker=get_latency_tracker(), snapshot=store, journal=get_command_journal())
+
+def queue_light_mode(light_id, mode, force=False):
+    """Queue a mode change; returns a CommandHandle"""
+    return get_command_queue().submit(light_id, {'mode': mode}, force)
+
+def queue_manual_state(light_id, state, force=False):
+    """Queue a manual on/off command; returns a CommandHandle"""
+    return get_command_queue().submit(light_id, {'manualState': state, 'status': 'on' if state else 'off'},
+                                      force)
+
+
+# Light groups
+GROUP_FILTERS = {
+    "All offline": lambda df: ~df['Online'].fillna(False),
+    "All online": lambda df: df['Online'].fillna(False),
+    "All manual": lambda df: df['Mode'] == 'manual',
+    "All automatic": lambda df: df['Mode'] == 'automatic',
+    "On while bright": lambda df: (df['Status'] == 'on') & ~df['Is Dark'].fillna(False),
+    "Off while dark": lambda df: (df['Status'] == 'off') & df['Is Dark'].fillna(False),
+}
+INVALID_KEY_CHARACTERS = set('.$#[]/')
+
+def match_light_ids(df, pattern):
+    """IDs matching a glob pattern (e.g. 'north_*'), or a plain prefix"""
+    pattern = pattern.strip()
+    if not pattern:
+        return []
+    ids = df['ID'].astype(str)
+    if any(ch in pattern for ch in '*?['):
+        matches = ids.str.match(fnmatch.translate(pattern))
+    else:
+        matches = ids.str.startswith(pattern)
+    return df.loc[matches.to_numpy(), 'ID'].tolist()
+
+def filter_light_ids(df, name):
+    """IDs selected by one of GROUP_FILTERS"""
+    return df.loc[np.asarray(GROUP_FILTERS[name](df), dtype=bool), 'ID'].tolist()
+
+class LightGroups:
+    """Saved groups held in process and kept current by a database listener
+
+    Renders read the cached copy; the listener (or, where listening isn't
+    available, a save or delete from this process) re-reads the groups
+    off the render thread.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.groups = {}
+        self._lock = threading.Lock()
+        try:
+            backend.listen('groups', self._on_event)
+        except Exception:
+            logger.exception("Group listener unavailable, groups refresh on save only")
+            self.reload()
+
+    def _on_event(self, event):
+        if event.event_type == 'put' and event.path == '/':
+            self._set(event.data)
+        else:
+            self.reload()
+
+    def reload(self):
+        self._set(self.backend.get('groups'))
+
+    def _set(self, groups):
+        groups = {name: sorted(members) for name, members in (groups or {}).items()
+                  if isinstance(members, dict)}
+        with self._lock:
+            self.groups = groups
+
+    def get(self):
+        """Saved groups as {name: [light ids]}"""
+        with self._lock:
+            return dict(self.groups)
+
+
+@st.cache_resource
+def get_light_groups():
+    """Process-wide saved groups"""
+    return LightGroups(get_backend())
+
+def load_light_groups():
+    """Saved groups as {name: [light ids]}, from the in-process copy"""
+    return get_light_groups().get()
+
+def save_light_group(name, light_ids):
+    """Save (or replace) a named group of lights"""
+    name = name.strip()
+    if not name or INVALID_KEY_CHARACTERS.intersection(name):
+        raise ValueError("Group names can't be empty or contain . $ # [ ] /")
+    get_backend().update('groups', {name: {light_id: True for light_id in light_ids}})
+    get_light_groups().reload()
+
+def delete_light_group(name):
+    """Remove a saved group"""
+    get_backend().update('groups', {name: None})
+    get_light_groups().reload()
+
+def save_light_wattage(light_ids, watts):
+    """Set the wattage used for energy accounting of some lights"""
+    if watts <= 0:
+        raise ValueError("Wattage must be positive")
+    wattage = {light_id: float(watts) for light_id in light_ids}
+    get_backend().update('wattage', wattage)
+    get_energy_meter().set_wattage(wattage)
+
+# Schedules
+SCHEDULE_TRIGGERS = ('time', 'sunset', 'sunrise')
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+ScheduleFiring = namedtuple('ScheduleFiring', 'name fired_at lights failed seconds error elided')
+
+def site_location():
+    """(latitude, longitude) from the environment, or None if not configured"""
+    try:
+        return float(SITE_LATITUDE), float(SITE_LONGITUDE)
+    except (TypeError, ValueError):
+        return None
+
+def sun_times(day, latitude, longitude):
+    """(sunrise, sunset) as UTC datetimes for a date; None when the sun doesn't cross the horizon
+
+    Uses the standard sunrise equation, accurate to about a minute.
+    """
+    cycle = math.ceil((day - J2000.date()).days - 0.5 + 0.0008)
+    mean_noon = cycle - longitude / 360
+    anomaly = math.radians((357.5291 + 0.98560028 * mean_noon) % 360)
+    center = 1.9148 * math.sin(anomaly) + 0.02 * math.sin(2 * anomaly) + 0.0003 * math.sin(3 * anomaly)
+    ecliptic = math.radians((math.degrees(anomaly) + center + 180 + 102.9372) % 360)
+    transit = mean_noon + 0.0053 * math.sin(anomaly) - 0.0069 * math.sin(2 * ecliptic)
+    declination = math.asin(math.sin(ecliptic) * math.sin(math.radians(23.4397)))
+    phi = math.radians(latitude)
+    cos_hour_angle = ((math.sin(math.radians(-0.833)) - math.sin(phi) * math.sin(declination))
+                      / (math.cos(phi) * math.cos(declination)))
+    if not -1 <= cos_hour_angle <= 1:
+        return None
+    hour_angle = math.degrees(math.acos(cos_hour_angle)) / 360
+    return (J2000 + timedelta(days=transit - hour_angle), J2000 + timedelta(days=transit + hour_angle))
+
+def next_fire_time(schedule, after, location=None):
+    """Epoch seconds of a schedule's first firing after `after`, or None
+
+    Fixed times are server-local wall-clock times; sunrise/sunset need the
+    site `location` and are shifted by `offsetMinutes`.
+    """
+    days = [int(d) for d in schedule.get('days', '0123456')]
+    start = datetime.fromtimestamp(after).date()
+    for delta in range(8):
+        day = start + timedelta(days=delta)
+        if day.weekday() not in days:
+            continue
+        if schedule['trigger'] == 'time':
+            hour, minute = (int(part) for part in schedule['time'].split(':'))
+            fire_at = datetime.combine(day, clock_time(hour, minute)).timestamp()
+        else:
+            times = sun_times(day, *location) if location else None
+            if times is None:
+                continue
+            sun = times[0] if schedule['trigger'] == 'sunrise' else times[1]
+            fire_at = sun.timestamp() + 60 * int(schedule.get('offsetMinutes', 0))
+        if fire_at > after:
+            return fire_at
+    return None
+
+def schedule_fields(schedule):
+    """Fields a schedule writes to each targeted light"""
+    fields = {}
+    if schedule.get('mode'):
+        fields['mode'] = schedule['mode']
+    if schedule.get('manualState') is not None:
+        fields['manualState'] = schedule['manualState']
+        fields['status'] = 'on' if schedule['manualState'] else 'off'
+    return fields
+
+def resolve_schedule_targets(schedule, df, groups):
+    """Light IDs a schedule applies to right now
+
+    On/off-only schedules skip lights in automatic mode, like group control.
+    """
+    target = schedule.get('target', {})
+    if target.get('type') == 'group':
+        light_ids = df.loc[df['ID'].isin(groups.get(target.get('value'), [])), 'ID'].tolist()
+    else:
+        light_ids = match_light_ids(df, target.get('value', ''))
+    if schedule.get('manualState') is not None and not schedule.get('mode'):
+        manual = set(df.loc[(df['Mode'] == 'manual').to_numpy(), 'ID'])
+        light_ids = [light_id for light_id in light_ids if light_id in manual]
+    return light_ids
+
+def describe_schedule(schedule):
+    """One-line summary of when a schedule fires"""
+    if schedule['trigger'] == 'time':
+        when = f"at {schedule['time']}"
+    else:
+        offset = int(schedule.get('offsetMinutes', 0))
+        when = f"{schedule['trigger']} {offset:+d} min" if offset else f"at {schedule['trigger']}"
+    days = schedule.get('days', '0123456')
+    if len(days) < 7:
+        when += " on " + ", ".join(WEEKDAYS[int(d)] for d in days)
+    return when
+
+
+class LightScheduler:
+    """Background thread that fires saved schedules
+
+    Schedules live under 'schedules/<name>' in the backend. Their next fire
+    times sit in a heap; the thread sleeps until the earliest one, resolves
+    its targets against the fleet store and sends a single chunked
+    multi-path write. Call `reload()` after schedules change.
+    """
+
+    def __init__(self, backend, store, writer, tracker=None, location=None, journal=None):
+        self.backend = backend
+        self.store = store
+        self.writer = writer
+        self.journal = journal
+        self.tracker = tracker
+        self.location = location
+        self.schedules = {}
+        self.next_fire = {}
+        self.history = deque(maxlen=RECENT_FIRINGS_SHOWN)
+        self._heap = []
+        self._cond = threading.Condition()
+        self.reload()
+        threading.Thread(target=self._run, daemon=True, name="light-scheduler").start()
+
+    def reload(self):
+        """Re-read the schedules and rebuild the fire-time queue"""
+        schedules = self.backend.get('schedules') or {}
+        now = time.time()
+        with self._cond:
+            self.schedules = {name: schedule for name, schedule in schedules.items()
+                              if isinstance(schedule, dict) and schedule.get('enabled', True)}
+            self._heap, self.next_fire = [], {}
+            for name, schedule in self.schedules.items():
+                self._push(name, schedule, now)
+            self._cond.notify()
+
+    def _push(self, name, schedule, after):
+        try:
+            fire_at = next_fire_time(schedule, after, self.location)
+        except Exception:
+            logger.exception("Error in schedule %s", name)
+            fire_at = None
+        if fire_at is not None:
+            self.next_fire[name] = fire_at
+            heapq.heappush(self._heap, (fire_at, name))
+        else:
+            self.next_fire.pop(name, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                fire_at, name = heapq.heappop(self._heap)
+                schedule = self.schedules.get(name)
+                if schedule is None or self.next_fire.get(name) != fire_at:
+                    continue  # deleted or rescheduled since it was queued
+                self._push(name, schedule, fire_at)
+            self.fire(name, schedule)
+
+    def fire(self, name, schedule):
+        """Apply one schedule now; returns its ScheduleFiring"""
+        started = time.perf_counter()
+        try:
+            groups = {}
+            if schedule.get('target', {}).get('type') == 'group':
+                groups = {group: list(members) for group, members in
+                          (self.backend.get('groups') or {}).items() if isinstance(members, dict)}
+            light_ids = resolve_schedule_targets(schedule, self.store.frame(), groups)
+            fields = schedule_fields(schedule)
+            results = bulk_update_lights({light_id: fields for light_id in light_ids}, writer=self.writer,
+                                         on_applied=self.store.apply_optimistic, tracker=self.tracker,
+                                         snapshot=None if schedule.get('force') else self.store,
+                                         journal=self.journal)
+            failed = [result for result in results if not result.ok]
+            firing = ScheduleFiring(name, time.time(), len(light_ids),
+                                    sum(len(result.light_ids) for result in failed),
+                                    time.perf_counter() - started, failed[0].error if failed else None,
+                                    len(results.elided))
+        except Exception as e:
+            firing = ScheduleFiring(name, time.time(), 0, 0, time.perf_counter() - started, e, 0)
+        self.history.append(firing)
+        return firing
+
+
+@st.cache_resource
+def get_scheduler():
+    """Process-wide scheduler, started with the collector"""
+    return LightScheduler(get_backend(), get_fleet_store(), get_write_executor(), get_latency_tracker(),
+                          site_location(), get_command_journal())
+
+def save_schedule(name, schedule):
+    """Save (or replace) a named schedule and requeue"""
+    name = name.strip()
+    if not name or INVALID_KEY_CHARACTERS.intersection(name):
+        raise ValueError("Schedule names can't be empty or contain . $ # [ ] /")
+    if not schedule_fields(schedule):
+        raise ValueError("A schedule must set a mode or an on/off state")
+    if not schedule.get('days', '0123456'):
+        raise ValueError("A schedule must run on at least one day")
+    get_backend().update('schedules', {name: schedule})
+    get_scheduler().reload()
+
+def delete_schedule(name):
+    """Remove a saved schedule"""
+    get_backend().update('schedules', {name: None})
+    get_scheduler().reload()
+
 # Main dashboard
 def main_dashboard():
     """Main dashboard interface"""
@@ -169,37 +3326,201 @@ def main_dashboard():
         
         st.markdown("---")
         st.markdown("### Navigation")
-        page = st.radio("Select Page", ["Overview", "Control Panel", "Analytics", "Settings"])
+        page = st.radio("Select Page", ["Overview", "Control Panel", "Analytics", "Events", "Settings"])
         
         st.markdown("---")
         if st.button("🚪 Logout", use_container_width=True):
             st.session_state["password_correct"] = False
             st.rerun()
     
-    # Auto-refresh
-    placeholder = st.empty()
+    # Auto-refresh: re-render from the latest snapshot; fetching happens in
+    # the background collector, independent of this interval. Queued
+    # commands switch to a short interval until they have been written.
+    polling = commands_pending()
     
-    while True:
-        with placeholder.container():
-            # Fetch data
-            df = get_streetlight_data()
-            
-            if df.empty:
-                st.warning("No streetlight data available")
-                time.sleep(refresh_rate)
-                continue
-            
-            if page == "Overview":
-                show_overview(df)
-            elif page == "Control Panel":
-                show_control_panel(df)
-            elif page == "Analytics":
-                show_analytics(df)
-            elif page == "Settings":
-                show_settings()
+    @st.fragment(run_every=COMMAND_POLL_INTERVAL if polling else refresh_rate)
+    def render():
+        if polling and not commands_pending():
+            # Back to the normal interval, which needs a full rerun to change
+            st.rerun(scope="app")
+        source = get_fleet_source()
+        df = get_streetlight_data(source)
+        show_data_freshness(source)
         
-        time.sleep(refresh_rate)
-        st.rerun()
+        if df.empty:
+            st.warning("No streetlight data available")
+            return
+        
+        if page == "Overview":
+            show_overview(df)
+        elif page == "Control Panel":
+            show_control_panel(df)
+        elif page == "Analytics":
+            show_analytics(df)
+        elif page == "Events":
+            show_events()
+        elif page == "Settings":
+            show_settings()
+    
+    render()
+
+# Page metrics and figures (kept free of Streamlit calls so they can be benchmarked)
+def category_codes(series, values):
+    """A column as codes into `values` (-1 for anything else), without copying categoricals"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        remap = np.array([value_code(values, v) for v in series.cat.categories] + [-1], dtype=np.int16)
+        return remap[series.cat.codes.to_numpy()]
+    return np.array([value_code(values, v) for v in series], dtype=np.int16)
+
+def count_fleet(df):
+    """Cold-start fallback for FleetCounters: every count in one pass over a frame"""
+    if df.empty:
+        return dict.fromkeys(COUNTER_KEYS, 0)
+    flags = np.zeros(len(df), dtype=np.uint8)
+    for column, bit in (('Is Dark', FLAG_DARK), ('Motion Detected', FLAG_MOTION), ('Online', FLAG_ONLINE)):
+        flags |= df[column].to_numpy(dtype=bool, na_value=False).astype(np.uint8) * np.uint8(bit)
+    counts = count_states(category_codes(df['Status'], STATUS_VALUES), category_codes(df['Mode'], MODE_VALUES),
+                          flags, STATUS_VALUES, MODE_VALUES)
+    return dict(zip(COUNTER_KEYS, counts.tolist()))
+
+# Cross-filter dimensions: (label, FLAG bit, label when set, label when clear)
+CUBE_DIMENSIONS = (
+    ("Status", FLAG_ON, "On", "Off"),
+    ("Mode", FLAG_MANUAL, "Manual", "Automatic"),
+    ("Light level", FLAG_DARK, "Dark", "Bright"),
+    ("Motion", FLAG_MOTION, "Detected", "None"),
+    ("Connection", FLAG_ONLINE, "Online", "Offline"),
+)
+STATE_CELL_CODES = np.arange(STATE_CELLS, dtype=np.uint8)
+
+def cube_mask(filters):
+    """Boolean mask over the 32 state cells for {FLAG bit: required value}"""
+    mask = np.ones(STATE_CELLS, dtype=bool)
+    for bit, wanted in filters.items():
+        mask &= ((STATE_CELL_CODES & bit) != 0) == wanted
+    return mask
+
+def frame_state_bytes(df):
+    """Each row's FLAG state byte, computed from the frame's own columns"""
+    flags = np.zeros(len(df), dtype=np.uint8)
+    for column, bit in (('Is Dark', FLAG_DARK), ('Motion Detected', FLAG_MOTION), ('Online', FLAG_ONLINE)):
+        flags |= df[column].to_numpy(dtype=bool, na_value=False).astype(np.uint8) * np.uint8(bit)
+    flags |= (df['Status'] == 'on').to_numpy(dtype=bool).astype(np.uint8) * np.uint8(FLAG_ON)
+    flags |= (df['Mode'] == 'manual').to_numpy(dtype=bool).astype(np.uint8) * np.uint8(FLAG_MANUAL)
+    return flags
+
+def cube_count(cube, filters):
+    """Lights matching every condition in `filters`, from the state cube"""
+    return int(cube[cube_mask(filters)].sum())
+
+def cross_filter_counts(cube, filters):
+    """{bit: (count if set, count if clear)} for each dimension under the other filters"""
+    counts = {}
+    for _, bit, _, _ in CUBE_DIMENSIONS:
+        others = {other: wanted for other, wanted in filters.items() if other != bit}
+        counts[bit] = (cube_count(cube, {**others, bit: True}), cube_count(cube, {**others, bit: False}))
+    return counts
+
+def compute_overview_metrics(df, counts=None):
+    """Headline counts for the Overview page, from FleetCounters or one pass over `df`"""
+    counts = counts if counts is not None else count_fleet(df)
+    return {
+        'total': counts['total'],
+        'on': counts['on'],
+        'off': counts['total'] - counts['on'],
+        'online': counts['online']
+    }
+
+def compute_analytics_metrics(df, counts=None):
+    """Counts behind the Analytics bar charts and efficiency metrics"""
+    counts = counts if counts is not None else count_fleet(df)
+    return {key: counts[key] for key in
+            ('total', 'dark', 'motion', 'automatic', 'online', 'energy_efficient')}
+
+def build_distribution_pie(counts, color_map):
+    """Donut chart of value counts"""
+    fig = px.pie(
+        values=counts.values,
+        names=counts.index,
+        color=counts.index,
+        color_discrete_map=color_map,
+        hole=0.4
+    )
+    fig.update_layout(height=300)
+    return fig
+
+def local_times(timestamps_ms):
+    """Epoch-millisecond timestamps as naive local datetimes"""
+    local_tz = datetime.now().astimezone().tzinfo
+    return pd.to_datetime(timestamps_ms, unit='ms', utc=True).dt.tz_convert(local_tz).dt.tz_localize(None)
+
+def build_status_timeline(df):
+    """Each light's last report time, one marker trace per status colour"""
+    timeline_data = df.sort_values('Timestamp')
+    is_on = (timeline_data['Status'] == 'on').to_numpy()
+    fig = go.Figure()
+    for mask, color in ((is_on, 'green'), (~is_on, 'red')):
+        lights = timeline_data[mask]
+        fig.add_trace(go.Scatter(
+            x=local_times(lights['Timestamp']),
+            y=lights['ID'],
+            mode='markers',
+            marker=dict(size=15, color=color),
+            hovertext=lights['ID'],
+            showlegend=False
+        ))
+    fig.update_layout(
+        height=400,
+        xaxis_title="Time",
+        yaxis_title="Streetlight ID",
+        hovermode='closest'
+    )
+    return fig
+
+def build_history_chart(series):
+    """Fleet history lines (lights reporting, online, on, dark) over local time"""
+    x = local_times(pd.Series(series.index.to_numpy(dtype='datetime64[ms]').astype(np.int64)))
+    fig = go.Figure()
+    for column, color in (('Lights', 'gray'), ('Online', 'blue'), ('On', 'green'), ('Dark', 'indigo')):
+        if column not in series:
+            continue
+        fig.add_trace(go.Scatter(x=x, y=series[column], mode='lines', name=column,
+                                 line=dict(color=color, shape='hv')))
+    fig.update_layout(height=350, xaxis_title="Time", yaxis_title="Lights", hovermode='x unified')
+    return fig
+
+def build_sparkline(times, values, color, labels=("Off", "On")):
+    """Tiny step chart of a boolean signal"""
+    fig = go.Figure(go.Scatter(x=times, y=np.asarray(values, dtype=int), mode='lines',
+                               line=dict(color=color, shape='hv', width=2), fill='tozeroy',
+                               hoverinfo='x+y'))
+    fig.update_layout(height=90, margin=dict(l=0, r=0, t=0, b=0), showlegend=False,
+                      xaxis=dict(visible=False),
+                      yaxis=dict(range=[-0.1, 1.1], tickvals=[0, 1], ticktext=list(labels)))
+    return fig
+
+def build_energy_bars(daily):
+    """Daily kWh bars with burn-hours on hover"""
+    fig = go.Figure(go.Bar(x=daily['Day'], y=daily['kWh'], marker_color='goldenrod',
+                           customdata=daily['Burn hours'],
+                           hovertemplate='%{x|%b %d}: %{y:,.1f} kWh · %{customdata:,.0f} burn-hours<extra></extra>'))
+    fig.update_layout(height=250, margin=dict(l=0, r=0, t=10, b=0), yaxis_title='kWh')
+    return fig
+
+def build_event_bars(counts):
+    """Horizontal bar chart of event counts by type"""
+    fig = go.Figure(go.Bar(x=counts.values, y=counts.index, orientation='h', marker_color='steelblue'))
+    fig.update_layout(height=max(150, 30 * len(counts)), margin=dict(l=0, r=0, t=10, b=0))
+    return fig
+
+def build_pair_bars(x_label, first, second):
+    """Grouped bar chart of two (name, count, colour) series"""
+    fig = go.Figure(data=[
+        go.Bar(name=name, x=[x_label], y=[count], marker_color=color)
+        for name, count, color in (first, second)
+    ])
+    fig.update_layout(height=300, barmode='group')
+    return fig
 
 def show_overview(df):
     """Overview page"""
@@ -207,10 +3528,11 @@ def show_overview(df):
     # Key metrics
     col1, col2, col3, col4 = st.columns(4)
     
-    total_lights = len(df)
-    lights_on = len(df[df['Status'] == 'on'])
-    lights_off = total_lights - lights_on
-    online_lights = len(df[df['Online'] == True])
+    metrics = compute_overview_metrics(df, get_fleet_counters().snapshot())
+    total_lights = metrics['total']
+    lights_on = metrics['on']
+    lights_off = metrics['off']
+    online_lights = metrics['online']
     
     with col1:
         st.metric("Total Streetlights", total_lights, delta=None)
@@ -223,33 +3545,21 @@ def show_overview(df):
     
     st.markdown("---")
     
+    show_cross_filter(df)
+    
+    st.markdown("---")
+    
     # Charts
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Status Distribution")
-        status_counts = df['Status'].value_counts()
-        fig = px.pie(
-            values=status_counts.values,
-            names=status_counts.index,
-            color=status_counts.index,
-            color_discrete_map={'on': '#00CC96', 'off': '#EF553B'},
-            hole=0.4
-        )
-        fig.update_layout(height=300)
+        fig = build_distribution_pie(df['Status'].value_counts(), STATUS_COLORS)
         st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         st.subheader("Mode Distribution")
-        mode_counts = df['Mode'].value_counts()
-        fig = px.pie(
-            values=mode_counts.values,
-            names=mode_counts.index,
-            color=mode_counts.index,
-            color_discrete_map={'automatic': '#636EFA', 'manual': '#AB63FA'},
-            hole=0.4
-        )
-        fig.update_layout(height=300)
+        fig = build_distribution_pie(df['Mode'].value_counts(), MODE_COLORS)
         st.plotly_chart(fig, use_container_width=True)
     
     st.markdown("---")
@@ -258,30 +3568,175 @@ def show_overview(df):
     st.subheader("All Streetlights")
     
     # Format dataframe
-    display_df = df.copy()
-    display_df['Status'] = display_df['Status'].apply(lambda x: '🟢 ON' if x == 'on' else '🔴 OFF')
-    display_df['Online'] = display_df['Online'].apply(lambda x: '✅ Online' if x else '❌ Offline')
-    display_df['Is Dark'] = display_df['Is Dark'].apply(lambda x: '🌙 Dark' if x else '☀️ Bright')
-    display_df['Motion Detected'] = display_df['Motion Detected'].apply(lambda x: '🏃 Yes' if x else '🚶 No')
+    # (only the displayed columns are materialised; df itself is shared)
+    display_df = pd.DataFrame({
+        'ID': df['ID'],
+        'Status': np.where(df['Status'] == 'on', '🟢 ON', '🔴 OFF'),
+        'Mode': df['Mode'],
+        'Is Dark': np.where(df['Is Dark'].fillna(False), '🌙 Dark', '☀️ Bright'),
+        'Motion Detected': np.where(df['Motion Detected'].fillna(False), '🏃 Yes', '🚶 No'),
+        'Online': np.where(df['Online'].fillna(False), '✅ Online', '❌ Offline')
+    })
     
     # Display table
     st.dataframe(
-        display_df[['ID', 'Status', 'Mode', 'Is Dark', 'Motion Detected', 'Online']],
+        display_df,
         use_container_width=True,
         hide_index=True
     )
 
+def show_cross_filter(df, limit=500):
+    """Filter widgets answered from the state cube; each option shows its count under the other filters"""
+    st.subheader("🔎 Cross-filter")
+    cube = get_fleet_counters().cube_snapshot()
+    # Widget values from this rerun are already in session state
+    filters = {bit: st.session_state.get(f"cross_filter_{bit}") for _, bit, _, _ in CUBE_DIMENSIONS}
+    filters = {bit: value for bit, value in filters.items() if value is not None}
+    option_counts = cross_filter_counts(cube, filters)
+    chosen = {}
+    for col, (label, bit, set_label, clear_label) in zip(st.columns(len(CUBE_DIMENSIONS)), CUBE_DIMENSIONS):
+        with col:
+            on_count, off_count = option_counts[bit]
+            names = {None: f"Any ({on_count + off_count})", True: f"{set_label} ({on_count})",
+                     False: f"{clear_label} ({off_count})"}
+            chosen[bit] = st.selectbox(label, [None, True, False], format_func=names.get,
+                                       key=f"cross_filter_{bit}")
+    filters = {bit: value for bit, value in chosen.items() if value is not None}
+    matching = cube_count(cube, filters)
+    total = int(cube.sum())
+    st.metric("Matching lights", matching, delta=f"{matching / total * 100:.1f}%" if total else None)
+    
+    if filters and matching:
+        with st.expander(f"Show matching lights (first {min(matching, limit)})"):
+            # One vectorised lookup of each light's state byte in the cell mask; the
+            # bytes come from `df` itself, since the store may have moved on
+            rows = np.flatnonzero(cube_mask(filters)[frame_state_bytes(df)])[:limit]
+            st.dataframe(df.iloc[rows][['ID', 'Status', 'Mode', 'Is Dark', 'Motion Detected', 'Online']],
+                         use_container_width=True, hide_index=True)
+
 def show_control_panel(df):
     """Control panel page"""
     
     st.subheader("🎛️ Streetlight Control Panel")
     
-    # Select streetlight
-    light_ids = df['ID'].tolist()
-    selected_light = st.selectbox("Select Streetlight", light_ids)
+    show_command_latency()
+    show_journal_status()
+    st.checkbox("Force writes", key="force_writes",
+                help="Send commands even to lights that already show the requested state")
+    
+    single_tab, group_tab, schedule_tab = st.tabs(["Single Light", "Group Control", "Schedules"])
+    with schedule_tab:
+        show_schedules(df)
+    with group_tab:
+        show_group_control(df)
+    with single_tab:
+        show_single_light_control(df)
+
+def track_command(handle, message):
+    """Remember a queued command and switch the page to fast refresh until it's written
+
+    Nothing waits on the write: the page reruns at COMMAND_POLL_INTERVAL
+    and shows the outcome once `handle.done`. The write patches the local
+    snapshot, so that rerun shows the new state without refetching.
+    """
+    commands = st.session_state.setdefault("queued_commands", [])
+    commands.append((handle, message))
+    del commands[:-RECENT_COMMANDS_SHOWN]
+    st.rerun(scope="app")
+
+def commands_pending():
+    """Whether any of this session's recent commands is still queued"""
+    return any(not handle.done for handle, _ in st.session_state.get("queued_commands", []))
+
+def show_command_status():
+    """Outcome of this session's recent queued commands, newest first"""
+    for handle, message in reversed(st.session_state.get("queued_commands", [])):
+        if handle.status == "pending":
+            st.info(f"⏳ {message} (queued)")
+        elif handle.elided:
+            st.info(f"{message} (already in that state, nothing sent)")
+        elif handle.status == "journaled":
+            st.warning(f"{message} - database unreachable, saved and will be sent when it's back")
+        elif handle.status == "applied":
+            took = handle.completed_at - handle.submitted_at
+            suffix = ", merged with a later command" if handle.coalesced else ""
+            st.success(f"{message} ({took * 1000:.0f} ms{suffix})")
+        else:
+            st.error(f"{message} failed: {handle.error}")
+
+def show_journal_status():
+    """Backlog and drain rate of the offline command journal, when it has one"""
+    journal = get_command_journal()
+    if journal.entries:
+        st.warning(f"📼 {journal.backlog_lights} lights have commands waiting to be sent "
+                   f"({journal.entries} journal entries) · draining at {journal.drain_rate:.1f} lights/s")
+    elif journal.drain_rate:
+        st.caption(f"📼 Command journal drained · {journal.drain_rate:.1f} lights/s over the last minute")
+
+def format_latency(seconds):
+    if seconds is None:
+        return "—"
+    if np.isinf(seconds):
+        return f"> {LATENCY_BUCKETS[-1]:.0f}s"
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.1f}s"
+
+def show_latency_metrics(percentiles, label):
+    """p50/p95/p99 metrics for a latency histogram"""
+    for col, name, value in zip(st.columns(3), ("p50", "p95", "p99"), percentiles):
+        col.metric(f"{label} {name}", format_latency(value))
+
+def show_command_latency():
+    """Fleet command-to-acknowledgement latency and lights that never answered"""
+    tracker = get_latency_tracker()
+    with st.expander(f"⏱️ Command latency · {tracker.acknowledged} acknowledged, {tracker.pending} waiting"):
+        show_latency_metrics(tracker.percentiles(), "Fleet")
+        unacknowledged = tracker.unacknowledged()
+        if unacknowledged:
+            st.warning(f"{tracker.timed_out} commands weren't acknowledged within {tracker.timeout}s; "
+                       f"latest {len(unacknowledged)} lights:")
+            st.dataframe(pd.DataFrame({'ID': list(unacknowledged),
+                                       'Sent (s ago)': np.round(list(unacknowledged.values()), 1)}),
+                         use_container_width=True, hide_index=True)
+
+def select_streetlight():
+    """Search-as-you-type selector that only renders the top matches"""
+    light_index = get_fleet_store().light_index()
+    query = st.text_input("Search streetlight ID", placeholder="Type the start of an ID")
+    matches, total = light_index.search(query.strip())
+    # Keep the current choice selectable while the search changes
+    current = st.session_state.get("selected_light")
+    if current and current not in matches and get_fleet_store().row_of(current) is not None:
+        matches = [current] + matches
+    if not matches:
+        st.info(f"No streetlight IDs start with '{query.strip()}'")
+        return None
+    if total > LIGHT_SEARCH_LIMIT:
+        st.caption(f"Showing {LIGHT_SEARCH_LIMIT} of {total} matching lights - keep typing to narrow it down")
+    return st.selectbox("Select Streetlight", matches, key="selected_light")
+
+def lookup_light(df, light_id, store=None):
+    """A light's row via the store's ID index instead of scanning the frame
+
+    None when the frame doesn't have the light, e.g. one added after it was taken.
+    """
+    row = (store or get_fleet_store()).row_of(light_id)
+    if row is not None and row < len(df) and df['ID'].iat[row] == light_id:
+        return df.iloc[row]
+    # The frame predates a change that moved the light; fall back to a scan
+    rows = np.flatnonzero(df['ID'].to_numpy() == light_id)
+    return df.iloc[rows[0]] if len(rows) else None
+
+def show_single_light_control(df):
+    """Control panel section for one selected streetlight"""
+    
+    force = st.session_state.get("force_writes", False)
+    
+    selected_light = select_streetlight()
+    light_data = lookup_light(df, selected_light) if selected_light else None
+    if selected_light and light_data is None:
+        st.info(f"Streetlight {selected_light} isn't in this snapshot yet; it will show on the next refresh")
     
-    if selected_light:
-        light_data = df[df['ID'] == selected_light].iloc[0]
+    if light_data is not None:
         
         # Display current status
         col1, col2, col3 = st.columns(3)
@@ -305,17 +3760,13 @@ def show_control_panel(df):
         
         with col1:
             if st.button("🤖 Set to Automatic Mode", use_container_width=True, type="primary"):
-                if set_light_mode(selected_light, 'automatic'):
-                    st.success(f"Streetlight {selected_light} set to Automatic mode")
-                    time.sleep(1)
-                    st.rerun()
+                track_command(queue_light_mode(selected_light, 'automatic', force),
+                              f"Streetlight {selected_light} set to Automatic mode")
         
         with col2:
             if st.button("👆 Set to Manual Mode", use_container_width=True):
-                if set_light_mode(selected_light, 'manual'):
-                    st.success(f"Streetlight {selected_light} set to Manual mode")
-                    time.sleep(1)
-                    st.rerun()
+                track_command(queue_light_mode(selected_light, 'manual', force),
+                              f"Streetlight {selected_light} set to Manual mode")
         
         # Manual control (only if in manual mode)
         if light_data['Mode'] == 'manual':
@@ -326,17 +3777,22 @@ def show_control_panel(df):
             
             with col1:
                 if st.button("💡 Turn ON", use_container_width=True, type="primary"):
-                    if set_manual_state(selected_light, True):
-                        st.success(f"Streetlight {selected_light} turned ON")
-                        time.sleep(1)
-                        st.rerun()
+                    track_command(queue_manual_state(selected_light, True, force),
+                                  f"Streetlight {selected_light} turned ON")
             
             with col2:
                 if st.button("⚫ Turn OFF", use_container_width=True):
-                    if set_manual_state(selected_light, False):
-                        st.success(f"Streetlight {selected_light} turned OFF")
-                        time.sleep(1)
-                        st.rerun()
+                    track_command(queue_manual_state(selected_light, False, force),
+                                  f"Streetlight {selected_light} turned OFF")
+        
+        show_command_status()
+        
+        tracker = get_latency_tracker()
+        waiting = tracker.waiting(selected_light)
+        if waiting is not None:
+            st.warning(f"⚠️ No acknowledgement from {selected_light} for {waiting:.0f}s")
+        if selected_light in tracker.light_counts:
+            show_latency_metrics(tracker.percentiles(selected_light), "Latency")
         
         # Sensor information
         st.markdown("---")
@@ -354,75 +3810,300 @@ def show_control_panel(df):
             motion_text = "Detected" if light_data['Motion Detected'] else "Not Detected"
             st.info(f"{motion_icon} Motion: **{motion_text}**")
         
+        show_recent_transitions(selected_light)
+        
         # Last update
-        if light_data['Last Update']:
-            try:
-                last_update = datetime.fromisoformat(light_data['Last Update'])
-                st.caption(f"Last updated: {last_update.strftime('%B %d, %Y %I:%M:%S %p')}")
-            except:
-                st.caption(f"Last updated: {light_data['Last Update']}")
+        if pd.notna(light_data['Last Update']):
+            last_update = light_data['Last Update']
+            st.caption(f"Last updated: {last_update.strftime('%B %d, %Y %I:%M:%S %p')}")
+
+def show_recent_transitions(light_id):
+    """Sparklines of the selected light's recent transitions from the in-memory ring buffer"""
+    now = time.time()
+    recent = get_recent_history().recent(light_id, since=now - RECENT_HISTORY_WINDOW)
+    if len(recent) < 2:
+        return
+    # Carry the current state to "now" so the last step has a width
+    recent = pd.concat([recent, recent.iloc[[-1]].assign(Time=local_times(pd.Series([int(now * 1000)])).iloc[0])],
+                       ignore_index=True)
+    st.markdown(f"**Last {RECENT_HISTORY_WINDOW // 3600} hours** · {len(recent) - 1} transitions")
+    signals = (("Status", recent['Status'] == 'on', 'green', ("Off", "On")),
+               ("Dark", recent['Is Dark'], 'indigo', ("Bright", "Dark")),
+               ("Motion", recent['Motion Detected'], 'red', ("No", "Yes")),
+               ("Online", recent['Online'], 'blue', ("No", "Yes")))
+    for col, (name, values, color, labels) in zip(st.columns(4), signals):
+        with col:
+            st.caption(name)
+            st.plotly_chart(build_sparkline(recent['Time'], values, color, labels), use_container_width=True,
+                            config={'displayModeBar': False})
+
+def report_group_write(action, results):
+    """Summarise a bulk write: target size, duration and any failed chunks"""
+    lights = sum(len(result.light_ids) for result in results)
+    elided = len(getattr(results, 'elided', ()))
+    skipped = f", {elided} already set" if elided else ""
+    journaled = len(getattr(results, 'journaled', ()))
+    if journaled:
+        skipped += f"; {journaled} saved for replay when the database is back"
+    # Chunks run concurrently; each result's time runs from the start of the batch
+    seconds = max((result.seconds for result in results), default=0.0)
+    failed = [result for result in results if not result.ok]
+    if failed:
+        failed_lights = sum(len(result.light_ids) for result in failed)
+        st.error(f"{action}: {failed_lights} of {lights} lights failed in {len(failed)} of "
+                 f"{len(results)} writes ({failed[0].error}){skipped}")
+    else:
+        st.success(f"{action}: {lights} lights in {seconds:.2f}s ({len(results)} writes{skipped})")
+
+def show_group_control(df):
+    """Control panel section that targets many lights with one batched write"""
+    
+    force = st.session_state.get("force_writes", False)
+    target_by = st.radio("Target lights by", ["ID pattern", "Saved group", "Filter"], horizontal=True)
+    
+    if target_by == "ID pattern":
+        pattern = st.text_input("ID prefix or pattern", placeholder="e.g. north_ or zone?_*")
+        target_ids = match_light_ids(df, pattern)
+    elif target_by == "Saved group":
+        groups = load_light_groups()
+        if not groups:
+            st.info("No saved groups yet - target lights by pattern or filter and save them")
+            return
+        group_name = st.selectbox("Group", sorted(groups))
+        # Members that no longer exist in the fleet are ignored
+        target_ids = df.loc[df['ID'].isin(groups[group_name]), 'ID'].tolist()
+        if st.button("🗑️ Delete group"):
+            delete_light_group(group_name)
+            st.rerun()
+    else:
+        filter_name = st.selectbox("Filter", list(GROUP_FILTERS))
+        target_ids = filter_light_ids(df, filter_name)
+    
+    targets = df[df['ID'].isin(target_ids)]
+    manual_ids = targets.loc[(targets['Mode'] == 'manual').to_numpy(), 'ID'].tolist()
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Target group size", len(target_ids))
+    with col2:
+        st.metric("In manual mode", len(manual_ids))
+    
+    if not target_ids:
+        return
+    
+    with st.expander(f"Show {len(target_ids)} targeted lights"):
+        st.dataframe(targets[['ID', 'Status', 'Mode', 'Online']], use_container_width=True, hide_index=True)
+    
+    if target_by != "Saved group":
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            new_group = st.text_input("Save these lights as group", placeholder="Group name")
+        with col2:
+            st.write("")
+            if st.button("💾 Save group", use_container_width=True):
+                try:
+                    save_light_group(new_group, target_ids)
+                    st.success(f"Saved group '{new_group.strip()}' with {len(target_ids)} lights")
+                except Exception as e:
+                    st.error(f"Error saving group: {e}")
+    
+    st.markdown("---")
+    st.subheader("Group Mode Control")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🤖 Set Group to Automatic", use_container_width=True, type="primary"):
+            report_group_write("Set to Automatic", set_light_mode_bulk(target_ids, 'automatic', force=force))
+    with col2:
+        if st.button("👆 Set Group to Manual", use_container_width=True):
+            report_group_write("Set to Manual", set_light_mode_bulk(target_ids, 'manual', force=force))
+    
+    st.subheader("Group Manual Control")
+    st.caption("On/off commands apply to the lights in the group that are in manual mode")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("💡 Turn Group ON", use_container_width=True, type="primary", disabled=not manual_ids):
+            report_group_write("Turn ON", set_manual_state_bulk(manual_ids, True, force=force))
+    with col2:
+        if st.button("⚫ Turn Group OFF", use_container_width=True, disabled=not manual_ids):
+            report_group_write("Turn OFF", set_manual_state_bulk(manual_ids, False, force=force))
+
+def show_schedules(df):
+    """Control panel section to define timed mode/state changes"""
+    
+    scheduler = get_scheduler()
+    if scheduler.schedules:
+        rows = []
+        for name, schedule in sorted(scheduler.schedules.items()):
+            target = schedule.get('target', {})
+            fire_at = scheduler.next_fire.get(name)
+            rows.append({
+                'Name': name,
+                'When': describe_schedule(schedule),
+                'Targets': f"{target.get('type', 'pattern')}: {target.get('value', '')}",
+                'Sets': ", ".join(f"{k}={v}" for k, v in schedule_fields(schedule).items() if k != 'status'),
+                'Next run': datetime.fromtimestamp(fire_at).strftime('%a %H:%M') if fire_at else "—",
+            })
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            selected = st.selectbox("Schedule", sorted(scheduler.schedules))
+        with col2:
+            st.write("")
+            if st.button("▶️ Run now", use_container_width=True):
+                firing = scheduler.fire(selected, scheduler.schedules[selected])
+                report_schedule_firing(firing)
+        with col3:
+            st.write("")
+            if st.button("🗑️ Delete", use_container_width=True):
+                delete_schedule(selected)
+                st.rerun()
+    else:
+        st.info("No schedules yet")
+    
+    if scheduler.history:
+        with st.expander("Recent runs"):
+            for firing in reversed(scheduler.history):
+                report_schedule_firing(firing)
+    
+    st.markdown("---")
+    st.subheader("New Schedule")
+    location = site_location()
+    name = st.text_input("Schedule name", placeholder="e.g. north_evening")
+    col1, col2 = st.columns(2)
+    with col1:
+        trigger = st.selectbox("Trigger", SCHEDULE_TRIGGERS,
+                               format_func=lambda t: "Fixed time" if t == 'time' else t.title())
+    with col2:
+        if trigger == 'time':
+            at = st.time_input("Time", value=clock_time(18, 0))
+        else:
+            offset = st.number_input("Offset (minutes)", -240, 240, 0, step=5)
+    if trigger != 'time' and location is None:
+        st.warning("Set STREETLIGHT_LATITUDE and STREETLIGHT_LONGITUDE to use sunrise/sunset schedules")
+    days = st.multiselect("Days", range(7), default=list(range(7)), format_func=lambda d: WEEKDAYS[d])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        target_type = st.radio("Target", ["pattern", "group"], horizontal=True,
+                               format_func=lambda t: "ID pattern" if t == 'pattern' else "Saved group")
+    with col2:
+        if target_type == 'group':
+            target_value = st.selectbox("Group", sorted(load_light_groups()))
+        else:
+            target_value = st.text_input("ID prefix or pattern", placeholder="e.g. north_ or *")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        mode = st.selectbox("Set mode", ["", "automatic", "manual"], format_func=lambda m: m.title() or "Unchanged")
+    with col2:
+        state = st.selectbox("Set manual state", ["", "on", "off"], format_func=lambda s: s.upper() or "Unchanged")
+    
+    force_schedule = st.checkbox("Write to every targeted light, even if already set")
+    
+    if st.button("💾 Save schedule", type="primary"):
+        schedule = {
+            'trigger': trigger,
+            'days': "".join(str(d) for d in sorted(days)),
+            'target': {'type': target_type, 'value': target_value or ''},
+            'enabled': True,
+        }
+        if trigger == 'time':
+            schedule['time'] = at.strftime('%H:%M')
+        else:
+            schedule['offsetMinutes'] = int(offset)
+        if mode:
+            schedule['mode'] = mode
+        if state:
+            schedule['manualState'] = state == 'on'
+        if force_schedule:
+            schedule['force'] = True
+        try:
+            save_schedule(name, schedule)
+            st.success(f"Saved schedule '{name.strip()}'")
+            st.rerun()
+        except Exception as e:
+            st.error(f"Error saving schedule: {e}")
+
+def report_schedule_firing(firing):
+    """One line per schedule run"""
+    at = datetime.fromtimestamp(firing.fired_at).strftime('%a %H:%M:%S')
+    if firing.error is not None:
+        st.error(f"{at} · {firing.name}: {firing.failed} of {firing.lights} lights failed ({firing.error})")
+    else:
+        skipped = f", {firing.elided} already set" if firing.elided else ""
+        st.success(f"{at} · {firing.name}: {firing.lights} lights in {firing.seconds:.2f}s{skipped}")
+
+def show_fleet_history():
+    """History charts from the local rollups, never from the database"""
+    st.subheader("Fleet Status History")
+    rollups = get_fleet_rollups()
+    range_name = st.selectbox("Range", list(HISTORY_RANGES), index=2)
+    seconds = HISTORY_RANGES[range_name]
+    resolution = pick_rollup_resolution(seconds)
+    end = time.time()
+    try:
+        rows = rollups.fleet(resolution, end - seconds, end)
+    except Exception as e:
+        st.error(f"Error reading history: {e}")
+        return
+    if rows.empty:
+        st.info(f"No {resolution} rollups for this range yet - the first closes at the end of the current "
+                f"{resolution} bucket")
+        return
+    series = rows.set_index('time')[['lights', 'online', 'on', 'dark']]
+    series.columns = ['Lights', 'Online', 'On', 'Dark']
+    st.plotly_chart(build_history_chart(series), use_container_width=True)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Light-hours on", f"{rows['on_hours'].sum():,.1f}")
+    col2.metric("Motion events", f"{int(rows['motion_events'].sum()):,}")
+    col3.metric("Average lights on", f"{rows['on'].mean():,.1f}")
+    st.caption(f"{len(rows)} {resolution} buckets (time-weighted averages)")
+    
+    if seconds >= ROLLUP_LIGHT_MIN:
+        totals = rollups.light_totals(end - seconds, end)
+        if not totals.empty:
+            with st.expander("Lights by on-time"):
+                totals['On hours'] = (totals['on_seconds'] / 3600).round(2)
+                totals['Online hours'] = (totals['online_seconds'] / 3600).round(2)
+                st.dataframe(totals.sort_values('On hours', ascending=False)
+                             [['light_id', 'On hours', 'Online hours', 'motion_events']]
+                             .rename(columns={'light_id': 'ID', 'motion_events': 'Motion events'}),
+                             use_container_width=True, hide_index=True)
 
 def show_analytics(df):
     """Analytics page"""
     
     st.subheader("📊 Analytics Dashboard")
     
+    show_fleet_history()
+    
     # Timeline chart
     if not df.empty and 'Timestamp' in df.columns:
         st.subheader("Streetlight Status Over Time")
         
-        # Create timeline
-        timeline_data = df.sort_values('Timestamp')
-        
-        fig = go.Figure()
-        
-        for _, light in timeline_data.iterrows():
-            color = 'green' if light['Status'] == 'on' else 'red'
-            fig.add_trace(go.Scatter(
-                x=[datetime.fromtimestamp(light['Timestamp']/1000)],
-                y=[light['ID']],
-                mode='markers',
-                marker=dict(size=15, color=color),
-                name=light['ID'],
-                showlegend=False
-            ))
-        
-        fig.update_layout(
-            height=400,
-            xaxis_title="Time",
-            yaxis_title="Streetlight ID",
-            hovermode='closest'
-        )
-        
+        fig = build_status_timeline(df)
         st.plotly_chart(fig, use_container_width=True)
     
     st.markdown("---")
     
     # Statistics
+    metrics = compute_analytics_metrics(df, get_fleet_counters().snapshot())
+    total = metrics['total']
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Environmental Conditions")
-        dark_count = len(df[df['Is Dark'] == True])
-        bright_count = len(df) - dark_count
-        
-        fig = go.Figure(data=[
-            go.Bar(name='Dark', x=['Light Level'], y=[dark_count], marker_color='indigo'),
-            go.Bar(name='Bright', x=['Light Level'], y=[bright_count], marker_color='orange')
-        ])
-        fig.update_layout(height=300, barmode='group')
+        dark_count = metrics['dark']
+        fig = build_pair_bars('Light Level', ('Dark', dark_count, 'indigo'),
+                              ('Bright', total - dark_count, 'orange'))
         st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         st.subheader("Motion Detection")
-        motion_count = len(df[df['Motion Detected'] == True])
-        no_motion_count = len(df) - motion_count
-        
-        fig = go.Figure(data=[
-            go.Bar(name='Motion', x=['Motion Status'], y=[motion_count], marker_color='red'),
-            go.Bar(name='No Motion', x=['Motion Status'], y=[no_motion_count], marker_color='gray')
-        ])
-        fig.update_layout(height=300, barmode='group')
+        motion_count = metrics['motion']
+        fig = build_pair_bars('Motion Status', ('Motion', motion_count, 'red'),
+                              ('No Motion', total - motion_count, 'gray'))
         st.plotly_chart(fig, use_container_width=True)
     
     # Efficiency metrics
@@ -432,19 +4113,107 @@ def show_analytics(df):
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        auto_mode_count = len(df[df['Mode'] == 'automatic'])
-        st.metric("Automatic Mode", f"{auto_mode_count}/{len(df)}", 
-                 delta=f"{(auto_mode_count/len(df)*100):.1f}%")
+        auto_mode_count = metrics['automatic']
+        st.metric("Automatic Mode", f"{auto_mode_count}/{total}", 
+                 delta=f"{(auto_mode_count/total*100):.1f}%")
     
     with col2:
-        online_rate = len(df[df['Online'] == True]) / len(df) * 100
+        online_rate = metrics['online'] / total * 100
         st.metric("Uptime Rate", f"{online_rate:.1f}%", 
                  delta="Good" if online_rate > 80 else "Needs Attention")
     
     with col3:
-        energy_efficient = len(df[(df['Status'] == 'off') & (df['Is Dark'] == False)])
-        st.metric("Energy Efficient", f"{energy_efficient}/{len(df)}", 
-                 delta=f"{(energy_efficient/len(df)*100):.1f}%")
+        energy_efficient = metrics['energy_efficient']
+        st.metric("Energy Efficient", f"{energy_efficient}/{total}", 
+                 delta=f"{(energy_efficient/total*100):.1f}%")
+    
+    st.markdown("---")
+    show_energy_report()
+
+def show_energy_report():
+    """Burn-hours and estimated energy by day, group and light"""
+    
+    st.subheader("⚡ Energy")
+    meter = get_energy_meter()
+    periods = {"Today": 'today', "This month": 'month', "Last month": 'last_month'}
+    period_name = st.radio("Period", list(periods), horizontal=True, key="energy_period")
+    
+    started = time.perf_counter()
+    report = meter.report(periods[period_name])
+    this_month = meter.day.replace(day=1)
+    first_day = (this_month - timedelta(days=1)).replace(day=1) if period_name == "Last month" else this_month
+    daily = meter.daily_rows(first_day)
+    if period_name == "Last month":
+        daily = daily[daily['Day'] < pd.Timestamp(this_month)]
+    took = time.perf_counter() - started
+    
+    lights = max(len(report), 1)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Energy", f"{report['kWh'].sum():,.1f} kWh")
+    col2.metric("Burn-hours", f"{report['Burn hours'].sum():,.0f} h")
+    col3.metric("Per light", f"{report['Burn hours'].sum() / lights:.1f} h")
+    
+    if period_name != "Today" and not daily.empty:
+        st.plotly_chart(build_energy_bars(daily), use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**By group**")
+        groups = load_light_groups()
+        if groups:
+            st.dataframe(energy_by_group(report, groups).round(2), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No saved groups")
+    with col2:
+        st.markdown(f"**Top {ENERGY_TOP_LIGHTS} lights by energy**")
+        top = report.nlargest(ENERGY_TOP_LIGHTS, 'kWh')
+        st.dataframe(top.round(2), use_container_width=True, hide_index=True)
+    
+    st.caption(f"Metering since {datetime.fromtimestamp(meter.started_at):%b %d %H:%M} plus saved days · "
+               f"default {meter.default_watts:g} W · report built in {took * 1000:.0f} ms")
+
+def show_events():
+    """Events page: filtered view over the transition log"""
+    
+    st.subheader("📜 Events")
+    events = get_event_log()
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        range_name = st.selectbox("Range", ["All"] + list(HISTORY_RANGES), index=3)
+        light_query = st.text_input("Light ID or prefix", placeholder="e.g. north_ or light_0042")
+    with col2:
+        kinds = st.multiselect("Event types", EVENT_KINDS, placeholder="All event types")
+    
+    now_ms = int(time.time() * 1000)
+    start_ms = None if range_name == "All" else now_ms - HISTORY_RANGES[range_name] * 1000
+    light_ids = None
+    light_query = light_query.strip()
+    if light_query:
+        if light_query in events.light_codes:
+            light_ids = [light_query]
+        else:
+            light_ids = [light_id for light_id in events.light_ids if str(light_id).startswith(light_query)]
+    kind_codes = [EVENT_KINDS.index(kind) for kind in kinds] or None
+    
+    started = time.perf_counter()
+    positions = events.query(start_ms, None, kind_codes, light_ids)
+    took = time.perf_counter() - started
+    
+    st.caption(f"{len(positions):,} of {events.size:,} events · filtered in {took * 1000:.1f} ms · "
+               f"{events.nbytes() / 1e6:.1f} MB in memory")
+    if not len(positions):
+        st.info("No events match")
+        return
+    
+    counts = np.bincount(events.kind[positions], minlength=len(EVENT_KINDS))
+    by_kind = pd.Series(counts, index=list(EVENT_KINDS))
+    st.plotly_chart(build_event_bars(by_kind[by_kind > 0]), use_container_width=True)
+    
+    latest = positions[-EVENTS_SHOWN:][::-1]
+    st.dataframe(events.frame(latest), use_container_width=True, hide_index=True)
+    if len(positions) > EVENTS_SHOWN:
+        st.caption(f"Showing the latest {EVENTS_SHOWN} events")
 
 def show_settings():
     """Settings page"""
@@ -455,12 +4224,43 @@ def show_settings():
     
     # Database settings
     with st.expander("Database Settings", expanded=True):
-        st.text_input("Firebase Database URL", value="https://your-project-id.firebaseio.com/")
+        st.caption(f"Active backend: {DATA_BACKEND} · sync mode: {FLEET_SYNC_MODE}")
+        st.text_input("Firebase Database URL", value=DATABASE_URL)
         st.text_input("Firebase Project ID", value="your-project-id")
         
         if st.button("Test Connection"):
             st.success("✅ Connected to Firebase successfully!")
     
+    # Write executor
+    with st.expander("Write Throughput"):
+        writer = get_write_executor()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Writes/s (last minute)", f"{writer.throughput:.2f}")
+        col2.metric("Succeeded", writer.succeeded)
+        col3.metric("Retried", writer.retried)
+        col4.metric("Failed", writer.failed)
+        st.caption(f"{writer.in_flight} in flight · concurrency limit {writer.concurrency} · "
+                   f"{writer.elided} no-op writes skipped")
+        journal = get_command_journal()
+        st.caption(f"Offline journal: {journal.entries} entries for {journal.backlog_lights} lights · "
+                   f"{journal.replayed} lights replayed · {journal.drain_rate:.1f} lights/s")
+    
+    # Energy accounting
+    with st.expander("Light Wattage"):
+        meter = get_energy_meter()
+        st.caption(f"Lights without their own wattage use {meter.default_watts:g} W "
+                   f"({len(meter.watts_by_light)} lights set individually)")
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            pattern = st.text_input("Lights (ID prefix or pattern)", key="wattage_pattern",
+                                    placeholder="e.g. north_ or zone?_*")
+        with col2:
+            watts = st.number_input("Watts", min_value=1.0, value=meter.default_watts, step=5.0)
+        target_ids = match_light_ids(get_fleet_store().frame(), pattern)
+        if st.button(f"Set wattage for {len(target_ids)} lights", disabled=not target_ids):
+            save_light_wattage(target_ids, watts)
+            st.success(f"✅ {len(target_ids)} lights now accounted at {watts:g} W")
+    
     # Notification settings
     with st.expander("Notification Settings"):
         st.checkbox("Enable email notifications", value=True)
@@ -489,10 +4289,19 @@ if __name__ == "__main__":
     if not check_password():
         st.stop()
     
-    # Initialize Firebase
-    if not init_firebase():
+    # Initialize the data backend (Firebase unless configured otherwise)
+    if get_backend() is None:
         st.error("Failed to initialize Firebase. Please check your credentials.")
         st.stop()
     
+    # Start the background data collector, scheduler and history writer (once per process)
+    start_collector()
+    get_scheduler()
+    get_recent_history()
+    get_fleet_rollups()
+    get_fleet_counters()
+    get_event_log()
+    get_energy_meter()
+    
     # Show dashboard
     main_dashboard()
\ No newline at end of file
@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The dashboard is a single script at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import streamlit_dashboard as dashboard  # noqa: E402
+
+
+class RecordingBackend(dashboard.MemoryBackend):
+    """In-memory backend that records updates and fails them while `error` is set"""
+
+    def __init__(self, tree=None):
+        super().__init__(tree)
+        self.updates = []
+        self.error = None
+
+    def update(self, path, values):
+        if self.error is not None:
+            raise self.error
+        self.updates.append((path, dict(values)))
+        super().update(path, values)
+
+
+@pytest.fixture
+def backend():
+    return RecordingBackend({'streetlights': {'L1': {'status': 'off', 'mode': 'automatic'},
+                                              'L2': {'status': 'off', 'mode': 'automatic'}}})
+
+
+@pytest.fixture
+def writer(backend):
+    return dashboard.WriteExecutor(backend, retries=0)
+
+
+@pytest.fixture
+def store(backend):
+    store = dashboard.FleetStore()
+    store.load(backend.get('streetlights'))
+    return store
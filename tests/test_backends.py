@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+import streamlit_dashboard as dashboard
+
+KEYS = ['10', '9', '-3', '0', '007', '-', '-0', '2147483648', 'a', 'b10', 'b9', '0x', 'light_0001',
+        'light_0002', 'Z', 'é']
+
+
+@pytest.fixture
+def backends(tmp_path):
+    tree = {'streetlights': {key: {'status': 'on', 'meta': {'n': i}} for i, key in enumerate(KEYS)}}
+    sqlite = dashboard.SQLiteBackend(tmp_path / "db.sqlite")
+    sqlite.update('/', tree)
+    return dashboard.MemoryBackend(tree), sqlite
+
+
+def test_key_order_matches_firebase(backends):
+    memory, sqlite = backends
+    expected = ['-3', '0', '9', '10', '-', '-0', '007', '0x', '2147483648', 'Z', 'a', 'b10', 'b9',
+                'light_0001', 'light_0002', 'é']
+
+    assert list(memory.query('streetlights')) == expected
+    assert list(sqlite.query('streetlights')) == expected
+    assert list(sqlite.get('streetlights', shallow=True)) == sorted(KEYS, key=dashboard.firebase_key_order)
+
+
+@pytest.mark.parametrize('start_at', [None, '-5', '9', '11', '-', '0', 'b', 'light_0002', 'zz'])
+@pytest.mark.parametrize('end_at', [None, '5', '10', '0x', 'b9', 'light'])
+@pytest.mark.parametrize('limit', [None, 1, 3, 50])
+def test_query_ranges_match_memory(backends, start_at, end_at, limit):
+    memory, sqlite = backends
+
+    assert sqlite.query('streetlights', start_at, end_at, limit) == \
+        memory.query('streetlights', start_at, end_at, limit)
+
+
+def test_paging_by_start_key_visits_every_light(backends):
+    _, sqlite = backends
+    seen, start_at = [], None
+    while True:
+        page = sqlite.query('streetlights', start_at=start_at, limit=4)
+        keys = [key for key in page if key != start_at]
+        if not keys:
+            break
+        seen.extend(keys)
+        start_at = keys[-1]
+
+    assert seen == sorted(KEYS, key=dashboard.firebase_key_order)
+
+
+def test_deleted_nodes_leave_the_key_table(backends):
+    memory, sqlite = backends
+    for backend in backends:
+        backend.update('streetlights', {'a': None, 'b9/status': None, 'b9/meta/n': None, 'Z/meta': None})
+
+    assert 'a' not in sqlite.get('streetlights', shallow=True)
+    assert 'b9' not in sqlite.query('streetlights')
+    assert sqlite.query('streetlights/Z') == memory.query('streetlights/Z') == {'status': 'on'}
+    assert sqlite.query('streetlights') == memory.query('streetlights')
+
+
+def test_random_updates_keep_query_consistent(tmp_path):
+    rnd = random.Random(7)
+    memory, sqlite = dashboard.MemoryBackend(), dashboard.SQLiteBackend(tmp_path / "db.sqlite")
+    keys = [str(i) for i in range(-3, 12)] + [f"k{i}" for i in range(15)]
+    for _ in range(300):
+        values = {}
+        for _ in range(rnd.randint(1, 4)):
+            key = rnd.choice(keys)
+            # Whole lights are replaced or deleted; fields are only ever set
+            if rnd.random() < 0.3:
+                values[key] = rnd.choice([None, {'status': 'on', 'meta': {'n': 1}}])
+            else:
+                values[rnd.choice([f"{key}/status", f"{key}/meta/n"])] = rnd.choice(['on', 'off', 1])
+        for backend in (memory, sqlite):
+            backend.update('streetlights', values)
+        start_at, end_at = rnd.choice(keys + [None]), rnd.choice(keys + [None])
+        limit = rnd.choice([None, 1, 5])
+        assert list(sqlite.query('streetlights', start_at, end_at, limit)) == \
+            list(memory.query('streetlights', start_at, end_at, limit))
+
+
+def test_key_table_survives_reopen(tmp_path, backends):
+    _, sqlite = backends
+    reopened = dashboard.SQLiteBackend(tmp_path / "db.sqlite")
+
+    assert reopened.query('streetlights', start_at='b', limit=2) == sqlite.query('streetlights', start_at='b', limit=2)
+
+
+def test_update_below_listener_is_one_patch():
+    events = dashboard.events_for_listener(['streetlights'], ['streetlights', 'L1'], {'status': 'on', 'mode': 'manual'})
+
+    assert events == [dashboard.BackendEvent('patch', '/L1', {'status': 'on', 'mode': 'manual'})]
+
+
+def test_multi_path_update_from_root_is_one_put_per_key():
+    values = {'streetlights/L1/status': 'on', 'streetlights/L2': {'status': 'off'}, 'groups/north': ['L1']}
+    events = dashboard.events_for_listener(['streetlights'], [], values)
+
+    assert events == [dashboard.BackendEvent('put', '/L1/status', 'on'),
+                      dashboard.BackendEvent('put', '/L2', {'status': 'off'})]
+
+
+def test_replacing_an_ancestor_puts_the_listened_subtree():
+    events = dashboard.events_for_listener(['streetlights', 'L1'], [], {'streetlights': {'L1': {'status': 'on'}}})
+
+    assert events == [dashboard.BackendEvent('put', '/', {'status': 'on'})]
+
+
+def test_sibling_updates_are_not_delivered():
+    assert dashboard.events_for_listener(['streetlights'], ['groups'], {'north': ['L1']}) == []
+    assert dashboard.events_for_listener(['streetlights', 'L1'], [], {'streetlights/L2/status': 'on'}) == []
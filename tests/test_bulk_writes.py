@@ -0,0 +1,33 @@
+import json
+
+import streamlit_dashboard as dashboard
+
+
+def test_chunks_stay_under_limit_and_keep_lights_together():
+    fields_by_light = {f"light_{i:05d}": {'status': 'on', 'mode': 'manual', 'manualState': i % 2 == 0}
+                       for i in range(500)}
+    chunks = list(dashboard.chunk_light_updates(fields_by_light, max_payload_bytes=2000))
+
+    assert len(chunks) > 1
+    assert [light_id for light_ids, _ in chunks for light_id in light_ids] == list(fields_by_light)
+    for light_ids, updates in chunks:
+        assert len(json.dumps(updates)) <= 2000
+        assert len(updates) == 3 * len(light_ids)
+        assert all(path.split('/')[1] in light_ids for path in updates)
+
+
+def test_chunks_are_full():
+    fields_by_light = {f"light_{i}": {'status': 'on' * (i % 7)} for i in range(300)}
+    chunks = list(dashboard.chunk_light_updates(fields_by_light, max_payload_bytes=1500))
+
+    for (_, updates), (next_ids, next_updates) in zip(chunks, chunks[1:]):
+        first = next_ids[0]
+        entries = {path: value for path, value in next_updates.items() if path.split('/')[1] == first}
+        assert len(json.dumps({**updates, **entries})) > 1500
+
+
+def test_oversized_light_gets_its_own_chunk():
+    fields_by_light = {'a': {'status': 'on'}, 'b': {'note': 'x' * 500}, 'c': {'status': 'off'}}
+    chunks = list(dashboard.chunk_light_updates(fields_by_light, max_payload_bytes=100))
+
+    assert [light_ids for light_ids, _ in chunks] == [['a'], ['b'], ['c']]
@@ -0,0 +1,87 @@
+import pytest
+
+import streamlit_dashboard as dashboard
+
+
+@pytest.fixture
+def tracker(store):
+    tracker = dashboard.CommandLatencyTracker(store, timeout=60, kept=2)
+    store.subscribe(tracker.observe)
+    return tracker
+
+
+def send(tracker, light_id, fields, age=0.0):
+    tagged = tracker.tag({light_id: fields})
+    tagged[light_id]['commandTs'] -= int(age * 1000)
+    tracker.sent(tagged)
+    return tagged
+
+
+def test_device_report_with_the_commanded_state_acknowledges(store, tracker):
+    send(tracker, 'L1', {'status': 'on'})
+    # The echo of our own write carries no new device timestamp
+    store.patch('L1', {'status': 'on'})
+    assert tracker.pending == 1
+
+    store.patch('L1', {'status': 'on', 'timestamp': 1767225600000})
+    assert tracker.pending == 0
+    assert tracker.acknowledged == 1
+    assert tracker.fleet_counts.sum() == tracker.light_counts['L1'].sum() == 1
+    assert tracker.percentiles()[0] is not None
+    assert tracker.percentiles('L2') == [None, None, None]
+
+
+def test_report_with_another_state_does_not_acknowledge(store, tracker):
+    send(tracker, 'L1', {'mode': 'manual'})
+    store.patch('L1', {'timestamp': 1767225600000})
+
+    assert tracker.pending == 1
+    assert tracker.acknowledged == 0
+
+
+def test_optimistic_patch_does_not_acknowledge(store, tracker):
+    tagged = send(tracker, 'L1', {'status': 'on'})
+    store.apply_optimistic({'L1': {**tagged['L1'], 'timestamp': 1767225600000}})
+
+    assert tracker.pending == 1
+
+
+def test_new_command_supersedes_and_cancel_forgets(tracker):
+    send(tracker, 'L1', {'status': 'on'})
+    tagged = send(tracker, 'L1', {'status': 'off'})
+    assert tracker.superseded == 1
+
+    tracker.cancel({'L1': {'commandId': 'older'}})
+    assert tracker.pending == 1
+    tracker.cancel(tagged)
+    assert tracker.pending == 0
+
+
+def test_removed_light_stops_waiting(store, tracker):
+    send(tracker, 'L1', {'status': 'on'})
+    store.remove('L1')
+
+    assert tracker.pending == 0
+
+
+def test_timed_out_commands_move_to_a_bounded_record(store, tracker):
+    store.patch('L3', {'status': 'off'})
+    for age, light_id in ((300, 'L1'), (200, 'L2'), (100, 'L3')):
+        send(tracker, light_id, {'status': 'on'}, age=age)
+
+    unacknowledged = tracker.unacknowledged()
+    assert tracker.pending == 0
+    assert tracker.timed_out == 3
+    assert list(unacknowledged) == ['L3', 'L2']
+    assert unacknowledged['L3'] == pytest.approx(100, abs=5)
+    assert tracker.waiting('L1') is None
+    assert tracker.waiting('L2') == pytest.approx(200, abs=5)
+
+
+def test_new_command_clears_the_never_acknowledged_entry(tracker):
+    send(tracker, 'L1', {'status': 'on'}, age=300)
+    assert tracker.waiting('L1') is not None
+
+    send(tracker, 'L1', {'status': 'off'})
+    assert tracker.waiting('L1') is None
+    assert tracker.pending == 1
@@ -0,0 +1,69 @@
+import streamlit_dashboard as dashboard
+
+
+def make_queue(writer, store=None, **options):
+    return dashboard.CommandQueue(writer, window=0.05, snapshot=store, **options)
+
+
+def written(backend):
+    return [values for _, values in backend.updates]
+
+
+def test_commands_for_one_light_coalesce_to_the_last_value(backend, writer):
+    queue = make_queue(writer)
+    first = queue.submit('L1', {'mode': 'manual'})
+    second = queue.submit('L1', {'mode': 'automatic'})
+    other = queue.submit('L2', {'status': 'on'})
+
+    assert all(handle.wait(2) for handle in (first, second, other))
+    assert written(backend) == [{'streetlights/L1/mode': 'automatic', 'streetlights/L2/status': 'on'}]
+    assert first.coalesced and not second.coalesced
+    assert [handle.status for handle in (first, second, other)] == ['applied'] * 3
+    assert queue.submitted == 3 and queue.written == 2
+
+
+def test_fields_merge_without_coalescing_the_narrower_command(backend, writer):
+    queue = make_queue(writer)
+    mode = queue.submit('L1', {'mode': 'manual'})
+    state = queue.submit('L1', {'manualState': True, 'status': 'on'})
+
+    assert mode.wait(2) and state.wait(2)
+    assert written(backend) == [{'streetlights/L1/mode': 'manual', 'streetlights/L1/manualState': True,
+                                 'streetlights/L1/status': 'on'}]
+    assert not mode.coalesced
+
+
+def test_command_matching_the_snapshot_completes_without_a_write(backend, writer, store):
+    queue = make_queue(writer, store)
+    handle = queue.submit('L1', {'mode': 'automatic'})
+
+    assert handle.done and handle.elided and handle.ok
+    assert writer.elided == 1
+    assert backend.updates == []
+
+
+def test_command_is_not_elided_while_another_is_queued(backend, writer, store):
+    queue = make_queue(writer, store)
+    on = queue.submit('L1', {'status': 'on'})
+    off = queue.submit('L1', {'status': 'off'})
+
+    assert on.wait(2) and off.wait(2)
+    assert not off.elided
+    assert written(backend) == [{'streetlights/L1/status': 'off'}]
+
+
+def test_forced_command_is_written_even_if_unchanged(backend, writer, store):
+    handle = make_queue(writer, store).submit('L1', {'mode': 'automatic'}, force=True)
+
+    assert handle.wait(2) and not handle.elided
+    assert written(backend) == [{'streetlights/L1/mode': 'automatic'}]
+
+
+def test_failed_batch_fails_every_handle(backend, writer):
+    backend.error = ValueError("rejected")
+    queue = make_queue(writer)
+    handles = [queue.submit('L1', {'mode': 'manual'}), queue.submit('L2', {'mode': 'manual'})]
+
+    assert all(handle.wait(2) for handle in handles)
+    assert [handle.status for handle in handles] == ['failed', 'failed']
+    assert all(isinstance(handle.error, ValueError) for handle in handles)
@@ -0,0 +1,109 @@
+import time
+
+import numpy as np
+import pytest
+
+import streamlit_dashboard as dashboard
+
+DAY_MS = 86_400_000
+
+
+@pytest.fixture
+def events(store):
+    events = dashboard.EventLog()
+    store.subscribe(events.observe)
+    return events
+
+
+def logged(events):
+    frame = events.frame(events.query())
+    return list(zip(frame['ID'], frame['Event']))
+
+
+def test_each_flipped_bit_is_one_event(store, events):
+    store.patch('L1', {'status': 'on', 'online': True})
+    store.patch('L2', {'mode': 'manual'})
+    store.patch('L2', {'mode': 'manual'})
+
+    assert sorted(logged(events)) == [('L1', 'Turned on'), ('L1', 'Went online'), ('L2', 'Mode → manual')]
+
+
+def test_new_lights_have_no_events(store, events):
+    store.patch('L3', {'status': 'on'})
+
+    assert logged(events) == []
+
+
+def test_optimistic_write_is_logged_when_the_database_confirms(store, events):
+    store.apply_optimistic({'L1': {'status': 'on'}})
+    assert logged(events) == []
+
+    store.apply_event('patch', '/L1', {'status': 'on'})
+    assert logged(events) == [('L1', 'Turned on')]
+
+
+def test_optimistic_write_settled_by_a_reload_is_logged(backend, store, events):
+    store.apply_optimistic({'L1': {'status': 'on'}})
+    tree = backend.get('streetlights')
+    tree['L1']['status'] = 'on'
+    store.load(tree)
+
+    assert logged(events) == [('L1', 'Turned on')]
+
+
+def test_rejected_optimistic_write_is_not_logged(store, events):
+    store.apply_optimistic({'L1': {'status': 'on'}})
+    store.apply_event('put', '/L1/status', 'off')
+    store.patch('L2', {'status': 'on'})
+
+    assert logged(events) == [('L2', 'Turned on')]
+
+
+def test_query_filters_by_time_kind_and_light():
+    events = dashboard.EventLog()
+    events.append(np.array([100, 200, 300, 400]), ['a', 'b', 'a', 'c'], np.array([0, 1, 2, 0], dtype=np.uint8))
+
+    assert events.query(start_ms=200, end_ms=300).tolist() == [1, 2]
+    assert events.query(kinds=[0]).tolist() == [0, 3]
+    assert events.query(light_ids=['a']).tolist() == [0, 2]
+    assert events.query(start_ms=150, light_ids=['a']).tolist() == [2]
+    assert events.query(light_ids=['a', 'c']).tolist() == [0, 2, 3]
+    assert events.query(light_ids=['missing']).tolist() == []
+    events.append(np.array([500]), ['a'], np.array([1], dtype=np.uint8))
+    assert events.query(light_ids=['a']).tolist() == [0, 2, 4]
+
+
+def test_time_never_goes_backwards():
+    events = dashboard.EventLog()
+    events.append(np.array([500]), ['a'], np.array([0], dtype=np.uint8))
+    events.append(np.array([400]), ['a'], np.array([1], dtype=np.uint8))
+
+    assert events.time[:events.size].tolist() == [500, 500]
+
+
+def test_full_log_drops_the_oldest_half():
+    events = dashboard.EventLog(max_events=10)
+    for i in range(12):
+        events.append(np.array([i]), [f"L{i}"], np.array([0], dtype=np.uint8))
+
+    assert events.size <= 10
+    assert events.dropped == 12 - events.size
+    assert events.time[events.size - 1] == 11
+
+
+def test_flush_and_reload_round_trip(tmp_path):
+    now = int(time.time() * 1000)
+    times = np.array([now - DAY_MS - 5, now - DAY_MS, now - 1, now])
+    events = dashboard.EventLog(tmp_path)
+    events.append(times[:2], ['a', 'b'], np.array([0, 3], dtype=np.uint8))
+    assert events.flush() == 2
+    events.append(times[2:], ['b', 'c'], np.array([9, 4], dtype=np.uint8))
+    assert events.flush() == 2
+    assert events.flush() == 0
+
+    reloaded = dashboard.EventLog(tmp_path, load_days=3)
+    assert reloaded.size == 4
+    assert reloaded.time[:4].tolist() == times.tolist()
+    assert logged(reloaded) == logged(events)
+    assert reloaded.flush() == 0
+    assert len(list(tmp_path.glob('date=*'))) >= 2
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+import streamlit_dashboard as dashboard
+
+
+def make_fleet(size, seed=0):
+    rnd = random.Random(seed)
+    return {f"light_{i:04d}": {
+        'status': rnd.choice(['on', 'off']),
+        'mode': rnd.choice(['automatic', 'manual']),
+        'isDark': rnd.random() < 0.5,
+        'motionDetected': rnd.random() < 0.2,
+        'online': rnd.random() < 0.9,
+        'lastUpdate': '2026-01-01T00:00:00',
+        'timestamp': 1767225600000,
+    } for i in range(size)}
+
+
+@pytest.fixture
+def store():
+    store = dashboard.FleetStore()
+    store.load(make_fleet(50))
+    return store
+
+
+@pytest.fixture
+def changes(store):
+    changes = []
+    store.subscribe(lambda _, change: changes.append(change))
+    return changes
+
+
+def test_patch_reports_row_and_previous_state(store, changes):
+    row = store.row_of('light_0003')
+    before = store.state([row])[0]
+    store.patch('light_0003', {'status': 'on' if before['status'] == 0 else 'off'})
+
+    change, = changes
+    assert change.origin == 'event'
+    assert change.rows.tolist() == [row]
+    assert change.ids.tolist() == ['light_0003']
+    assert change.known.tolist() == [True]
+    assert change.before[0] == before
+    assert (store.flags[row] & dashboard.FLAG_ON != 0) == (before['flags'] & dashboard.FLAG_ON == 0)
+
+
+def test_patch_of_new_light_is_not_known(store, changes):
+    store.patch('light_new', {'status': 'on'})
+
+    change, = changes
+    assert change.known.tolist() == [False]
+    assert store.size == 51
+    assert store.frame()['ID'].iloc[-1] == 'light_new'
+
+
+def test_remove_reports_state_and_keeps_rows_dense(store, changes):
+    state = store.state([store.row_of('light_0000')])[0]
+    store.remove('light_0000')
+
+    change, = changes
+    assert len(change.rows) == 0
+    assert change.removed == [('light_0000', state)]
+    assert store.size == 49
+    assert sorted(store.index.values()) == list(range(49))
+    assert all(store.ids[row] == light_id for light_id, row in store.index.items())
+
+
+def test_reload_reports_only_changed_and_removed_lights(store, changes):
+    fleet = make_fleet(50)
+    del fleet['light_0010']
+    fleet['light_0020']['status'] = 'on' if fleet['light_0020']['status'] == 'off' else 'off'
+    fleet['light_0099'] = dict(fleet['light_0001'])
+    store.load(fleet)
+
+    change, = changes
+    assert change.origin == 'load'
+    assert sorted(change.ids.tolist()) == ['light_0020', 'light_0099']
+    assert dict(zip(change.ids.tolist(), change.known.tolist())) == {'light_0020': True, 'light_0099': False}
+    assert [light_id for light_id, _ in change.removed] == ['light_0010']
+
+
+def test_optimistic_write_is_flagged(store, changes):
+    store.apply_optimistic({'light_0001': {'mode': 'manual'}, 'light_missing': {'mode': 'manual'}})
+
+    change, = changes
+    assert change.origin == 'optimistic'
+    assert change.ids.tolist() == ['light_0001']
+    assert store.is_optimistic('light_0001')
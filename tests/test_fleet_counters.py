@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+import streamlit_dashboard as dashboard
+
+
+def make_fleet(size, seed=0):
+    rnd = random.Random(seed)
+    return {f"light_{i:04d}": {
+        'status': rnd.choice(['on', 'off']),
+        'mode': rnd.choice(['automatic', 'manual']),
+        'isDark': rnd.random() < 0.5,
+        'motionDetected': rnd.random() < 0.2,
+        'online': rnd.random() < 0.9,
+        'lastUpdate': '2026-01-01T00:00:00',
+        'timestamp': 1767225600000,
+    } for i in range(size)}
+
+
+def mask_counts(df):
+    """Counts the way the dashboard computed them before FleetCounters"""
+    return {
+        'total': len(df),
+        'on': int((df['Status'] == 'on').sum()),
+        'online': int((df['Online'] == True).sum()),
+        'dark': int((df['Is Dark'] == True).sum()),
+        'motion': int((df['Motion Detected'] == True).sum()),
+        'automatic': int((df['Mode'] == 'automatic').sum()),
+        'energy_efficient': int(((df['Status'] == 'off') & (df['Is Dark'] == False)).sum()),
+    }
+
+
+def test_counters_match_masks_under_random_changes():
+    fleet = make_fleet(2000, seed=3)
+    store = dashboard.FleetStore()
+    store.load(fleet)
+    counters = dashboard.FleetCounters()
+    counters.reset(store)
+    store.subscribe(counters.observe)
+    assert counters.snapshot() == mask_counts(store.frame()) == dashboard.count_fleet(store.frame())
+
+    rnd = random.Random(1)
+    ids = list(fleet)
+    fields = ['status', 'mode', 'isDark', 'online', 'motionDetected']
+    values = ['on', 'off', 'manual', 'automatic', True, False, 'weird']
+    for step in range(3000):
+        op, light_id = rnd.random(), rnd.choice(ids)
+        if op < 0.6:
+            store.patch(light_id, {rnd.choice(fields): rnd.choice(values)})
+        elif op < 0.7:
+            store.remove(light_id)
+        elif op < 0.8:
+            store.apply_optimistic({light_id: {'status': rnd.choice(['on', 'off'])}})
+        elif op < 0.81:
+            store.load({light_id: fleet[light_id] for light_id in ids[:500]})
+        else:
+            store.patch(f'new_{step}', {'status': 'on'})
+        if step % 100 == 0:
+            assert counters.snapshot() == mask_counts(store.frame())
+
+    df = store.frame()
+    assert counters.snapshot() == mask_counts(df) == dashboard.count_fleet(df)
+    assert np.array_equal(counters.cube_snapshot(), np.bincount(store.flags[:store.size], minlength=32))
@@ -0,0 +1,87 @@
+import pytest
+
+import streamlit_dashboard as dashboard
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return dashboard.CommandJournal(tmp_path / "journal.db")
+
+
+def test_journal_compacts_to_latest_value(journal):
+    journal.append({'light_1': {'status': 'on', 'commandId': 'x'}, 'light_2': {'mode': 'manual'}})
+    journal.append({'light_1': {'status': 'off'}})
+    journal.append({'light_1': {'mode': 'automatic'}})
+
+    batch, last_seq = journal.compacted()
+    assert batch == {'light_1': {'status': 'off', 'mode': 'automatic'}, 'light_2': {'mode': 'manual'}}
+    assert last_seq == journal.entries == 4
+    assert journal.backlog_lights == 2
+
+
+def test_journal_batches_oldest_lights_first(journal):
+    for light_id in ('c', 'a', 'b'):
+        journal.append({light_id: {'status': 'on'}})
+    journal.append({'c': {'status': 'off'}})
+
+    batch, last_seq = journal.compacted(limit=2)
+    assert list(batch) == ['c', 'a']
+    assert batch['c'] == {'status': 'off'}
+    assert last_seq == 4
+
+
+def test_journal_discard_drops_superseded_values(journal):
+    journal.append({'light_1': {'status': 'on', 'mode': 'manual'}})
+    journal.discard({'light_1': {'status': 'off', 'commandTs': 1}})
+
+    batch, _ = journal.compacted()
+    assert batch == {'light_1': {'mode': 'manual'}}
+    assert journal.entries == 1
+
+
+def status(backend, light_id):
+    return backend.get(f'streetlights/{light_id}/status')
+
+
+def test_skipped_command_drops_the_journaled_one_it_replaces(backend, writer, store, journal):
+    queue = dashboard.CommandQueue(writer, window=0.01, on_applied=store.apply_optimistic, snapshot=store,
+                                   journal=journal)
+    backend.error = ConnectionError("offline")
+    on = queue.submit('L1', {'status': 'on'})
+    assert on.wait(2) and on.status == 'journaled'
+    assert journal.backlog_lights == 1
+
+    # The snapshot still shows 'off', so the newer command is skipped...
+    off = queue.submit('L1', {'status': 'off'})
+    assert off.elided
+    # ...and must not leave the older one to be replayed over it
+    backend.error = None
+    assert journal.replay(writer) == 0
+    assert journal.entries == 0
+    assert status(backend, 'L1') == 'off'
+
+
+def test_skipped_bulk_write_drops_journaled_values(backend, writer, store, journal):
+    backend.error = ConnectionError("offline")
+    results = dashboard.bulk_update_lights({'L1': {'mode': 'manual'}, 'L2': {'mode': 'manual'}}, writer=writer,
+                                           snapshot=store, journal=journal)
+    assert sorted(results.journaled) == ['L1', 'L2']
+
+    backend.error = None
+    results = dashboard.bulk_update_lights({'L1': {'mode': 'automatic'}}, writer=writer, snapshot=store,
+                                           journal=journal)
+    assert results.elided == ['L1']
+    assert journal.compacted()[0] == {'L2': {'mode': 'manual'}}
+    assert journal.replay(writer) == 1
+    assert backend.get('streetlights/L1/mode') == 'automatic'
+    assert backend.get('streetlights/L2/mode') == 'manual'
+
+
+def test_replay_sends_the_latest_journaled_value(backend, writer, journal):
+    journal.append({'L1': {'status': 'on'}})
+    journal.append({'L1': {'status': 'off'}, 'L2': {'status': 'on'}})
+
+    assert journal.replay(writer) == 2
+    assert journal.entries == 0
+    assert (status(backend, 'L1'), status(backend, 'L2')) == ('off', 'on')
+    assert journal.replayed == 2
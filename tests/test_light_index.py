@@ -0,0 +1,56 @@
+import streamlit_dashboard as dashboard
+
+
+def make_store(ids):
+    store = dashboard.FleetStore()
+    store.load({light_id: {'status': 'off', 'mode': 'automatic'} for light_id in ids})
+    return store
+
+
+def test_search_returns_sorted_prefix_matches_and_total():
+    index = dashboard.LightIndex(['north_10', 'south_1', 'north_2', 'north_1', 'east_1'])
+
+    assert index.search('north_') == (['north_1', 'north_10', 'north_2'], 3)
+    assert index.search('north_1') == (['north_1', 'north_10'], 2)
+    assert index.search('north_', limit=2) == (['north_1', 'north_10'], 3)
+    assert index.search('west') == ([], 0)
+
+
+def test_empty_prefix_lists_the_first_ids():
+    index = dashboard.LightIndex([f"light_{i:03d}" for i in reversed(range(100))])
+
+    assert index.search('', limit=3) == (['light_000', 'light_001', 'light_002'], 100)
+
+
+def test_store_index_follows_added_and_removed_lights():
+    store = make_store(['b', 'a'])
+    first = store.light_index()
+    assert store.light_index() is first
+
+    store.patch('c', {'status': 'on'})
+    store.remove('a')
+    assert store.light_index().search('') == (['b', 'c'], 2)
+
+
+def test_lookup_uses_the_store_row():
+    store = make_store(['a', 'b', 'c'])
+
+    assert dashboard.lookup_light(store.frame(), 'b', store)['ID'] == 'b'
+
+
+def test_lookup_falls_back_when_the_frame_is_older_than_the_store():
+    store = make_store(['a', 'b', 'c'])
+    df = store.frame()
+    # Removing 'a' moves 'c' into row 0 of the store, but not of the frame
+    store.remove('a')
+
+    assert dashboard.lookup_light(df, 'c', store)['ID'] == 'c'
+
+
+def test_lookup_of_a_light_newer_than_the_frame_is_none():
+    store = make_store(['a', 'b'])
+    df = store.frame()
+    store.patch('c', {'status': 'on'})
+
+    assert dashboard.lookup_light(df, 'c', store) is None
+    assert dashboard.lookup_light(df, 'missing', store) is None
@@ -0,0 +1,48 @@
+import numpy as np
+
+import streamlit_dashboard as dashboard
+
+
+def make_history(store, depth=3):
+    recent = dashboard.RecentHistory(depth=depth, memory_mb=1)
+    rows = np.arange(store.size)
+    recent.observe(store, dashboard.FleetChange(rows, store.ids[rows], None, None, [], 'load'))
+    store.subscribe(recent.observe)
+    return recent
+
+
+def test_only_transitions_are_kept(store):
+    recent = make_history(store)
+    store.patch('L1', {'status': 'off'})
+    store.patch('L1', {'status': 'on'})
+    store.patch('L1', {'online': True})
+
+    history = recent.recent('L1')
+    assert history['Status'].tolist() == ['off', 'on', 'on']
+    assert history['Online'].tolist() == [False, False, True]
+
+
+def test_ring_keeps_the_latest_entries_oldest_first(store):
+    recent = make_history(store)
+    for status in ('on', 'off', 'on', 'off'):
+        store.patch('L2', {'status': status})
+
+    assert recent.recent('L2')['Status'].tolist() == ['off', 'on', 'off']
+
+
+def test_removed_light_frees_its_slot(store):
+    recent = make_history(store)
+    slot = recent.slots.get('L1')
+    store.remove('L1')
+    store.patch('L3', {'status': 'on'})
+
+    assert recent.recent('L1').empty
+    assert recent.slots.get('L3') == slot
+    assert recent.recent('L3')['Status'].tolist() == ['on']
+
+
+def test_optimistic_patches_are_not_recorded(store):
+    recent = make_history(store)
+    store.apply_optimistic({'L1': {'status': 'on'}})
+
+    assert recent.recent('L1')['Status'].tolist() == ['off']
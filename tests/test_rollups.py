@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import streamlit_dashboard as dashboard
+
+HOUR_START = 1767225600.0  # 2026-01-01T00:00Z
+
+
+def make_store(lights):
+    store = dashboard.FleetStore()
+    store.load({light_id: {'status': status, 'mode': 'automatic', 'isDark': True, 'motionDetected': False,
+                           'online': True, 'lastUpdate': '', 'timestamp': 0}
+                for light_id, status in lights.items()})
+    return store
+
+
+def seed(target, store, now):
+    rows = np.arange(store.size)
+    target.observe(store, dashboard.FleetChange(rows, store.ids[rows], None, None, [], 'load'), now=now)
+
+
+def change(store, light_ids, now, target):
+    rows = np.array([store.row_of(light_id) for light_id in light_ids], dtype=np.int64)
+    target.observe(store, dashboard.FleetChange(rows, store.ids[rows], None, None, [], 'event'), now=now)
+
+
+def removal(store, light_id, now, target):
+    target.observe(store, dashboard.FleetChange(np.zeros(0, dtype=np.int64), store.ids[:0], None, None,
+                                                [(light_id, None)], 'event'), now=now)
+
+
+def test_rollups_close_minutes_and_hour():
+    store = make_store({'a': 'on', 'b': 'off'})
+    rollups = dashboard.FleetRollups(now=HOUR_START)
+    seed(rollups, store, HOUR_START)
+    store.patch('b', {'status': 'on'})
+    change(store, ['b'], HOUR_START + 1800, rollups)
+    rollups.advance(HOUR_START + 3600)
+
+    assert len(rollups.recent['1min']) == 60
+    assert len(rollups.recent['15min']) == 4
+    hour, = rollups.recent['1h']
+    assert hour['time'] == pd.Timestamp(HOUR_START, unit='s')
+    assert hour['coverage'] == 3600
+    assert hour['lights'] == 2
+    assert hour['on'] == pytest.approx(1.5)
+    assert hour['online'] == pytest.approx(2.0)
+    assert hour['on_hours'] == pytest.approx(1.5)
+    assert rollups.recent['1min'][0]['on'] == pytest.approx(1.0)
+    assert rollups.recent['1min'][-1]['on'] == pytest.approx(2.0)
+
+
+def test_rollups_count_motion_onsets_only():
+    store = make_store({'a': 'off'})
+    rollups = dashboard.FleetRollups(now=HOUR_START)
+    seed(rollups, store, HOUR_START)
+    for offset, motion in ((10, True), (20, True), (30, False), (40, True)):
+        store.patch('a', {'motionDetected': motion})
+        change(store, ['a'], HOUR_START + offset, rollups)
+    rollups.advance(HOUR_START + 60)
+
+    assert rollups.recent['1min'][0]['motion_events'] == 2
+
+
+def test_rollups_reuse_removed_lights_slots():
+    store = make_store({'a': 'on', 'b': 'on'})
+    rollups = dashboard.FleetRollups(now=HOUR_START)
+    seed(rollups, store, HOUR_START)
+    slot = rollups.slots.get('a')
+    removal(store, 'a', HOUR_START + 10, rollups)
+    store.patch('c', {'status': 'on'})
+    change(store, ['c'], HOUR_START + 20, rollups)
+
+    assert 'a' not in rollups.slots
+    assert rollups.slots.get('c') == slot
+    assert len(rollups.slots) == 2
+
+
+def test_closed_buckets_read_back_from_parquet(tmp_path):
+    store = make_store({'a': 'on', 'b': 'off'})
+    rollups = dashboard.FleetRollups(tmp_path, now=HOUR_START)
+    seed(rollups, store, HOUR_START)
+    rollups.advance(HOUR_START + 7200)
+
+    reopened = dashboard.FleetRollups(tmp_path, now=HOUR_START + 7200)
+    hours = reopened.fleet('1h', HOUR_START, HOUR_START + 7200)
+    assert hours['time'].tolist() == [pd.Timestamp(HOUR_START, unit='s'), pd.Timestamp(HOUR_START + 3600, unit='s')]
+    assert hours['on'].tolist() == pytest.approx([1.0, 1.0])
+    assert len(reopened.fleet('1min', HOUR_START, HOUR_START + 7200)) == 120
+    totals = reopened.light_totals(HOUR_START, HOUR_START + 7200).set_index('light_id')
+    assert totals.loc['a', 'on_seconds'] == pytest.approx(7200)
+    assert totals.loc['b', 'on_seconds'] == 0
+    assert totals.loc['b', 'online_seconds'] == pytest.approx(7200)
+
+
+@pytest.mark.parametrize('seconds, resolution', [(3600, '1min'), (86400, '15min'), (7 * 86400, '1h'),
+                                                 (90 * 86400, '1d')])
+def test_resolution_follows_the_range(seconds, resolution):
+    assert dashboard.pick_rollup_resolution(seconds) == resolution
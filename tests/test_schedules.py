@@ -0,0 +1,73 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+import streamlit_dashboard as dashboard
+
+
+def test_sun_times_london_midsummer():
+    sunrise, sunset = dashboard.sun_times(date(2024, 6, 21), 51.5074, -0.1278)
+
+    # Published times: 03:43 and 20:21 UTC
+    assert abs(sunrise - datetime(2024, 6, 21, 3, 43, tzinfo=timezone.utc)).total_seconds() < 180
+    assert abs(sunset - datetime(2024, 6, 21, 20, 21, tzinfo=timezone.utc)).total_seconds() < 180
+
+
+def test_sun_times_equator_equinox():
+    sunrise, sunset = dashboard.sun_times(date(2024, 3, 20), 0.0, 0.0)
+
+    assert abs((sunset - sunrise).total_seconds() / 3600 - 12.1) < 0.1
+
+
+def test_sun_times_polar_day_and_night():
+    assert dashboard.sun_times(date(2024, 6, 21), 78.22, 15.65) is None
+    assert dashboard.sun_times(date(2024, 12, 21), 78.22, 15.65) is None
+
+
+def local(*args):
+    return datetime(*args).timestamp()
+
+
+def test_fixed_time_fires_later_today_or_tomorrow():
+    schedule = {'trigger': 'time', 'time': '18:00', 'days': '0123456'}
+
+    # 2026-01-05 is a Monday
+    assert dashboard.next_fire_time(schedule, local(2026, 1, 5, 17)) == local(2026, 1, 5, 18)
+    assert dashboard.next_fire_time(schedule, local(2026, 1, 5, 18)) == local(2026, 1, 6, 18)
+
+
+def test_fixed_time_skips_other_weekdays():
+    schedule = {'trigger': 'time', 'time': '06:30', 'days': '5'}
+
+    assert dashboard.next_fire_time(schedule, local(2026, 1, 5, 12)) == local(2026, 1, 10, 6, 30)
+    assert dashboard.next_fire_time(schedule, local(2026, 1, 10, 7)) == local(2026, 1, 17, 6, 30)
+
+
+def test_sun_trigger_applies_the_offset():
+    location = (51.5074, -0.1278)
+    schedule = {'trigger': 'sunset', 'offsetMinutes': -15}
+    _, sunset = dashboard.sun_times(date(2024, 6, 21), *location)
+    after = datetime(2024, 6, 21, 12, tzinfo=timezone.utc).timestamp()
+
+    assert dashboard.next_fire_time(schedule, after, location) == sunset.timestamp() - 15 * 60
+
+
+def test_sun_trigger_without_a_sunset_never_fires():
+    after = datetime(2024, 6, 21, 12, tzinfo=timezone.utc).timestamp()
+
+    assert dashboard.next_fire_time({'trigger': 'sunset'}, after, (78.22, 15.65)) is None
+    assert dashboard.next_fire_time({'trigger': 'sunrise'}, after) is None
+
+
+def test_schedule_without_days_is_rejected():
+    schedule = {'trigger': 'time', 'time': '18:00', 'days': '', 'mode': 'manual',
+                'target': {'type': 'pattern', 'value': '*'}}
+
+    with pytest.raises(ValueError, match="at least one day"):
+        dashboard.save_schedule('evening', schedule)
+
+
+def test_describe_schedule():
+    assert dashboard.describe_schedule({'trigger': 'time', 'time': '18:00'}) == "at 18:00"
+    assert dashboard.describe_schedule({'trigger': 'sunset', 'offsetMinutes': -15, 'days': '56'}) == \
+        "sunset -15 min on Sat, Sun"